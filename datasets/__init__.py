@@ -4,9 +4,13 @@
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 import re
-import spacy
+import bisect
+import json
+import hashlib
+import functools
 import tflearn
 import collections
+import multiprocessing
 import numpy as np
 import progressbar
 
@@ -30,29 +34,97 @@ test_split_small = 0.2
 data_root_directory = os.path.join('/', 'scratch', 'OSA', 'data', 'datasets')
 
 
-spacy_nlp = None
-spacy_nlp_de = None
+# Name of the spaCy model used for each language
+spacy_models = {'en': 'en_core_web_md', 'de': 'de_core_news_md'}
 
-def get_spacy(lang='en'):
+# Pipeline components that are disabled for each of the ways `get_spacy` can
+# load a model. The tokenizer and the word vectors are always available, so
+# 'tokenizer' and 'vectors' only differ in what the caller is going to use.
+spacy_disabled_components = {
+    'tokenizer': ['tagger', 'parser', 'ner'],
+    'vectors':   ['tagger', 'parser', 'ner'],
+    'ner':       ['tagger', 'parser'],
+    'parser':    ['tagger', 'ner'],
+    'all':       []
+}
+
+# Keyword arguments that leave each component out of a spaCy 1.x model,
+# which ignores `disable`
+spacy_v1_overrides = {'tagger': 'tagger', 'parser': 'parser', 'ner': 'entity'}
+
+# Pipelines loaded so far, indexed by (lang, components)
+spacy_pipelines = {}
+
+# Named Entities already found by `mark_entities` (see `get_entity_cache`)
+entity_cache = None
+
+def get_spacy(lang='en', components='all'):
     """
-    Returns the spaCy pipeline for the specified language.
+    Returns the spaCy pipeline for the specified language. The pipeline is
+    only loaded the first time it is requested, and only with the components
+    in `components`. Requests for 'tokenizer' or 'vectors' reuse any pipeline
+    already loaded for `lang`, as they don't run the pipeline components.
 
     Keyword arguments:
-    lang -- the language whose pipeline will be returned.
+    lang       -- the language whose pipeline will be returned.
+    components -- Possible values are 'tokenizer', 'vectors', 'ner', 'parser'
+                  and 'all'.
     """
-    global spacy_nlp
-    global spacy_nlp_de
+    if components not in spacy_disabled_components:
+        raise ValueError('Invalid components {}. Possible values are '
+                         '{}'.format(components,
+                                     sorted(spacy_disabled_components)))
+    lang = 'en' if lang == 'en' else 'de'
+
+    key = (lang, components)
+    if key in spacy_pipelines:
+        return spacy_pipelines[key]
+
+    if components in ['tokenizer', 'vectors']:
+        for (loaded_lang, _), nlp in spacy_pipelines.items():
+            if loaded_lang == lang:
+                spacy_pipelines[key] = nlp
+                return nlp
+
+    # Imported here so that processes that never tokenize with spaCy don't
+    # pay for it
+    import spacy
+    disabled = spacy_disabled_components[components]
+    # TODO: support other spaCy English models
+    if spacy_major_version() < 2:
+        spacy_pipelines[key] = spacy.load(spacy_models[lang],
+                **{spacy_v1_overrides[name]: False for name in disabled})
+    else:
+        spacy_pipelines[key] = spacy.load(spacy_models[lang],
+                                          disable=disabled)
+    return spacy_pipelines[key]
 
-    if spacy_nlp is None:
-        # TODO: support other spaCy English models
-        spacy_nlp = spacy.load('en_core_web_md')
-    if spacy_nlp_de is None:
-        spacy_nlp_de = spacy.load('de_core_news_md')
 
-    return spacy_nlp if lang == 'en' else spacy_nlp_de
+def spacy_major_version():
+    import spacy
+    return int(spacy.about.__version__.split('.')[0])
 
-spacy_tokenizer = get_spacy(lang='en').tokenizer
-spacy_tokenizer_de = get_spacy(lang='de').tokenizer
+
+def spacy_pipe_names(nlp):
+    """
+    Returns the names of the components ('tagger', 'parser', 'ner') that
+    the spaCy pipeline `nlp` runs, for spaCy 1.x and later versions.
+    """
+    if hasattr(nlp, 'pipe_names'):
+        return list(nlp.pipe_names)
+    components = [('tagger', nlp.tagger), ('parser', nlp.parser),
+                  ('ner', nlp.entity)]
+    return [name for name, component in components
+            if component is not None and
+            any(component is step for step in nlp.pipeline)]
+
+
+def get_spacy_tokenizer(lang='en'):
+    """
+    Returns the spaCy tokenizer for the specified language. Only the
+    tokenizer of the pipeline is loaded.
+    """
+    return get_spacy(lang, components='tokenizer').tokenizer
 
 
 def pad_sentences(data, pad=0, raw=False):
@@ -221,50 +293,341 @@ def append_seq_markers(data, seq_begin=True, seq_end=True):
     return data_
 
 
+def encode_tokens(tokens, w2i):
+    """
+    Returns an int32 array with the ID of each term in `tokens`, using the ID
+    of 'UNK' for the terms that are not in `w2i`. `w2i` can either be a
+    `datasets.vocabulary.Word2Index` view or a plain dict.
+    """
+    if hasattr(w2i, 'encode'):
+        return w2i.encode(tokens)
+    unk = w2i['UNK']
+    return np.fromiter((w2i.get(term, unk) for term in tokens),
+                       dtype=np.int32, count=len(tokens))
+
+
+def encode_batch(token_lists, vocab, pad=0, seq_begin=False, seq_end=False,
+                 out=None):
+    """
+    `token_lists` is a list of sequences. Each sequence is a list of words.
+    This function does what `seq2id` followed by `padseq` do, in one pass:
+    returns an int32 matrix with one row of IDs per sequence (with the
+    'SEQ_BEGIN'/'SEQ_END' IDs, if requested), padded with 0 or truncated to
+    `pad` columns, and an int32 array with the number of IDs in each row
+    before padding.
+
+    Keyword arguments:
+    pad       -- Number of columns. If 0, the longest sequence decides.
+    seq_begin -- If True, insert the ID corresponding to 'SEQ_BEGIN' in the
+                 beginning of each sequence
+    seq_end   -- If True, insert the ID corresponding to 'SEQ_END' in the end
+                 of each sequence
+    out       -- Optional int32 matrix with at least `len(token_lists)` rows
+                 and exactly `pad` columns. If given, the IDs are written to
+                 it (and a view of it is returned) instead of allocating a
+                 new matrix. Reuse it only when the previous batch is no
+                 longer needed.
+    """
+    # All the tokens of the batch are looked up in a single call
+    flat_ids = encode_tokens([term for tokens in token_lists
+                              for term in tokens], vocab)
+    ends = np.cumsum([len(tokens) for tokens in token_lists], dtype=np.int64)
+    starts = ends - [len(tokens) for tokens in token_lists]
+    return pad_ragged(flat_ids, starts, ends, pad,
+                      vocab['SEQ_BEGIN'] if seq_begin else None,
+                      vocab['SEQ_END'] if seq_end else None, out)
+
+
+def pad_ragged(ids, starts, ends, pad=0, begin_id=None, end_id=None,
+               out=None):
+    """
+    Gathers the sequences `ids[starts[i]:ends[i]]` into the rows of an int32
+    matrix with `pad` columns (by default, as many as the longest row needs),
+    adding `begin_id`/`end_id` to each row if they are not None. Rows are
+    padded with 0 or truncated at the end, like `padseq` does. Returns the
+    matrix and an int32 array with the number of IDs in each row before
+    padding. See `encode_batch` for `out`.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    n_tokens = np.asarray(ends, dtype=np.int64) - starts
+    n_begin = int(begin_id is not None)
+    if pad == 0:
+        pad = int(n_tokens.max()) if len(n_tokens) > 0 else 0
+        pad += n_begin + int(end_id is not None)
+
+    if out is None:
+        padded = np.zeros((len(starts), pad), dtype=np.int32)
+    else:
+        padded = out[:len(starts)]
+        padded.fill(0)
+
+    n_taken = np.clip(n_tokens, 0, max(0, pad - n_begin))
+    columns = np.arange(max(0, pad - n_begin))
+    taken = columns[None, :] < n_taken[:, None]
+    padded[:, n_begin:][taken] = ids[(starts[:, None] + columns)[taken]]
+
+    lengths = n_taken + n_begin
+    if begin_id is not None and pad > 0:
+        padded[:, 0] = begin_id
+    if end_id is not None:
+        fits = lengths < pad
+        padded[np.nonzero(fits)[0], lengths[fits]] = end_id
+        lengths += fits
+    return padded, lengths.astype(np.int32)
+
+
+def ragged_arrays(sequences, w2i):
+    """
+    Returns the IDs of the words of all `sequences`, one after the other,
+    and the offsets at which each sequence starts (plus the end).
+    """
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in sequences])
+    tokens = encode_tokens([t for s in sequences for t in s], w2i)
+    return tokens.astype(np.int32), offsets
+
+
+def encode_sequences(data, w2i, pad=0, raw=False, seq_begin=False,
+                     seq_end=False):
+    """
+    Converts the list of sequences of words `data` into what the `next_batch`
+    methods return:
+
+     * if `raw`, lists of words with the sequence markers, padded with 'PAD'
+     * if `pad` is 0, lists of IDs of different lengths (see `seq2id`)
+     * else, an int32 matrix with `pad` columns (see `encode_batch`)
+    """
+    if raw:
+        return padseq(append_seq_markers(data, seq_begin, seq_end), pad, raw)
+    if pad == 0:
+        return seq2id(data, w2i, seq_begin, seq_end)
+    return encode_batch(data, w2i, pad, seq_begin, seq_end)[0]
+
+
+def encode_documents(documents, w2i, pad=0, sentence_pad=0, raw=False,
+                     seq_begin=False, seq_end=False):
+    """
+    `documents` is a list of documents. Each document is a list of sentences
+    (see `sentence_tokenizer`). Each sentence is encoded as in
+    `encode_sequences`, and each document is padded to `sentence_pad`
+    sentences (see `pad_sentences`). If both `pad` and `sentence_pad` are
+    given, returns an int32 array of shape
+    (len(documents), sentence_pad, pad) built with a single `encode_batch`.
+    """
+    if raw or pad == 0 or sentence_pad == 0:
+        documents = [encode_sequences(document, w2i, pad, raw, seq_begin,
+                                      seq_end) for document in documents]
+        if sentence_pad != 0:
+            documents = [pad_sentences(document, sentence_pad, raw)
+                         for document in documents]
+        return documents
+
+    sentences = [sentence for document in documents
+                 for sentence in document[:sentence_pad]]
+    ids, _ = encode_batch(sentences, w2i, pad, seq_begin, seq_end)
+    encoded = np.zeros((len(documents), sentence_pad, pad), dtype=np.int32)
+    start = 0
+    for i, document in enumerate(documents):
+        n_sentences = min(len(document), sentence_pad)
+        encoded[i, :n_sentences] = ids[start:start + n_sentences]
+        start += n_sentences
+    return encoded
+
+
+def get_entity_cache():
+    """
+    Returns the `EntityCache` used by `mark_entities`, creating an in-memory
+    one the first time. See `set_entity_cache`.
+    """
+    global entity_cache
+    if entity_cache is None:
+        entity_cache = EntityCache()
+    return entity_cache
+
+
+def set_entity_cache(capacity=100000, path=None):
+    """
+    Replaces the `EntityCache` used by `mark_entities`.
+
+    Keyword arguments:
+    capacity -- Number of lines whose entities are kept in memory.
+    path -- If given, the entities are also stored on disk at `path`, so that
+            later runs do not need to tag the same lines again.
+    """
+    global entity_cache
+    if entity_cache is not None:
+        entity_cache.close()
+    entity_cache = EntityCache(capacity, path)
+    return entity_cache
+
+
+def disjoint_spans(spans):
+    """
+    Returns the (first token, last token + 1, type) `spans` sorted and
+    without overlaps. Of the spans that overlap, the one that starts first
+    is kept, or the longest one if they start at the same token.
+    """
+    disjoint, end = [], 0
+    for span in sorted(spans, key=lambda span: (span[0], -span[1])):
+        if span[0] >= end:
+            disjoint.append(span)
+            end = span[1]
+    return disjoint
+
+
+def entity_spans(data, lang='en', batch_size=1000):
+    """
+    `data` is a list of lists of tokens. Returns, for each list of tokens,
+    a list with a (first token, last token + 1, type) tuple for each Named
+    Entity in it. The spans do not overlap: an entity that ends in the
+    middle of a token would share that token with the next one, so only the
+    first of them is kept (see `disjoint_spans`).
+
+    The lines that are not in the entity cache (see `get_entity_cache`) are
+    joined with spaces and tagged in one `nlp.pipe` call, and the character
+    offsets of the entities are mapped back to token offsets.
+    """
+    cache = get_entity_cache()
+    spans = [cache.get(lang, line) for line in data]
+    # Entries cached before the overlaps were resolved may still have them
+    spans = [None if line_spans is None else disjoint_spans(line_spans)
+             for line_spans in spans]
+    missing = [i for i, line_spans in enumerate(spans) if line_spans is None]
+    if len(missing) == 0:
+        return spans
+
+    spacy_nlp = get_spacy(lang, components='ner')
+    texts = (' '.join(data[i]) for i in missing)
+    for i, doc in zip(missing, spacy_nlp.pipe(texts, batch_size=batch_size)):
+        starts, position = [], 0
+        for token in data[i]:
+            starts.append(position)
+            position += len(token) + 1
+        spans[i] = disjoint_spans(
+                [(bisect.bisect_right(starts, ent.start_char) - 1,
+                  bisect.bisect_right(starts, ent.end_char - 1),
+                  ent.label_) for ent in doc.ents])
+        cache.put(lang, data[i], spans[i])
+    return spans
+
+
 def mark_entities(data, lang='en'):
     """
-    `data` is a list of text lines. Each text line is a string composed of one
-    or more words. For example:
+    `data` is a list of lines. Each line is a list of tokens. For example:
 
-    [['the dog chased the cat' ],
-     ['the boy kicked the girl'],
-     ['John kissed Mary']]
+    [['the', 'dog', 'chased', 'the', 'cat'],
+     ['the', 'boy', 'kicked', 'the', 'girl'],
+     ['John', 'kissed', 'Mary']]
 
-    The function uses the spaCy pipeline in each line of text, finds Named
-    Entities, and tags them with their type. For example, for the example above,
-    the output will be:
+    The function uses the spaCy pipeline in each line, finds Named Entities,
+    and tags them with their type. For example, for the example above, the
+    output will be:
 
-    [['the dog chased the cat' ],
-     ['the boy kicked the girl'],
-     ['BOE John PERSON EOE kissed BOE Mary PERSON EOE']]
+    [['the', 'dog', 'chased', 'the', 'cat'],
+     ['the', 'boy', 'kicked', 'the', 'girl'],
+     ['BOE', 'John', 'PERSON', 'EOE', 'kissed', 'BOE', 'Mary', 'PERSON',
+      'EOE']]
 
     where:
     BOE indicates the beginning of an Entity
     PERSON indicates the type of the Entity
-    EOE indicates the beginning of an Entity
+    EOE indicates the end of an Entity
+
+    An Entity of several tokens is marked once, e.g.
+    'BOE New York GPE EOE'. The Entities of each line are only searched for
+    once (see `entity_spans`).
 
     Keyword arguments:
     lang -- The language in which the sentences are (used to choose which spaCy
             pipeline to call).
     """
     marked_data = []
-    spacy_nlp = get_spacy()
-    for line in data:
-        marked_line = []
-        for token in line:
-            tok = spacy_nlp(token, lang)[0]
-            if tok.ent_type_ != '':
-                marked_line.append('BOE')
-                marked_line.append(token)
-                marked_line.append(tok.ent_type_)
-                marked_line.append('EOE')
-            else:
-                marked_line.append(token)
+    for line, spans in zip(data, entity_spans(data, lang)):
+        line = list(line)
+        marked_line, position = [], 0
+        for start, end, label in spans:
+            marked_line += line[position:start]
+            marked_line += ['BOE'] + line[start:end] + [label, 'EOE']
+            position = end
+        marked_line += line[position:]
         marked_data.append(marked_line)
     return marked_data
 
 
-def sentence_tokenizer(line):
+def mark_document_entities(documents, lang='en'):
+    """
+    `documents` is a list of documents, each a list of sentences (lists of
+    tokens) as produced by `sentence_tokenizer`. Returns the documents with
+    their Named Entities marked as `mark_entities` does, tagging the
+    sentences of all the documents together.
+    """
+    marked = mark_entities([sentence for document in documents
+                            for sentence in document], lang)
+    marked_documents, start = [], 0
+    for document in documents:
+        marked_documents.append(marked[start:start + len(document)])
+        start += len(document)
+    return marked_documents
+
+
+# Tokens that end a sentence for the 'rules' sentence splitter. spaCy's
+# tokenizer keeps abbreviations such as 'Mr.' or 'e.g.' in a single token,
+# so they do not end sentences.
+sentence_terminators = re.compile(r'^[.!?\u2026]+$')
+
+# Tokens that stay in the sentence that they follow, e.g. a closing quote
+sentence_closers = {'"', "'", "''", ')', ']', '}', '\u00bb', '\u201d',
+                    '\u2019'}
+
+
+def rule_sentence_bounds(doc):
+    """
+    Returns a (first token, last token + 1) tuple for each sentence in the
+    spaCy `doc`, splitting after sentence-final punctuation (see
+    `sentence_terminators` and `sentence_closers`).
+    """
+    bounds, start, i = [], 0, 0
+    while i < len(doc):
+        i += 1
+        if sentence_terminators.match(doc[i - 1].text):
+            while i < len(doc) and \
+                    (doc[i].text in sentence_closers or
+                     sentence_terminators.match(doc[i].text)):
+                i += 1
+            bounds.append((start, i))
+            start = i
+    if start < len(doc):
+        bounds.append((start, len(doc)))
+    return bounds
+
+
+def split_sentences(lines, sentence_splitter='parser', lang='en',
+                    batch_size=1000):
+    """
+    Yields a (doc, bounds) tuple for each line in `lines`, where `doc` is the
+    spaCy Doc of the line and `bounds` has a (first token, last token + 1)
+    tuple for each of its sentences.
+
+    Keyword arguments:
+    sentence_splitter -- 'parser' uses the sentences found by the dependency
+                         parser of the full spaCy pipeline. 'rules' only runs
+                         the tokenizer and splits after sentence-final
+                         punctuation (see `rule_sentence_bounds`), which is
+                         much faster.
+    """
+    if sentence_splitter == 'parser':
+        for doc in get_spacy(lang).pipe(lines, batch_size=batch_size):
+            yield doc, [(sent.start, sent.end) for sent in doc.sents]
+    elif sentence_splitter == 'rules':
+        for doc in get_spacy_tokenizer(lang).pipe(lines,
+                                                  batch_size=batch_size):
+            yield doc, rule_sentence_bounds(doc)
+    else:
+        raise ValueError('sentence_splitter has to be \'parser\' or '
+                         '\'rules\'. {} was given'.format(sentence_splitter))
+
+
+def sentence_tokenizer(line, sentence_splitter='parser', lang='en'):
     """
     `line` is a string containing potentially multiple sentences. For each
     sentence, this function produces a list of tokens. The output of this
@@ -274,20 +637,72 @@ def sentence_tokenizer(line):
     'I ate chocolate. She ate cake.'
 
     This function produces:
-    [['I',   'ate', 'chocolate'],
-     ['She', 'ate', 'cake']]
-    """
-    sentences = []
-    doc = get_spacy()(line)
-    for sent in doc.sents:
-        sentence_tokens = []
-        for token in sent:
-            if token.ent_type_ == '':
-                sentence_tokens.append(token.text.lower())
-            else:
-                sentence_tokens.append(token.text)
-        sentences.append(sentence_tokens)
-    return sentences
+    [['i',   'ate', 'chocolate', '.'],
+     ['she', 'ate', 'cake', '.']]
+
+    Keyword arguments:
+    sentence_splitter -- How sentences are found (see `split_sentences`).
+    lang -- The language of `line`.
+    """
+    return sentence_tokenizer_batch([line], sentence_splitter, lang)[0]
+
+
+def sentence_tokenizer_batch(lines, sentence_splitter='parser', lang='en',
+                             batch_size=1000):
+    """
+    Returns `sentence_tokenizer` applied to each string in `lines`, running
+    spaCy over all of them in one `pipe` call.
+    """
+    return [[spacy_doc_tokens(doc[start:end], lang) for start, end in bounds]
+            for doc, bounds in split_sentences(lines, sentence_splitter,
+                                               lang, batch_size)]
+
+
+def sentence_splitter_agreement(lines, sentence_splitter='rules', lang='en',
+                                batch_size=1000):
+    """
+    Compares the sentences found in `lines` by `sentence_splitter` with the
+    ones found by the parser. Returns a dict with:
+
+     * 'lines': the number of lines compared
+     * 'exact': the fraction of lines split exactly as the parser splits them
+     * 'sentences' and 'parser_sentences': the number of sentences found by
+       each of them
+     * 'precision', 'recall' and 'f1' of the sentence boundaries found by
+       `sentence_splitter`, taking the ones found by the parser as correct.
+       A boundary is the character offset at which a sentence, other than
+       the last one of its line, ends.
+    """
+    def boundaries(doc, bounds):
+        return {doc[end - 1].idx + len(doc[end - 1].text)
+                for start, end in bounds[:-1]}
+
+    n_lines, n_exact, n_sentences, n_parser_sentences = 0, 0, 0, 0
+    n_found, n_expected, n_correct = 0, 0, 0
+    for (doc, bounds), (parser_doc, parser_bounds) in zip(
+            split_sentences(lines, sentence_splitter, lang, batch_size),
+            split_sentences(lines, 'parser', lang, batch_size)):
+        found = boundaries(doc, bounds)
+        expected = boundaries(parser_doc, parser_bounds)
+        n_lines += 1
+        n_exact += found == expected
+        n_sentences += len(bounds)
+        n_parser_sentences += len(parser_bounds)
+        n_found += len(found)
+        n_expected += len(expected)
+        n_correct += len(found & expected)
+
+    precision = n_correct / n_found if n_found > 0 else 1.0
+    recall = n_correct / n_expected if n_expected > 0 else 1.0
+    return {'lines': n_lines,
+            'exact': n_exact / n_lines if n_lines > 0 else 1.0,
+            'sentences': n_sentences,
+            'parser_sentences': n_parser_sentences,
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall)
+                  if precision + recall > 0 else 0.0}
+
 
 def default_tokenize(sentence):
     """
@@ -296,6 +711,25 @@ def default_tokenize(sentence):
     return [i for i in re.split(r"([-.\"',:? !\$#@~()*&\^%;\[\]/\\\+<>\n=])",
                                 sentence) if i!='' and i!=' ' and i!='\n']
 
+def spacy_doc_tokens(doc, lang='en'):
+    """
+    Returns a list of strings containing each token in the spaCy `doc`.
+    English tokens that are not entities are downcased.
+    """
+    tokens = []
+    for token in doc:
+        if token.ent_type_ == '':
+            if lang == 'en':
+                text = token.text.lower()
+            else:
+                # German is case sensitive
+                text = token.text
+            tokens.append(text)
+        else:
+            tokens.append(token.text)
+    return tokens
+
+
 def tokenize(line, tokenizer='spacy', lang='en'):
     """
     Returns a list of strings containing each token in `line`.
@@ -306,22 +740,8 @@ def tokenize(line, tokenizer='spacy', lang='en'):
     """
     tokens = []
     if tokenizer == 'spacy':
-        if lang == 'en':
-            doc = spacy_tokenizer(line)
-        elif lang == 'de':
-            doc = spacy_tokenizer_de(line)
-        else:
-            doc = spacy_tokenizer(line)
-        for token in doc:
-            if token.ent_type_ == '':
-                if lang == 'en':
-                    text = token.text.lower()
-                else:
-                    # German is case sensitive
-                    text = token.text
-                tokens.append(text)
-            else:
-                tokens.append(token.text)
+        doc = get_spacy_tokenizer('de' if lang == 'de' else 'en')(line)
+        tokens = spacy_doc_tokens(doc, lang)
     elif tokenizer == 'nltk':
         tokens = nltk_tokenizer(line)
     elif tokenizer == 'split':
@@ -331,26 +751,220 @@ def tokenize(line, tokenizer='spacy', lang='en'):
     return tokens
 
 
+def tokenize_batch(lines, tokenizer='spacy', lang='en', n_process=1,
+                   batch_size=1000):
+    """
+    Returns a list with the tokens of each string in `lines`. The tokens are
+    the same that `tokenize` returns for each line, but spaCy processes all
+    the lines in a single stream.
+
+    Keyword arguments:
+    tokenizer  -- Possible values are 'spacy', 'nltk', 'split' and 'other'.
+    lang       -- Possible values are 'en' and 'de'
+    n_process  -- Number of processes that tokenize the lines with spaCy,
+                  each a consecutive chunk of them. Only worth it for many
+                  thousands of lines, as the processes are forked for each
+                  call.
+    batch_size -- Number of lines that spaCy processes at a time.
+    """
+    if tokenizer != 'spacy':
+        return [tokenize(line, tokenizer, lang) for line in lines]
+
+    spacy_lang = 'de' if lang == 'de' else 'en'
+    # Loaded before forking, so that the processes share it
+    spacy_tokenizer = get_spacy_tokenizer(spacy_lang)
+    if n_process > 1:
+        lines = list(lines)
+        n_process = min(n_process, len(lines))
+    if n_process > 1:
+        # spaCy 1.x (the pinned version) has no `n_process` in `pipe`, so
+        # the lines are split among a pool as in `vocabulary_builder`
+        bounds = [len(lines) * i // n_process for i in range(n_process + 1)]
+        with multiprocessing.get_context('fork').Pool(n_process) as pool:
+            chunks = pool.map(functools.partial(tokenize_batch,
+                                                tokenizer=tokenizer,
+                                                lang=lang,
+                                                batch_size=batch_size),
+                              [lines[start:end] for start, end
+                               in zip(bounds[:-1], bounds[1:])])
+        return [tokens for chunk in chunks for tokens in chunk]
+
+    docs = spacy_tokenizer.pipe(lines, batch_size=batch_size)
+    return [spacy_doc_tokens(doc, lang) for doc in docs]
+
+
+def byte_range_shards(path, n_shards):
+    """
+    Splits the file in `path` into `n_shards` byte ranges of (roughly) the
+    same size. Returns a list of (start, end) tuples. Each line of the file
+    belongs to the range in which it starts, so reading all the ranges with
+    `read_byte_range` gives every line exactly once.
+    """
+    size = os.path.getsize(path)
+    n_shards = max(1, min(n_shards, size))
+    bounds = [size * i // n_shards for i in range(n_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_byte_range(path, start, end):
+    """
+    Yields the lines (as strings, with the trailing '\\n') of the file in
+    `path` that start in the byte range [`start`, `end`).
+    """
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Moves to the beginning of the first line starting at or
+            # after `start`
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode('utf-8')
+
+
+def validate_shard(shard_index, num_shards):
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError('shard_index has to be between 0 and num_shards - '
+                         '1, and num_shards at least 1. Got shard_index={} '
+                         'and num_shards={}'.format(shard_index, num_shards))
+
+
+def shard_bounds(n_rows, shard_index, num_shards):
+    """
+    Returns the (first, last) rows of the shard `shard_index` of `n_rows`
+    rows split in `num_shards` contiguous shards, the way
+    `byte_range_shards` splits bytes.
+    """
+    validate_shard(shard_index, num_shards)
+    return (n_rows * shard_index // num_shards,
+            n_rows * (shard_index + 1) // num_shards)
+
+
+def shard_list(data, shard_index, num_shards):
+    """
+    Returns the items of the list `data` that belong to the shard
+    `shard_index` of `num_shards`: every `num_shards`-th item, starting at
+    `shard_index`. The shards are disjoint and together hold all of `data`.
+    """
+    validate_shard(shard_index, num_shards)
+    if num_shards == 1:
+        return data
+    return data[shard_index::num_shards]
+
+
+def merge_counter_pair(counters):
+    counters[0].update(counters[1])
+    return counters[0]
+
+
+def merge_counters(counters, pool=None):
+    """
+    Merges the `collections.Counter`s in `counters` with a tree reduction:
+    pairs of counters are merged level by level (in parallel, if a
+    `multiprocessing.Pool` is given) until only one counter is left.
+    """
+    if len(counters) == 0:
+        return collections.Counter()
+    map_function = map if pool is None else pool.map
+    while len(counters) > 1:
+        pairs = [(counters[i], counters[i + 1])
+                 for i in range(0, len(counters) - 1, 2)]
+        leftover = counters[-1:] if len(counters) % 2 == 1 else []
+        counters = list(map_function(merge_counter_pair, pairs)) + leftover
+    return counters[0]
+
+
+# The parameters of the vocabulary being built. They are set before the
+# worker processes are forked, as `line_processor` is usually a lambda and
+# cannot be sent to them.
+vocabulary_builder_job = None
+
+def count_byte_range(shard):
+    """
+    Tokenizes the lines of the byte range `shard` = (path, start, end) and
+    returns a (`collections.Counter`, number of bytes in the range) tuple.
+    """
+    path, start, end = shard
+    tokenizer, downcase, line_processor, lang = vocabulary_builder_job
+
+    cnt = collections.Counter()
+    lines = []
+    for line in read_byte_range(path, start, end):
+        line = line_processor(line)
+        if downcase:
+            line = line.lower()
+        lines.append(line)
+        if len(lines) == 1000:
+            for tokens in tokenize_batch(lines, tokenizer, lang):
+                cnt.update([_ for _ in tokens if len(_) > 0])
+            lines = []
+    for tokens in tokenize_batch(lines, tokenizer, lang):
+        cnt.update([_ for _ in tokens if len(_) > 0])
+    return cnt, end - start
+
+
 def vocabulary_builder(data_paths, min_frequency=5, tokenizer='spacy',
-                   downcase=True, max_vocab_size=None, line_processor=None, lang='en'):
+                   downcase=True, max_vocab_size=None, line_processor=None,
+                   lang='en', n_processes=None, shards_per_process=4):
+    """
+    Counts the tokens in the files `data_paths` and returns a list of
+    (token, count) tuples, sorted by count and then lexically. Each file is
+    split into `n_processes * shards_per_process` byte ranges, which are
+    counted by a pool of `n_processes` processes (by default, one per core).
+
+    Keyword arguments:
+    line_processor     -- Function that takes a line of the files and returns
+                          the text to be tokenized.
+    n_processes        -- Number of processes used. If 1, everything is done
+                          in the current process.
+    shards_per_process -- More shards than processes keep all of them busy
+                          until the end and give a smoother progress bar.
+    """
+    global vocabulary_builder_job
+
     print('Building a new vocabulary')
-    cnt = collections.Counter()
+    if line_processor is None:
+        line_processor = lambda line: line
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+
+    shards = []
     for data_path in data_paths:
-        bar = progressbar.ProgressBar(max_value=progressbar.UnknownLength,
-                                      redirect_stdout=True)
-        n_line = 0
-        for line in open(data_path, 'r'):
-            line = line_processor(line)
-            if downcase:
-                line = line.lower()
-            tokens = tokenize(line, tokenizer, lang)
-            tokens = [_ for _ in tokens if len(_) > 0]
-            cnt.update(tokens)
-            n_line += 1
-            bar.update(n_line)
-        bar.finish()
-
-    print("Found %d unique tokens in the vocabulary.", len(cnt))
+        shards += [(data_path, start, end) for start, end in
+                   byte_range_shards(data_path,
+                                     n_processes * shards_per_process)]
+    total_bytes = sum(end - start for _, start, end in shards)
+
+    vocabulary_builder_job = (tokenizer, downcase, line_processor, lang)
+    bar = progressbar.ProgressBar(max_value=total_bytes, redirect_stdout=True)
+    counters = []
+    done_bytes = 0
+    if n_processes == 1:
+        for shard in shards:
+            counter, n_bytes = count_byte_range(shard)
+            counters.append(counter)
+            done_bytes += n_bytes
+            bar.update(done_bytes)
+        cnt = merge_counters(counters)
+    else:
+        if tokenizer == 'spacy':
+            # Loaded before forking, so that the workers share this copy of
+            # the pipeline instead of each loading its own
+            get_spacy_tokenizer('de' if lang == 'de' else 'en')
+        # 'fork' makes `vocabulary_builder_job` available to the workers
+        with multiprocessing.get_context('fork').Pool(n_processes) as pool:
+            for counter, n_bytes in pool.imap_unordered(count_byte_range,
+                                                        shards):
+                counters.append(counter)
+                done_bytes += n_bytes
+                bar.update(done_bytes)
+            cnt = merge_counters(counters, pool)
+    bar.finish()
+    vocabulary_builder_job = None
+
+    print("Found %d unique tokens in the vocabulary." % len(cnt))
 
     # Filter tokens below the frequency threshold
     if min_frequency > 0:
@@ -358,8 +972,8 @@ def vocabulary_builder(data_paths, min_frequency=5, tokenizer='spacy',
                            if c > min_frequency]
         cnt = collections.Counter(dict(filtered_tokens))
 
-    print("Found %d unique tokens with frequency > %d.",
-          len(cnt), min_frequency)
+    print("Found %d unique tokens with frequency > %d." %
+          (len(cnt), min_frequency))
 
     # Sort tokens by 1. frequency 2. lexically to break ties
     vocab = cnt.most_common()
@@ -375,7 +989,8 @@ def vocabulary_builder(data_paths, min_frequency=5, tokenizer='spacy',
 
 def new_vocabulary(files, dataset_path, min_frequency, tokenizer,
                     downcase, max_vocab_size, name,
-                    line_processor=lambda line: " ".join(line.split('\t')[:2]), lang='en'):
+                    line_processor=lambda line: " ".join(line.split('\t')[:2]), lang='en',
+                    n_processes=None, overwrite=False):
 
     vocab_path = os.path.join(dataset_path,
                               '{}_{}_{}_{}_{}_vocab.txt'.format(
@@ -391,15 +1006,18 @@ def new_vocabulary(files, dataset_path, min_frequency, tokenizer,
                                     min_frequency, tokenizer, downcase,
                                     max_vocab_size))
 
-    if os.path.exists(vocab_path) and os.path.exists(w2v_path) and \
-                                                os.path.exists(metadata_path):
+    # `overwrite` is for callers that just rewrote `files`: the vocabulary
+    # of the previous contents would be stale
+    if not overwrite and os.path.exists(vocab_path) and \
+            os.path.exists(w2v_path) and os.path.exists(metadata_path):
         print("Files exist already")
         return vocab_path, w2v_path, metadata_path
 
     word_with_counts = vocabulary_builder(files,
                 min_frequency=min_frequency, tokenizer=tokenizer,
                 downcase=downcase, max_vocab_size=max_vocab_size,
-                line_processor=line_processor, lang=lang)
+                line_processor=line_processor, lang=lang,
+                n_processes=n_processes)
 
     entities = ['PERSON', 'NORP', 'FACILITY', 'ORG', 'GPE', 'LOC' +
                 'PRODUCT', 'EVENT', 'WORK_OF_ART', 'LANGUAGE',
@@ -445,48 +1063,89 @@ def load_classes(classes_path):
 
 def load_vocabulary(vocab_path):
     """
-    Loads the vocabulary from file `vocab_path`.
+    Loads the vocabulary from file `vocab_path`. Returns the `w2i` and `i2w`
+    views of a memory-mapped `datasets.vocabulary.Vocabulary`, which is
+    converted from `vocab_path` and cached next to it on the first load.
     """
-    w2i = {}
-    i2w = {}
-    with open(vocab_path, 'r') as vf:
-        wid = 0
-        for line in vf:
-            term = line.strip().split('\t')[0]
-            if term not in w2i:
-                w2i[term] = wid
-                i2w[wid] = term
-                wid += 1
+    vocabulary = open_vocabulary(vocab_path)
+    return vocabulary.w2i, vocabulary.i2w
 
-    return w2i, i2w
 
-
-def preload_w2v(w2i, initialize='random', lang='en'):
+def preload_w2v(w2i, initialize='random', lang='en', seed=None):
     '''
-    Loads the vocabulary based on spaCy's vectors.
+    Loads the vocabulary based on spaCy's vectors. The vectors of the terms
+    found in spaCy are gathered first and copied into the float32 matrix in
+    one go. Terms that are not a single entry of spaCy's vocabulary (e.g.
+    other cases, or several tokens) get the vector of their tokenized text,
+    as when each term was looked up with spaCy.
 
     Keyword arguments:
     initialize -- Either 'random' or 'zeros'. Indicate the value of the new
                     vectors to be created (if a word is not found in spaCy's
                     vocabulary
     lang       -- Either 'en' or 'de'.
+    seed       -- Seed for the random vectors. If None, numpy's global random
+                    state is used.
     '''
-    print('Preloading a w2v matrix with dims VOCAB_SIZE X 300')
-    spacy_nlp = get_spacy(lang)
+    nlp = get_spacy(lang, components='vectors')
+    vocab = nlp.vocab
+    dim = vocab.vectors_length
+    print('Preloading a w2v matrix with dims VOCAB_SIZE X {}'.format(dim))
+
     if initialize == 'random':
-        w2v = np.random.rand(len(w2i) , 300)
+        random_state = np.random if seed is None \
+                                 else np.random.RandomState(seed)
+        w2v = np.empty((len(w2i), dim), dtype=np.float32)
+        # Filled in chunks to avoid a float64 matrix of the full size
+        for i in range(0, len(w2i), 10000):
+            chunk = w2v[i:i + 10000]
+            chunk[:] = random_state.rand(*chunk.shape)
     else:
-        w2v = np.zeros((len(w2i), 300))
-
-    for term in w2i:
-        if spacy_nlp(term).has_vector:
-            w2v[w2i[term]] = spacy_nlp(term).vector
+        w2v = np.zeros((len(w2i), dim), dtype=np.float32)
+
+    matched = np.zeros(len(w2i), dtype=bool)
+    if hasattr(getattr(vocab, 'vectors', None), 'find'):
+        # spaCy >= 2.1 keeps the vectors in a single table. `find` returns
+        # -1 for the terms that have no vector
+        terms = list(w2i)
+        ids = np.array([w2i[term] for term in terms], dtype=np.int64)
+        rows = np.asarray(vocab.vectors.find(keys=terms))
+        found = rows >= 0
+        w2v[ids[found]] = vocab.vectors.data[rows[found]]
+        matched[ids[found]] = True
+    else:
+        # spaCy 1.x (the pinned version) keeps the vector of each lexeme.
+        # The lexemes are looped over instead of looking each term up,
+        # which would add the missing ones to spaCy's vocabulary
+        ids, vectors = [], []
+        for lex in vocab:
+            if lex.has_vector:
+                wid = w2i.get(lex.orth_)
+                if wid is not None:
+                    ids.append(wid)
+                    vectors.append(lex.vector)
+        if len(ids) > 0:
+            ids = np.array(ids, dtype=np.int64)
+            w2v[ids] = np.array(vectors, dtype=np.float32)
+            matched[ids] = True
+
+    # The rest are tokenized, and get the average vector of their tokens if
+    # any of them has one
+    missed = [(term, wid) for term, wid in w2i.items() if not matched[wid]]
+    docs = nlp.tokenizer.pipe([term for term, _ in missed])
+    for (_, wid), doc in zip(missed, docs):
+        if doc.has_vector:
+            w2v[wid] = doc.vector
 
     return w2v
 
 
-def load_w2v(path):
-    return np.load(path)
+def load_w2v(path, mmap=False):
+    """
+    Loads the w2v matrix saved in `path`. If `mmap` is True, the matrix is
+    memory-mapped read-only, so only the rows that are used are read.
+    """
+    return np.load(path, mmap_mode='r' if mmap else None)
 
 
 def save_w2v(path, w2v):
@@ -534,6 +1193,68 @@ def paths_exist(paths_list):
     return True
 
 
+def file_digest(path):
+    """
+    Returns the SHA-1 (in hex) of the contents of the file `path`. The digest
+    is stored next to the file (in `path` + '.sha1') together with the size
+    and modification time of the file, and is only recomputed when they
+    change.
+    """
+    stat = os.stat(path)
+    digest_path = path + '.sha1'
+    if os.path.exists(digest_path):
+        with open(digest_path, 'r') as df:
+            stored = json.load(df)
+        if stored['size'] == stat.st_size and \
+                stored['mtime_ns'] == stat.st_mtime_ns:
+            return stored['sha1']
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    with open(digest_path, 'w') as df:
+        json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                   'sha1': sha1.hexdigest()}, df)
+    return sha1.hexdigest()
+
+
+def next_indices(position, batch_size, n_rows):
+    """
+    Returns the indices of the `batch_size` rows read sequentially from row
+    `position` of a split with `n_rows` rows, going back to the first row
+    after the last one. Also returns the position after the batch and how
+    many times the end of the split was passed, counted the same way the
+    `next_batch` methods that read files do: only when a row after the end
+    was needed.
+    """
+    end = position + batch_size
+    n_wraps = (end - 1) // n_rows
+    indices = (position + np.arange(batch_size)) % n_rows
+    return indices, end - n_wraps * n_rows, n_wraps
+
+
+def map_rows(parse_rows, rows, pool=None, n_chunks=1):
+    """
+    Returns `parse_rows(rows)`, where `parse_rows` takes a list of rows and
+    returns a dict with a list of values (one per row) for each field.
+
+    If a `multiprocessing.Pool` is given, `rows` is split in `n_chunks`
+    consecutive chunks that its processes parse in parallel. The lists of
+    each field are then joined in the order of the chunks, so the result is
+    the same as parsing all the rows in one process. `parse_rows` has to be
+    picklable, e.g. a module-level function or a `functools.partial` of one.
+    """
+    n_chunks = min(n_chunks, len(rows))
+    if pool is None or n_chunks < 2:
+        return parse_rows(rows)
+    bounds = [len(rows) * i // n_chunks for i in range(n_chunks + 1)]
+    parsed = pool.map(parse_rows, [rows[start:end] for start, end
+                                   in zip(bounds[:-1], bounds[1:])])
+    return {name: [value for chunk in parsed for value in chunk[name]]
+            for name in parsed[0]}
+
+
 def merge_sentences(train_batch, length, batch_size,
                     get_lens=False):
     sentences_1 = [i[0:30] for i in train_batch.s1]
@@ -547,6 +1268,45 @@ def merge_sentences(train_batch, length, batch_size,
     return merged
 
 
+def as_tf_dataset(split, prefetch=1, fields=None, **next_batch_kwargs):
+    """
+    See `datasets.tf_data.as_tf_dataset`. TensorFlow is only imported when
+    this is called.
+    """
+    from .tf_data import as_tf_dataset
+    return as_tf_dataset(split, prefetch, fields, **next_batch_kwargs)
+
+
+def batch_inputs(split, prefetch=1, fields=None, **next_batch_kwargs):
+    """
+    See `datasets.tf_data.batch_inputs`. TensorFlow is only imported when
+    this is called.
+    """
+    from .tf_data import batch_inputs
+    return batch_inputs(split, prefetch, fields, **next_batch_kwargs)
+
+
+from .bucketing import BucketSampler
+from .balanced_sampler import BalancedSampler
+from .prefetch import Prefetcher
+from .cross_validation import EncodedFold
+from .cross_validation import EncodedSplit
+from .cross_validation import shared_array
+from .cross_validation import cross_validate
+from .entity_cache import EntityCache
+from .line_index import LineIndex
+from .line_index import open_line_index
+from .sharded_file import ShardedFile
+from .sharded_file import open_shard
+from .vocabulary import Vocabulary
+from .vocabulary import open_vocabulary
+from .corpus_cache import CorpusCache
+from .corpus_cache import corpus_cache
+from .ragged_rows import RaggedRows
+from .review_metadata import ReviewMetadata
+from .review_metadata import review_metadata
+from .sts_shards import STSShards
+from .sts_pairs import STSPairs
 from .gersen import Gersen
 from .sts import STS
 from .sts_large import STSLarge
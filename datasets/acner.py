@@ -1,5 +1,6 @@
 import os
 import csv
+import json
 import random
 import collections
 
@@ -12,7 +13,13 @@ from tflearn.data_utils import to_categorical
 
 class Acner():
     def __init__(self, train_validate_split=None, test_split=None,
-                 use_defaults=False, shuffle=True):
+                 use_defaults=False, shuffle=True, shard_index=0,
+                 num_shards=1):
+        # The splits only hold their shard `shard_index` of `num_shards`
+        # (see `datasets.shard_list`), and an epoch is a pass over it
+        datasets.validate_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
         self.construct()
         self.load(use_defaults, train_validate_split, test_split, shuffle)
         #super(Acner, self).__init__(train_validate_split, test_split,
@@ -23,6 +30,8 @@ class Acner():
         self.dataset_description = 'A ~1M words (47957 sentences) corpus with ' \
                                    'NER annotations.'
         self.dataset_path = os.path.join(datasets.data_root_directory, 'acner')
+        self.source_names = ['acner.csv']
+        self.build_path = os.path.join(self.dataset_path, 'build.json')
 
         self.train_path = os.path.join(self.dataset_path, 'train.txt')
         self.validate_path = os.path.join(self.dataset_path, 'validate.txt')
@@ -45,39 +54,92 @@ class Acner():
         self.w2v = [None, None, None]
 
     def load(self, use_defaults, train_validate_split, test_split, shuffle):
-        if (use_defaults or
-                train_validate_split is None or
-                test_split is None) and \
-                (os.path.exists(self.train_path) and
-                os.path.exists(self.validate_path) and
-                os.path.exists(self.test_path) and
-                datasets.paths_exist(self.vocab_paths) and
-                datasets.paths_exist(self.metadata_paths) and
-                datasets.paths_exist(self.w2v_paths)):
-            self.initialize_defaults(shuffle)
+        if use_defaults or test_split is None:
+            test_split = datasets.test_split_small
+        if use_defaults or train_validate_split is None:
+            train_validate_split = datasets.train_validate_split
+
+        key = self.build_key(train_validate_split, test_split, shuffle)
+        build = self.find_build(key)
+        if build is not None:
+            self.load_build(build, shuffle)
         else:
-            if test_split is None:
-                test_split = datasets.test_split_small
-            if train_validate_split is None:
-                train_validate_split = datasets.train_validate_split
             self.load_anew(train_validate_split, test_split,
                            shuffle=shuffle)
+            self.save_build(key)
+
+    def build_key(self, train_validate_split=None, test_split=None,
+                  shuffle=None):
+        """
+        Returns what the splits, vocabularies and w2v files are built from:
+        the digests of the source files and the parameters of the split.
+        """
+        return {'sources': {name: datasets.file_digest(
+                                os.path.join(self.dataset_path, name))
+                            for name in self.source_names},
+                'train_validate_split': train_validate_split,
+                'test_split': test_split,
+                'shuffle': shuffle}
+
+    def build_files(self):
+        return [self.train_path, self.validate_path, self.test_path] + \
+               self.vocab_paths + self.metadata_paths + self.w2v_paths
+
+    def find_build(self, key):
+        """
+        Returns the description of the last build (see `save_build`) if it
+        was made from `key` and none of its files changed since. Otherwise
+        returns None.
+        """
+        if not os.path.exists(self.build_path):
+            return None
+        with open(self.build_path, 'r') as f:
+            build = json.load(f)
+        if build['key'] != key:
+            return None
+        for name, digest in build['files'].items():
+            path = os.path.join(self.dataset_path, name)
+            if not os.path.exists(path) or \
+                    datasets.file_digest(path) != digest:
+                return None
+        return build
+
+    def save_build(self, key):
+        """
+        Stores in `build_path` the `key` the splits, vocabularies and w2v
+        files were built from, their names and their digests.
+        """
+        build = {'key': key,
+                 'vocab_paths': [os.path.basename(p) for p in self.vocab_paths],
+                 'metadata_paths': [os.path.basename(p)
+                                    for p in self.metadata_paths],
+                 'w2v_paths': [os.path.basename(p) for p in self.w2v_paths],
+                 'files': {os.path.basename(p): datasets.file_digest(p)
+                           for p in self.build_files()}}
+        tmp_path = '{}.{}.tmp'.format(self.build_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(build, f)
+        os.replace(tmp_path, self.build_path)
+
+    def load_build(self, build, shuffle=True):
+        """
+        Loads the splits, vocabularies and w2v files of `build` (see
+        `find_build`). The vocabularies are memory-mapped and the w2v
+        matrices too, so their rows are only read when used.
+        """
+        for paths, names in [(self.vocab_paths, build['vocab_paths']),
+                             (self.metadata_paths, build['metadata_paths']),
+                             (self.w2v_paths, build['w2v_paths'])]:
+            paths[:] = [os.path.join(self.dataset_path, n) for n in names]
 
-    def initialize_defaults(self, shuffle):
-        # For now, we are happy that this works =)
-        self.load_anew(train_validate_split=datasets.train_validate_split,
-                       test_split=datasets.test_split_small, shuffle=shuffle)
-        #train_data = self.load_data(self.train_path)
-        #validate_data = self.load_data(self.validate_path)
-        #test_data = self.load_data(self.test_path)
-
-        #self.w2i, self.i2w = datasets.load_vocabulary(self.vocab_path)
-        #self.w2v = datasets.load_w2v(self.w2v_path)
-
-        #self.train = DataSet(train_data, (self.w2i, self.i2w), shuffle)
-        #self.validate = DataSet(validate_data, (self.w2i, self.i2w), shuffle)
-        #self.test = DataSet(test_data, (self.w2i, self.i2w), shuffle)
+        for i in range(len(self.vocab_paths)):
+            self.w2i[i], self.i2w[i] = \
+                datasets.load_vocabulary(self.vocab_paths[i])
+            self.w2v[i] = datasets.load_w2v(self.w2v_paths[i], mmap=True)
 
+        self.initialize_datasets(self.load_data(self.train_path),
+                                 self.load_data(self.validate_path),
+                                 self.load_data(self.test_path), shuffle)
 
     def load_anew(self, train_validate_split, test_split, shuffle=True):
         all_data = self.load_all_data(self.dataset_path)
@@ -126,16 +188,20 @@ class Acner():
                     min_frequency=min_frequencies[i], tokenizer=tokenizer[i],
                     downcase=downcases[i], max_vocab_size=None,
                     name=names[i],
-                    line_processor=lambda line: line.split('\t')[i], lang='de')
+                    line_processor=lambda line: line.split('\t')[i], lang='de',
+                    overwrite=True)
 
             self.w2i[i], self.i2w[i] = datasets.load_vocabulary(self.vocab_paths[i])
             self.w2v[i] = datasets.preload_w2v(self.w2i[i], lang='de')
             datasets.save_w2v(self.w2v_paths[i], self.w2v[i])
 
     def initialize_datasets(self, train_data, validate_data, test_data, shuffle=True):
-        self.train = DataSet(train_data, self.w2i, self.i2w, shuffle)
-        self.validation = DataSet(validate_data, self.w2i, self.i2w, shuffle)
-        self.test = DataSet(test_data, self.w2i, self.i2w, shuffle)
+        self.train = DataSet(train_data, self.w2i, self.i2w, shuffle,
+                             self.shard_index, self.num_shards)
+        self.validation = DataSet(validate_data, self.w2i, self.i2w, shuffle,
+                                  self.shard_index, self.num_shards)
+        self.test = DataSet(test_data, self.w2i, self.i2w, shuffle,
+                            self.shard_index, self.num_shards)
 
     def get_sentence_index(self, s):
         # `str` should look like "Sentence: 1". I want to take the "1" there.
@@ -186,6 +252,11 @@ class Acner():
             for i in data:
                 f.write("{}\t{}\t{}\t{}\n".format(i[0], i[1], i[2], i[3]))
 
+    def load_data(self, path):
+        # The rows written by `dump_data`
+        with open(path, 'r') as f:
+            return [line.rstrip('\n').split('\t') for line in f]
+
     def __refresh(self, load_w2v):
         # (Again)
         # It doesn't seem to make sense to want to create a new vocabulary for
@@ -219,12 +290,15 @@ class Acner():
 
 
 class DataSet():
-    def __init__(self, data, w2i, i2w, shuffle=True):
+    def __init__(self, data, w2i, i2w, shuffle=True, shard_index=0,
+                 num_shards=1):
         self._epochs_completed = 0
         self._index_in_epoch = 0
         self.datafile = None
+        self.data = datasets.shard_list(data, shard_index, num_shards)
+        # The columns are encoded once and the batches gathered from them
+        self.rows = datasets.RaggedRows(self.data, self.generate_sequences)
         self.set_vocab(w2i, i2w)
-        self.data = data
         self.Batch = self.initialize_batch()
 
     def initialize_batch(self):
@@ -245,39 +319,26 @@ class DataSet():
         # rescale: if format is 'numerical', then this should be a tuple
         #           (min, max)
         
-        samples = None
-        if self._index_in_epoch + batch_size > len(self.data):
-            samples = self.data[self._index_in_epoch: len(self.data)]
-            random.shuffle(self.data)
-            missing_samples = batch_size - (len(self.data) - self._index_in_epoch)
-            self._epochs_completed += 1
-            samples.extend(self.data[0 :missing_samples])
-            self._index_in_epoch = missing_samples
-        else:
-            samples = self.data[self._index_in_epoch :self._index_in_epoch + batch_size]
-            self._index_in_epoch += batch_size
-            
-
-        data = list(zip(*samples))
-        sentences = data[0]
-        pos = data[1]
-        ner = data[2]
-
-        
-        # Generate sequences
-        sentences = self.generate_sequences(sentences, tokenizer[0])
-        pos = self.generate_sequences(pos, tokenizer[1])
-        ner = self.generate_sequences(ner, tokenizer[2])
-
-        lengths = [len(s) if pad == 0 else min(pad, len(s)) for s in sentences]
+        indices, self._index_in_epoch, wrapped = self.rows.next_indices(
+                self._index_in_epoch, batch_size)
+        self._epochs_completed += int(wrapped)
 
         if (raw) :
+            samples = [self.data[i] for i in indices]
+            data = list(zip(*samples))
+            # Generate sequences
+            sentences = self.generate_sequences(data[0], tokenizer[0])
+            pos = self.generate_sequences(data[1], tokenizer[1])
+            ner = self.generate_sequences(data[2], tokenizer[2])
+            lengths = [len(s) if pad == 0 else min(pad, len(s))
+                       for s in sentences]
             return self.Batch(sentences=sentences, pos=pos, ner=ner, lengths=lengths)
 
-        sentences = datasets.padseq(datasets.seq2id(sentences,
-                                                    self.vocab_w2i[0]), pad)
-        pos = datasets.padseq(datasets.seq2id(pos, self.vocab_w2i[1]), pad)
-        ner = datasets.padseq(datasets.seq2id(ner, self.vocab_w2i[2]), pad)
+        sentences, pos, ner = [
+            self.rows.sequences(i, indices, tokenizer[i], self.vocab_w2i[i],
+                                pad) for i in range(3)]
+        lengths = self.rows.lengths(0, indices, tokenizer[0],
+                                    self.vocab_w2i[0], pad)
 
         if one_hot:
             ner = [to_categorical(n, nb_classes=len(self.vocab_w2i[2]))
@@ -288,11 +349,34 @@ class DataSet():
         return batch
 
     def generate_sequences(self, x, tokenizer):
-        new_x = []
-        for instance in x:
-            tokens = datasets.tokenize(instance, tokenizer)
-            new_x.append(tokens)
-        return new_x
+        return datasets.tokenize_batch(x, tokenizer)
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def state_dict(self):
+        """
+        Returns the position of the split (the seed and number of shuffles
+        of the order of its rows, the position in it and the number of
+        epochs completed), to resume reading the same batches with
+        `load_state_dict`, e.g. from a checkpoint.
+        """
+        return {'epochs_completed': self._epochs_completed,
+                'index_in_epoch': self._index_in_epoch,
+                'rows': self.rows.state_dict()}
+
+    def load_state_dict(self, state):
+        """
+        Takes the split back to the position in `state` (see `state_dict`).
+        """
+        self.rows.load_state_dict(state['rows'])
+        self._epochs_completed = state['epochs_completed']
+        self._index_in_epoch = state['index_in_epoch']
 
     @property
     def epochs_completed(self):
@@ -306,6 +390,8 @@ class DataSet():
         else:
             self.vocab_w2i = w2i
             self.vocab_i2w = i2w
+        # Encoded with the previous vocabulary
+        self.rows.forget(which)
 
 if __name__ == '__main__':
     import timeit
@@ -0,0 +1,154 @@
+import numpy as np
+
+import datasets
+
+
+class BalancedSampler(object):
+    """
+    Draws class-balanced samples from the rows of a split, given the class
+    of each row, without making balanced copies of the split. Each sample
+    draws a class with a probability proportional to its weight, and then
+    the next row of that class in a random order. The rows of a class are
+    shuffled again once all of them were drawn, so none is repeated before
+    the others were used.
+
+    The classes are drawn from a generator seeded with `seed`, and the rows
+    of each class are shuffled by a generator of its own, seeded with
+    `seed` and the class. So the state of the sampler is the number of
+    classes drawn, the number of shuffles of each class and the positions,
+    rather than the orders themselves (see `state_dict`).
+
+    Keyword arguments:
+    labels        -- The class of each row.
+    class_weights -- A dict with the weight of each class. Classes with no
+                     weight (or weight 0) are never drawn. None gives the
+                     same weight to every class in `labels`.
+    epoch_size    -- Number of samples per epoch. None is as many samples of
+                     each drawn class as the rarest one has rows, i.e. the
+                     size of a balanced copy of the split.
+    seed          -- Seed of the random generators. None draws one.
+    """
+    def __init__(self, labels, class_weights=None, epoch_size=None,
+                 seed=None):
+        labels = np.asarray(labels)
+        if class_weights is None:
+            class_weights = {c: 1.0 for c in np.unique(labels).tolist()}
+        self.classes = sorted(c for c, weight in class_weights.items()
+                              if weight > 0)
+        if len(self.classes) == 0:
+            raise ValueError('At least one class needs a positive weight. '
+                             '{} was given'.format(class_weights))
+
+        self.rows = [np.flatnonzero(labels == c) for c in self.classes]
+        empty = [c for c, rows in zip(self.classes, self.rows)
+                 if len(rows) == 0]
+        if len(empty) > 0:
+            raise ValueError('The classes {} have no rows'.format(empty))
+
+        weights = np.array([class_weights[c] for c in self.classes],
+                           dtype=np.float64)
+        self.probabilities = weights / weights.sum()
+        self._cumulative = np.cumsum(self.probabilities)
+        if epoch_size is None:
+            epoch_size = len(self.classes) * min(len(rows)
+                                                 for rows in self.rows)
+        self.epoch_size = epoch_size
+
+        if seed is None:
+            seed = np.random.randint(2 ** 31)
+        self.seed = seed
+        self.random = np.random.RandomState(seed)
+        self._draws = 0
+        self._class_randoms = [np.random.RandomState([seed, c])
+                               for c in range(len(self.classes))]
+        self._orders = [rows.copy() for rows in self.rows]
+        for random, order in zip(self._class_randoms, self._orders):
+            random.shuffle(order)
+        self._shuffles = [1] * len(self.classes)
+        self._positions = [0] * len(self.classes)
+        self._position = 0
+
+    def take(self, c, n):
+        """
+        Returns the next `n` rows of the class number `c`.
+        """
+        taken = []
+        while n > 0:
+            if self._positions[c] == len(self._orders[c]):
+                self._class_randoms[c].shuffle(self._orders[c])
+                self._shuffles[c] += 1
+                self._positions[c] = 0
+            rows = self._orders[c][self._positions[c]:self._positions[c] + n]
+            self._positions[c] += len(rows)
+            n -= len(rows)
+            taken.append(rows)
+        return np.concatenate(taken)
+
+    def next_indices(self, batch_size):
+        """
+        Returns the rows of the next `batch_size` samples and the number of
+        epochs completed with them, counted as `datasets.next_indices` does.
+        """
+        classes = np.searchsorted(self._cumulative,
+                                  self.random.random_sample(batch_size),
+                                  side='right')
+        # Against rounding in the last cumulative probability
+        classes = np.minimum(classes, len(self.classes) - 1)
+        self._draws += batch_size
+        indices = np.empty(batch_size, dtype=np.int64)
+        for c in np.unique(classes):
+            where = classes == c
+            indices[where] = self.take(c, int(where.sum()))
+        _, self._position, n_epochs = datasets.next_indices(
+                            self._position, batch_size, self.epoch_size)
+        return indices, n_epochs
+
+    def state_dict(self):
+        """
+        Returns the seed, the number of classes drawn, the number of shuffles
+        and the position of the rows of each class and the position in the
+        epoch, to continue drawing the same samples with `load_state_dict`.
+        It is a few numbers per class, so it is cheap to take after every
+        batch.
+        """
+        return {'seed': self.seed,
+                'draws': self._draws,
+                'shuffles': list(self._shuffles),
+                'positions': list(self._positions),
+                'position': self._position}
+
+    def load_state_dict(self, state):
+        """
+        Restores the state returned by `state_dict`, drawing the classes and
+        shuffling the rows of each class again from its seed.
+        """
+        if len(state['shuffles']) != len(self.classes):
+            raise ValueError('The state is of a sampler of {} classes. This '
+                             'one draws {}'.format(len(state['shuffles']),
+                                                   len(self.classes)))
+        self.seed = state['seed']
+        self.random = np.random.RandomState(self.seed)
+        # Each class drawn took one number from the generator
+        remaining = state['draws']
+        while remaining > 0:
+            n = min(remaining, 1 << 20)
+            self.random.random_sample(n)
+            remaining -= n
+        self._draws = state['draws']
+
+        self._class_randoms = [np.random.RandomState([self.seed, c])
+                               for c in range(len(self.classes))]
+        self._orders = [rows.copy() for rows in self.rows]
+        for random, order, shuffles in zip(self._class_randoms, self._orders,
+                                           state['shuffles']):
+            for _ in range(shuffles):
+                random.shuffle(order)
+        self._shuffles = list(state['shuffles'])
+        self._positions = list(state['positions'])
+        self._position = state['position']
+
+    def class_counts(self):
+        """
+        Returns a dict with the number of rows of each class.
+        """
+        return {c: len(rows) for c, rows in zip(self.classes, self.rows)}
@@ -0,0 +1,160 @@
+import bisect
+import random
+
+import numpy as np
+
+
+def pad_batch(sequences, length):
+    """
+    Returns an int32 matrix with a row for each list of IDs in `sequences`,
+    truncated or padded with zeros (PAD) to `length`.
+    """
+    padded = np.zeros((len(sequences), length), dtype=np.int32)
+    for i, sequence in enumerate(sequences):
+        sequence = sequence[:length]
+        padded[i, :len(sequence)] = sequence
+    return padded
+
+
+class BucketSampler(object):
+    """
+    Emits the batches of a split grouped by length, so that each batch is
+    only padded to the length of its longest example instead of a fixed
+    `pad`. Works with any split whose `next_batch` takes `batch_size` and
+    `pad` and returns a `Batch` namedtuple with one entry per example in
+    each field, i.e. the streaming DataSets (STS family, reviews, tweets)
+    and the in-memory ones (Acner, Germeval, Gersen).
+
+    The sampler keeps a window of `window` upcoming examples, read from the
+    split with `pad=0`. Each example goes to the bucket of its length, given
+    by `boundaries`: with boundaries [10, 20], the buckets hold lengths
+    1-10, 11-20 and longer. `next_batch` emits `batch_size` examples of a
+    bucket that has that many (or of the fullest one), with the fields in
+    `pad_fields` padded to the longest example of the batch (or
+    `max_length`, if that is shorter).
+
+    The length of an example is the longest of its `pad_fields`, unless
+    `length_fn` (which takes the example as a `Batch` of single values) is
+    given. `epochs_completed` is the one of the split, which is ahead by up
+    to `window` examples.
+
+    Keyword arguments:
+    dataset -- The split to read from, e.g. `sts.train`.
+    boundaries -- Sorted upper bounds (inclusive) of the lengths of each
+                  bucket but the last one.
+    pad_fields -- Names of the `Batch` fields holding lists of IDs.
+    batch_size -- Number of examples per batch.
+    window -- Number of examples kept in the buckets.
+    max_length -- If given, sequences are truncated to this length.
+    seed -- Seed used to pick which full bucket is emitted.
+    next_batch_kwargs -- Passed to `dataset.next_batch`, e.g. `tokenizer`.
+    """
+    def __init__(self, dataset, boundaries, pad_fields, batch_size=64,
+                 window=2048, max_length=None, length_fn=None, seed=None,
+                 **next_batch_kwargs):
+        if list(boundaries) != sorted(boundaries):
+            raise ValueError('boundaries have to be sorted. {} was '
+                             'given'.format(boundaries))
+        if window < batch_size:
+            raise ValueError('window ({}) has to be at least batch_size '
+                             '({})'.format(window, batch_size))
+        if 'raw' in next_batch_kwargs or 'pad' in next_batch_kwargs:
+            raise ValueError('BucketSampler reads the split with pad=0 and '
+                             'raw=False')
+
+        self.dataset = dataset
+        self.boundaries = list(boundaries)
+        self.pad_fields = pad_fields
+        self.batch_size = batch_size
+        self.window = window
+        self.max_length = max_length
+        self.length_fn = length_fn
+        self.next_batch_kwargs = next_batch_kwargs
+        self.random = random.Random(seed)
+
+        self.buckets = [[] for _ in range(len(self.boundaries) + 1)]
+        self.n_buffered = 0
+        self.Batch = None
+        self.reset_stats()
+
+    def length(self, example):
+        if self.length_fn is not None:
+            return self.length_fn(example)
+        return max(len(getattr(example, field)) for field in self.pad_fields)
+
+    def fill(self):
+        """
+        Reads examples from the split until the buckets hold `window` of
+        them.
+        """
+        while self.n_buffered < self.window:
+            batch = self.dataset.next_batch(batch_size=self.batch_size,
+                                            pad=0, **self.next_batch_kwargs)
+            self.Batch = type(batch)
+            for example in zip(*batch):
+                example = self.Batch(*example)
+                bucket = bisect.bisect_left(self.boundaries,
+                                            self.length(example))
+                self.buckets[bucket].append(example)
+                self.n_buffered += 1
+
+    def next_batch(self):
+        self.fill()
+        full = [b for b in self.buckets if len(b) >= self.batch_size]
+        bucket = self.random.choice(full) if len(full) > 0 \
+                 else max(self.buckets, key=len)
+        examples = bucket[:self.batch_size]
+        del bucket[:self.batch_size]
+        self.n_buffered -= len(examples)
+
+        fields = {}
+        for field, values in zip(self.Batch._fields, zip(*examples)):
+            if field not in self.pad_fields:
+                fields[field] = list(values)
+                continue
+            lengths = [len(v) for v in values]
+            length = max(lengths)
+            if self.max_length is not None:
+                length = min(length, self.max_length)
+            fields[field] = pad_batch(values, length)
+            self.n_tokens += sum(min(l, length) for l in lengths)
+            self.n_padded_tokens += len(values) * length
+            if self.max_length is not None:
+                self.n_fixed_padded_tokens += len(values) * self.max_length
+        self.n_batches += 1
+        self.n_examples += len(examples)
+        return self.Batch(**fields)
+
+    def reset_stats(self):
+        self.n_batches, self.n_examples = 0, 0
+        self.n_tokens, self.n_padded_tokens, self.n_fixed_padded_tokens = \
+            0, 0, 0
+
+    def stats(self):
+        """
+        Returns a dict with padding statistics of the batches emitted since
+        the last `reset_stats`:
+
+         * 'batches' and 'examples': how many were emitted
+         * 'tokens': number of IDs in the padded fields, without padding
+         * 'padded_tokens': size of the padded fields, padding included
+         * 'efficiency': tokens / padded_tokens
+         * 'fixed_efficiency': tokens / size the padded fields would have
+           had if they were always padded to `max_length` (only if it is
+           given)
+        """
+        stats = {'batches': self.n_batches,
+                 'examples': self.n_examples,
+                 'tokens': self.n_tokens,
+                 'padded_tokens': self.n_padded_tokens,
+                 'efficiency': self.n_tokens / self.n_padded_tokens
+                               if self.n_padded_tokens > 0 else 1.0}
+        if self.max_length is not None:
+            stats['fixed_efficiency'] = \
+                self.n_tokens / self.n_fixed_padded_tokens \
+                if self.n_fixed_padded_tokens > 0 else 1.0
+        return stats
+
+    @property
+    def epochs_completed(self):
+        return self.dataset.epochs_completed
@@ -0,0 +1,238 @@
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+import datasets
+
+
+def vocabulary_digest(w2i):
+    """
+    Returns a digest that changes whenever the vocabulary `w2i` does.
+    """
+    if hasattr(w2i, 'vocabulary'):
+        return datasets.file_digest(w2i.vocabulary.path)
+    return hashlib.sha1(json.dumps(sorted(w2i.items())).encode('utf-8'))\
+                  .hexdigest()
+
+
+def build_corpus_cache(directory, rows, parse_rows, fields, w2i,
+                       chunk_size=1000):
+    """
+    Tokenizes and encodes `rows` (the lines of a split) and stores them in
+    `directory` as .npy arrays.
+
+    `parse_rows` takes a list of rows and returns a dict with a list of
+    values for each field in `fields`. `fields` maps the name of each field
+    to its kind:
+
+     * 'labels': one number per row, stored in <name>.npy
+     * 'sequence': one list of words per row. The IDs of all the words are
+       stored one after the other in <name>_tokens.npy (int32), and the row
+       `i` is <name>_tokens[<name>_offsets[i]:<name>_offsets[i + 1]]
+     * 'documents': one list of sentences (lists of words) per row. Each
+       sentence is stored as a 'sequence' row, and the sentences of row `i`
+       are the ones from <name>_documents[i] to <name>_documents[i + 1]
+    """
+    tokens = {name: [] for name, kind in fields.items() if kind != 'labels'}
+    lengths = {name: [] for name in tokens}
+    sentence_counts = {name: [] for name, kind in fields.items()
+                       if kind == 'documents'}
+    labels = {name: [] for name, kind in fields.items() if kind == 'labels'}
+
+    def add_chunk(chunk):
+        parsed = parse_rows(chunk)
+        for name, kind in fields.items():
+            values = parsed[name]
+            if kind == 'labels':
+                labels[name].append(np.asarray(values))
+                continue
+            if kind == 'documents':
+                sentence_counts[name] += [len(v) for v in values]
+                values = [sentence for v in values for sentence in v]
+            lengths[name] += [len(v) for v in values]
+            tokens[name].append(datasets.encode_tokens(
+                    [term for v in values for term in v], w2i))
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            add_chunk(chunk)
+            chunk = []
+    if len(chunk) > 0:
+        add_chunk(chunk)
+
+    # Written to a temporary directory first, so that an interrupted build
+    # is never taken for a complete one
+    tmp_directory = '{}.{}.tmp'.format(directory, os.getpid())
+    os.makedirs(tmp_directory)
+    n_rows = 0
+    for name, kind in fields.items():
+        if kind == 'labels':
+            values = np.concatenate(labels[name]) if labels[name] \
+                                                  else np.zeros(0)
+            np.save(os.path.join(tmp_directory, name), values)
+            n_rows = len(values)
+            continue
+        offsets = np.zeros(len(lengths[name]) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths[name])
+        np.save(os.path.join(tmp_directory, name + '_tokens'),
+                np.concatenate(tokens[name]) if tokens[name]
+                                             else np.zeros(0, np.int32))
+        np.save(os.path.join(tmp_directory, name + '_offsets'), offsets)
+        n_rows = len(lengths[name])
+        if kind == 'documents':
+            documents = np.zeros(len(sentence_counts[name]) + 1,
+                                 dtype=np.int64)
+            documents[1:] = np.cumsum(sentence_counts[name])
+            np.save(os.path.join(tmp_directory, name + '_documents'),
+                    documents)
+            n_rows = len(sentence_counts[name])
+    return tmp_directory, n_rows
+
+
+class CorpusCache(object):
+    """
+    A split tokenized and encoded once (see `build_corpus_cache`), with its
+    arrays memory-mapped. The rows can then be read in any order, already as
+    IDs, instead of reading and tokenizing the text again every epoch.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'key.json'), 'r') as kf:
+            self.key = json.load(kf)
+        self.fields = self.key['fields']
+        self.n_rows = self.key['n_rows']
+        self.arrays = {}
+        for file_name in os.listdir(directory):
+            if file_name.endswith('.npy'):
+                self.arrays[file_name[:-len('.npy')]] = np.load(
+                        os.path.join(directory, file_name), mmap_mode='r')
+
+    def __len__(self):
+        return self.n_rows
+
+    def labels(self, name, indices):
+        """
+        Returns an array with the values of the 'labels' field `name` for the
+        rows `indices`.
+        """
+        return np.asarray(self.arrays[name][indices])
+
+    def lengths(self, name, indices):
+        """
+        Returns the number of words of the 'sequence' field `name` in the
+        rows `indices`.
+        """
+        offsets = self.arrays[name + '_offsets']
+        return offsets[np.asarray(indices) + 1] - offsets[indices]
+
+    def padded(self, name, rows, pad=0, begin_id=None, end_id=None):
+        """
+        Returns the rows `rows` of the token arrays of `name` as
+        `datasets.encode_sequences` would: lists of IDs if `pad` is 0, else
+        an int32 matrix.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        offsets = self.arrays[name + '_offsets']
+        ids, lengths = datasets.pad_ragged(self.arrays[name + '_tokens'],
+                                           offsets[rows], offsets[rows + 1],
+                                           pad, begin_id, end_id)
+        if pad == 0:
+            return [row[:length].tolist() for row, length in zip(ids, lengths)]
+        return ids
+
+    def sequences(self, name, indices, pad=0, begin_id=None, end_id=None):
+        """
+        Returns the 'sequence' field `name` for the rows `indices`, encoded
+        as `datasets.encode_sequences` does.
+        """
+        return self.padded(name, indices, pad, begin_id, end_id)
+
+    def documents(self, name, indices, pad=0, sentence_pad=0, begin_id=None,
+                  end_id=None):
+        """
+        Returns the 'documents' field `name` for the rows `indices`, encoded
+        as `datasets.encode_documents` does.
+        """
+        documents = self.arrays[name + '_documents']
+        indices = np.asarray(indices, dtype=np.int64)
+        first, last = documents[indices], documents[indices + 1]
+
+        if pad == 0 or sentence_pad == 0:
+            encoded = [self.padded(name, np.arange(f, l), pad, begin_id,
+                                   end_id) for f, l in zip(first, last)]
+            if sentence_pad != 0:
+                encoded = [datasets.pad_sentences(document, sentence_pad)
+                           for document in encoded]
+            return encoded
+
+        n_sentences = np.minimum(last - first, sentence_pad)
+        rows = np.concatenate([np.arange(f, f + n) for f, n in
+                               zip(first, n_sentences)] +
+                              [np.zeros(0, dtype=np.int64)])
+        ids = self.padded(name, rows, pad, begin_id, end_id)
+        encoded = np.zeros((len(indices), sentence_pad, pad), dtype=np.int32)
+        start = 0
+        for i, n in enumerate(n_sentences):
+            encoded[i, :n] = ids[start:start + n]
+            start += n
+        return encoded
+
+    def document_lengths(self, name, indices):
+        """
+        Returns, for each of the rows `indices`, the list with the number of
+        words in each sentence of the 'documents' field `name`.
+        """
+        documents = self.arrays[name + '_documents']
+        offsets = self.arrays[name + '_offsets']
+        return [(offsets[documents[i] + 1:documents[i + 1] + 1] -
+                 offsets[documents[i]:documents[i + 1]]).tolist()
+                for i in indices]
+
+
+def corpus_cache(path, parse_rows, fields, w2i, **params):
+    """
+    Returns the `CorpusCache` of the split in the file `path`, building it
+    if needed. A cache is identified by the contents of `path`, the
+    vocabulary `w2i`, `fields` and `params` (e.g. the tokenizer and the
+    language used by `parse_rows`), so it is rebuilt whenever any of these
+    changes. Caches are kept in the directory `path` + '.cache'; the ones
+    made from previous contents of `path` are deleted.
+    """
+    key = {'source': datasets.file_digest(path),
+           'vocabulary': vocabulary_digest(w2i),
+           'fields': fields,
+           'params': params}
+    key_digest = hashlib.sha1(json.dumps(key, sort_keys=True)
+                              .encode('utf-8')).hexdigest()
+    cache_root = path + '.cache'
+    directory = os.path.join(cache_root, key_digest)
+    if os.path.exists(directory):
+        return CorpusCache(directory)
+
+    if os.path.exists(cache_root):
+        for other in os.listdir(cache_root):
+            key_path = os.path.join(cache_root, other, 'key.json')
+            if not os.path.exists(key_path):
+                continue
+            with open(key_path, 'r') as kf:
+                if json.load(kf)['source'] != key['source']:
+                    shutil.rmtree(os.path.join(cache_root, other))
+
+    print('Building the corpus cache of {}'.format(path))
+    with open(path, 'r') as rows:
+        tmp_directory, key['n_rows'] = build_corpus_cache(
+                os.path.join(cache_root, key_digest), rows, parse_rows,
+                fields, w2i)
+    with open(os.path.join(tmp_directory, 'key.json'), 'w') as kf:
+        json.dump(key, kf)
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another process finished the same cache first
+        shutil.rmtree(tmp_directory)
+    return CorpusCache(directory)
@@ -0,0 +1,107 @@
+import os
+import time
+import collections
+import multiprocessing
+
+import numpy as np
+
+
+# A split of a fold, encoded: `text` is an int32 matrix of padded word IDs,
+# `lengths` the number of words of each row and `labels` its class
+EncodedSplit = collections.namedtuple('EncodedSplit',
+                                      ['text', 'lengths', 'labels'])
+EncodedFold = collections.namedtuple('EncodedFold',
+                                     ['fold', 'train', 'validation', 'test'])
+
+# The folds of the running `cross_validate`. Set before the processes are
+# forked, so that they read the arrays instead of receiving copies of them
+_folds = None
+
+
+def shared_array(array):
+    """
+    Returns a copy of `array` in shared memory. Processes forked afterwards
+    read it without copying it.
+    """
+    array = np.ascontiguousarray(array)
+    buffer = multiprocessing.RawArray('b', max(array.nbytes, 1))
+    shared = np.frombuffer(buffer, dtype=array.dtype,
+                           count=array.size).reshape(array.shape)
+    shared[...] = array
+    return shared
+
+
+def fold_cpus(i, n_processes):
+    """
+    Returns the CPUs the process `i` of `n_processes` is pinned to: every
+    `n_processes`-th one of the CPUs available to this process.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    return cpus[i % n_processes::n_processes] or cpus
+
+
+def run_fold(task):
+    i, n_processes, pin_cpus, train_fold = task
+    if pin_cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, fold_cpus(i, n_processes))
+    start = time.time()
+    metrics = train_fold(_folds[i])
+    return {'fold': _folds[i].fold, 'seconds': time.time() - start,
+            'metrics': metrics}
+
+
+def cross_validate(train_fold, folds, n_processes=None, pin_cpus=True):
+    """
+    Trains and evaluates a model on each of `folds` in parallel, and returns
+    the metrics of each fold and their mean and standard deviation.
+
+    `train_fold` takes an `EncodedFold` and returns a dict of metrics (e.g.
+    {'test_accuracy': 0.61}). It runs in a new process for each fold, forked
+    from this one, so it has to be a module-level function (or a
+    `functools.partial` of one, to pass it its options) and it should
+    import and configure TensorFlow/Keras itself: a session created before
+    forking cannot be used in the children. Each process is pinned to its
+    own share of the CPUs (see `fold_cpus`), so `train_fold` should size its
+    thread pools to `len(os.sched_getaffinity(0))`.
+
+    Returns a dict with:
+
+     * 'folds': for each fold, a dict with its number ('fold'), the seconds
+       it took ('seconds') and its metrics ('metrics')
+     * 'mean' and 'std': dicts with the mean and standard deviation of each
+       metric across the folds
+     * 'seconds': the time the whole cross-validation took
+
+    Keyword arguments:
+    train_fold  -- The function that trains and evaluates a fold.
+    folds       -- The `EncodedFold`s, e.g. from
+                   `TwitterEmotion.encode_folds`.
+    n_processes -- Number of folds run at the same time. By default all.
+    pin_cpus    -- If True, each process only runs on its share of CPUs.
+    """
+    global _folds
+    if n_processes is None:
+        n_processes = len(folds)
+    start = time.time()
+    _folds = list(folds)
+    try:
+        pool = multiprocessing.get_context('fork').Pool(n_processes,
+                                                        maxtasksperchild=1)
+        try:
+            results = pool.map(run_fold,
+                               [(i, n_processes, pin_cpus, train_fold)
+                                for i in range(len(_folds))], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _folds = None
+
+    names = sorted(set(name for result in results
+                       for name in result['metrics']))
+    values = {name: [result['metrics'][name] for result in results
+                     if name in result['metrics']] for name in names}
+    return {'folds': results,
+            'mean': {name: float(np.mean(values[name])) for name in names},
+            'std': {name: float(np.std(values[name])) for name in names},
+            'seconds': time.time() - start}
@@ -0,0 +1,63 @@
+import shelve
+import hashlib
+import collections
+
+
+class EntityCache(object):
+    """
+    Memoizes the Named Entities found in lists of tokens (see
+    `datasets.entity_spans`), so that each tweet or review is only tagged
+    once, however many epochs read it.
+
+    The most recently used `capacity` entries are kept in memory. If `path`
+    is given, every entry is also kept in a `shelve` store at `path`, which
+    later runs (and other processes, one at a time) can read.
+    """
+    def __init__(self, capacity=100000, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.store = shelve.open(path) if path is not None else None
+
+    @staticmethod
+    def key(lang, tokens):
+        return hashlib.sha1('\n'.join([lang] + list(tokens))
+                            .encode('utf-8')).hexdigest()
+
+    def remember(self, key, spans):
+        self.entries[key] = spans
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def get(self, lang, tokens):
+        """
+        Returns the entity spans stored for `tokens` in the language `lang`,
+        or None if there are none.
+        """
+        key = self.key(lang, tokens)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.store is not None and key in self.store:
+            spans = self.store[key]
+            self.remember(key, spans)
+            return spans
+        return None
+
+    def put(self, lang, tokens, spans):
+        """
+        Stores the entity `spans` of `tokens` in the language `lang`.
+        """
+        key = self.key(lang, tokens)
+        self.remember(key, spans)
+        if self.store is not None:
+            self.store[key] = spans
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
@@ -1,6 +1,5 @@
 import os
 import csv
-import random
 import collections
 import datasets
 
@@ -9,10 +8,11 @@ from tflearn.data_utils import to_categorical
 
 class Germeval(Acner):
     def __init__(self, train_validate_split=None, test_split=None,
-             use_defaults=False, shuffle=True):
+             use_defaults=False, shuffle=True, shard_index=0, num_shards=1):
         # It makes less sense to try to change the sizes of the stuff in this
         # dataset: it already comes with a Train/Dev/Test cutting
-        super(Germeval, self).__init__(None, None, None, None)
+        super(Germeval, self).__init__(None, None, None, None, shard_index,
+                                       num_shards)
 
     def load(self, train_validate_split=None, test_split=None,
              use_defaults=None, shuffle=None):
@@ -20,17 +20,26 @@ class Germeval(Acner):
         # here only to agree with the Base Class' signature.
         # It makes less sense to try to change the sizes of the stuff in this
         # dataset: it already comes with a Train/Dev/Test cutting
+        key = self.build_key()
+        build = self.find_build(key)
+        if build is not None:
+            self.load_build(build)
+            return
 
         all_data = self.load_all_data(self.dataset_path)
 
         self.dump_all_data(*all_data)
         self.initialize_vocabulary()
         self.initialize_datasets(*all_data)
+        self.save_build(key)
 
     def initialize_datasets(self, train_data, validate_data, test_data, shuffle=True):
-        self.train = DataSet(train_data, self.w2i, self.i2w)
-        self.validation = DataSet(validate_data, self.w2i, self.i2w)
-        self.test = DataSet(test_data, self.w2i, self.i2w)
+        self.train = DataSet(train_data, self.w2i, self.i2w,
+                             self.shard_index, self.num_shards)
+        self.validation = DataSet(validate_data, self.w2i, self.i2w,
+                                  self.shard_index, self.num_shards)
+        self.test = DataSet(test_data, self.w2i, self.i2w, self.shard_index,
+                            self.num_shards)
 
     def initialize_vocabulary(self):
         self.initialize_vocabulary_ll(['texts', 'ner1', 'ner2'], [5,1,1],
@@ -43,6 +52,9 @@ class Germeval(Acner):
             'German Named Entity annotation [1].' \
             'This data set is distributed under the CC-BY license.'
         self.dataset_path = os.path.join(datasets.data_root_directory, 'germeval2014')
+        self.source_names = ['NER-de-train.tsv', 'NER-de-dev.tsv',
+                             'NER-de-test.tsv']
+        self.build_path = os.path.join(self.dataset_path, 'build.json')
 
         self.train_path = os.path.join(self.dataset_path, 'train.txt')
         self.validate_path = os.path.join(self.dataset_path, 'validate.txt')
@@ -113,12 +125,14 @@ class Germeval(Acner):
 
 
 class DataSet():
-    def __init__(self, data, w2i, i2w):
+    def __init__(self, data, w2i, i2w, shard_index=0, num_shards=1):
         self._epochs_completed = 0
         self._index_in_epoch = 0
         self.datafile = None
+        self.data = datasets.shard_list(data, shard_index, num_shards)
+        # The columns are encoded once and the batches gathered from them
+        self.rows = datasets.RaggedRows(self.data, self.generate_sequences)
         self.set_vocab(w2i, i2w)
-        self.data = data
         self.Batch = self.initialize_batch()
 
     def initialize_batch(self):
@@ -126,38 +140,28 @@ class DataSet():
 
     def next_batch(self, batch_size=64, pad=0, raw=False,
                    tokenizer=['spacy', 'split', 'split'], one_hot=False):
-        samples = None
-        if self._index_in_epoch + batch_size > len(self.data) :
-            samples = self.data[self._index_in_epoch : len(self.data)]
-            random.shuffle(self.data)
-            missing_samples = batch_size - (len(self.data) - self._index_in_epoch)
-            self._epochs_completed += 1
-            samples.extend(self.data[0 :missing_samples])
-            self._index_in_epoch = missing_samples
-        else :
-            samples = self.data[self._index_in_epoch :self._index_in_epoch + batch_size]
-            self._index_in_epoch += batch_size
-
-        data = list(zip(*samples))
-        sentences = data[0]
-        ner1 = data[1]
-        ner2 = data[2]
-
-        # Generate sequences
-        sentences = self.generate_sequences(sentences, tokenizer=tokenizer[0])
-        ner1 = self.generate_sequences(ner1, tokenizer=tokenizer[1])
-        ner2 = self.generate_sequences(ner2, tokenizer=tokenizer[2])
-
-        lengths = [len(s) if pad == 0 else min(pad, len(s)) for s in sentences]
+        indices, self._index_in_epoch, wrapped = self.rows.next_indices(
+                self._index_in_epoch, batch_size)
+        self._epochs_completed += int(wrapped)
 
         if (raw):
+            samples = [self.data[i] for i in indices]
+            data = list(zip(*samples))
+            # Generate sequences
+            sentences = self.generate_sequences(data[0], tokenizer=tokenizer[0])
+            ner1 = self.generate_sequences(data[1], tokenizer=tokenizer[1])
+            ner2 = self.generate_sequences(data[2], tokenizer=tokenizer[2])
+            lengths = [len(s) if pad == 0 else min(pad, len(s))
+                       for s in sentences]
             return self.Batch(sentences=sentences, ner1=ner1, ner2=ner2,
                               lengths=lengths)
-        sentences = datasets.padseq(datasets.seq2id(sentences,
-                                                    self.vocab_w2i[0]), pad)
-        ner1 = datasets.padseq(datasets.seq2id(ner1, self.vocab_w2i[1]), pad)
-        ner2 = datasets.padseq(datasets.seq2id(ner2, self.vocab_w2i[2]), pad)
-        
+
+        sentences, ner1, ner2 = [
+            self.rows.sequences(i, indices, tokenizer[i], self.vocab_w2i[i],
+                                pad) for i in range(3)]
+        lengths = self.rows.lengths(0, indices, tokenizer[0],
+                                    self.vocab_w2i[0], pad)
+
         if one_hot:
             ner1 = [to_categorical(n, nb_classes=len(self.vocab_w2i[1]))
                    for n in ner1]
@@ -170,11 +174,34 @@ class DataSet():
         return batch
 
     def generate_sequences(self, x, tokenizer):
-        new_x = []
-        for instance in x:
-            tokens = datasets.tokenize(instance, tokenizer)
-            new_x.append(tokens)
-        return new_x
+        return datasets.tokenize_batch(x, tokenizer)
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def state_dict(self):
+        """
+        Returns the position of the split (the seed and number of shuffles
+        of the order of its rows, the position in it and the number of
+        epochs completed), to resume reading the same batches with
+        `load_state_dict`, e.g. from a checkpoint.
+        """
+        return {'epochs_completed': self._epochs_completed,
+                'index_in_epoch': self._index_in_epoch,
+                'rows': self.rows.state_dict()}
+
+    def load_state_dict(self, state):
+        """
+        Takes the split back to the position in `state` (see `state_dict`).
+        """
+        self.rows.load_state_dict(state['rows'])
+        self._epochs_completed = state['epochs_completed']
+        self._index_in_epoch = state['index_in_epoch']
 
     @property
     def epochs_completed(self):
@@ -187,6 +214,8 @@ class DataSet():
         else:
             self.vocab_w2i = w2i
             self.vocab_i2w = i2w
+        # Encoded with the previous vocabulary
+        self.rows.forget(which)
 
 
 if __name__ == '__main__':
@@ -9,7 +9,12 @@ from tflearn.data_utils import to_categorical
 
 class Gersen(object):
     def __init__(self, train_validate_split=None, test_split=None, use_defaults=False,
-                    shuffle=True):
+                    shuffle=True, shard_index=0, num_shards=1):
+        # The splits only hold their shard `shard_index` of `num_shards`
+        # (see `datasets.shard_list`), and an epoch is a pass over it
+        datasets.validate_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
         self.construct()
         self.load(use_defaults, train_validate_split, test_split, shuffle)
 
@@ -57,9 +62,12 @@ class Gersen(object):
         self.w2i, self.i2w = datasets.load_vocabulary(self.vocab_path)
         self.w2v = datasets.load_w2v(self.w2v_path)
 
-        self.train = DataSet(train_data, (self.w2i, self.i2w), shuffle)
-        self.validation = DataSet(validate_data, (self.w2i, self.i2w), shuffle)
-        self.test = DataSet(test_data, (self.w2i, self.i2w), shuffle)
+        self.train = DataSet(train_data, (self.w2i, self.i2w), shuffle,
+                             self.shard_index, self.num_shards)
+        self.validation = DataSet(validate_data, (self.w2i, self.i2w), shuffle,
+                                  self.shard_index, self.num_shards)
+        self.test = DataSet(test_data, (self.w2i, self.i2w), shuffle,
+                            self.shard_index, self.num_shards)
 
     def load_anew(self, train_validate_split, test_split, shuffle=True):
         all_data = self.load_all_data(self.dataset_path)
@@ -98,9 +106,12 @@ class Gersen(object):
         datasets.save_w2v(self.w2v_path, self.w2v)
 
     def initialize_datasets(self, train_data, validate_data, test_data, shuffle):
-        self.train = DataSet(train_data, (self.w2i, self.i2w), shuffle)
-        self.validation = DataSet(validate_data, (self.w2i, self.i2w), shuffle)
-        self.test = DataSet(test_data, (self.w2i, self.i2w), shuffle)
+        self.train = DataSet(train_data, (self.w2i, self.i2w), shuffle,
+                             self.shard_index, self.num_shards)
+        self.validation = DataSet(validate_data, (self.w2i, self.i2w), shuffle,
+                                  self.shard_index, self.num_shards)
+        self.test = DataSet(test_data, (self.w2i, self.i2w), shuffle,
+                            self.shard_index, self.num_shards)
 
     def load_data(self, path):
         with open(path, 'r') as f:
@@ -161,12 +172,14 @@ class Gersen(object):
 
 
 class DataSet(object):
-    def __init__(self, data, vocab, shuffle=True):
+    def __init__(self, data, vocab, shuffle=True, shard_index=0, num_shards=1):
         self._epochs_completed = 0
         self._index_in_epoch = 0
         self.datafile = None
+        self.data = datasets.shard_list(data, shard_index, num_shards)
+        # The text is encoded once and the batches gathered from it
+        self.rows = datasets.RaggedRows(self.data, self.generate_sequences)
         self.set_vocab(vocab)
-        self.data = data
         self.Batch = self.initialize_batch()
 
     def initialize_batch(self):
@@ -175,26 +188,17 @@ class DataSet(object):
     def next_batch(self, batch_size=64, format='one_hot', rescale=None,
                    pad=0, raw=False, tokenizer='spacy'):
 
-        samples = None
-        if self._index_in_epoch + batch_size > len(self.data):
-            samples = self.data[self._index_in_epoch: len(self.data)]
-            random.shuffle(self.data)
-            missing_samples = batch_size - (
-            len(self.data) - self._index_in_epoch)
-            self._epochs_completed += 1
-            samples.extend(self.data[0:missing_samples])
-            self._index_in_epoch = missing_samples
-        else:
-            samples = self.data[
-                      self._index_in_epoch:self._index_in_epoch + batch_size]
-            self._index_in_epoch += batch_size
+        indices, self._index_in_epoch, wrapped = self.rows.next_indices(
+                self._index_in_epoch, batch_size)
+        self._epochs_completed += int(wrapped)
 
-        x, y = zip(*samples)
-        # Generate sequences
-        x = self.generate_sequences(x, tokenizer)
-        lens = [len(s) if pad == 0 else min(pad, len(s)) for s in x]
+        y = [self.data[i][1] for i in indices]
 
         if (raw):
+            # Generate sequences
+            x = self.generate_sequences([self.data[i][0] for i in indices],
+                                        tokenizer)
+            lens = [len(s) if pad == 0 else min(pad, len(s)) for s in x]
             return self.Batch(x=x, y=y, lengths=lens)
 
         if (format == 'one_hot'):
@@ -205,17 +209,41 @@ class DataSet(object):
             y = datasets.rescale(y, rescale, (0.0, 2.0))
 
         batch = self.Batch(
-            x=datasets.padseq(datasets.seq2id(x, self.vocab_w2i), pad),
-            y=y, lengths=lens)
+            x=self.rows.sequences(0, indices, tokenizer, self.vocab_w2i, pad),
+            y=y, lengths=self.rows.lengths(0, indices, tokenizer,
+                                           self.vocab_w2i, pad))
 
         return batch
 
     def generate_sequences(self, x, tokenizer):
-        new_x = []
-        for instance in x:
-            tokens = datasets.tokenize(instance, tokenizer)
-            new_x.append(tokens)
-        return new_x
+        return datasets.tokenize_batch(x, tokenizer)
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def state_dict(self):
+        """
+        Returns the position of the split (the seed and number of shuffles
+        of the order of its rows, the position in it and the number of
+        epochs completed), to resume reading the same batches with
+        `load_state_dict`, e.g. from a checkpoint.
+        """
+        return {'epochs_completed': self._epochs_completed,
+                'index_in_epoch': self._index_in_epoch,
+                'rows': self.rows.state_dict()}
+
+    def load_state_dict(self, state):
+        """
+        Takes the split back to the position in `state` (see `state_dict`).
+        """
+        self.rows.load_state_dict(state['rows'])
+        self._epochs_completed = state['epochs_completed']
+        self._index_in_epoch = state['index_in_epoch']
 
     @property
     def epochs_completed(self):
@@ -224,6 +252,8 @@ class DataSet(object):
     def set_vocab(self, vocab):
         self.vocab_w2i = vocab[0]
         self.vocab_i2w = vocab[1]
+        # Encoded with the previous vocabulary
+        self.rows.forget()
 
 
 if __name__ == "__main__":
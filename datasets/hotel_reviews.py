@@ -1,15 +1,19 @@
 import os
 import json
 import datasets
+import functools
+import multiprocessing
 import collections
-from glob import glob
+import numpy as np
 
 from tflearn.data_utils import to_categorical
 
 
 class HotelReviews(object):
     def __init__(self, train_validation_split=None, test_split=None,
-                 use_defaults=True, data_balancing=True):
+                 use_defaults=True, data_balancing=True, use_cache=False,
+                 n_workers=0, shard_index=0, num_shards=1,
+                 use_metadata=False, class_weights=None, epoch_size=None):
         if train_validation_split is not None or test_split is not None or \
                         use_defaults is False:
             raise NotImplementedError('This Dataset does not implement '
@@ -27,7 +31,6 @@ class HotelReviews(object):
                                          self.dataset)
         self.data_balancing = data_balancing
         self.train_path = os.path.join(self.dataset_path, 'train', 'train.txt')
-        self.train_path_list = glob(os.path.join(self.dataset_path, 'train', 'output_file_*.txt'))
         self.validation_path = os.path.join(self.dataset_path, 'validation',
                                             'validation.txt')
         self.test_path = os.path.join(self.dataset_path, 'test', 'test.txt')
@@ -41,12 +44,19 @@ class HotelReviews(object):
 
         self.vocab_size = len(self.w2i)
         if not self.data_balancing:
-            self.train = DataSet(self.train_path, (self.w2i, self.i2w))
+            self.train = DataSet(self.train_path, (self.w2i, self.i2w),
+                                 use_cache, n_workers, shard_index, num_shards,
+                                 use_metadata)
         else:
-            self.train = DataSetBalanced(self.train_path_list, (self.w2i, self.i2w))
-
-        self.validation = DataSet(self.validation_path, (self.w2i, self.i2w))
-        self.test = DataSet(self.test_path, (self.w2i, self.i2w))
+            self.train = DataSetBalanced(self.train_path, (self.w2i, self.i2w),
+                                         n_workers, shard_index, num_shards,
+                                         class_weights, epoch_size)
+
+        self.validation = DataSet(self.validation_path, (self.w2i, self.i2w),
+                                  use_cache, n_workers, shard_index,
+                                  num_shards, use_metadata)
+        self.test = DataSet(self.test_path, (self.w2i, self.i2w), use_cache,
+                            n_workers, shard_index, num_shards, use_metadata)
         self.__refresh(load_w2v=False)
 
     def create_vocabulary(self, min_frequency=5, tokenizer='spacy',
@@ -76,8 +86,91 @@ class HotelReviews(object):
         self.test.set_vocab((self.w2i, self.i2w))
 
 
+RATING_ASPECTS = ['service', 'cleanliness', 'overall', 'value',
+                  'sleep_quality', 'rooms']
+
+# Columns of the `datasets.ReviewMetadata` of a split
+METADATA_COLUMNS = dict([('ratings_' + aspect, 'uint8')
+                         for aspect in RATING_ASPECTS] +
+                        [('helpful_votes', 'int32')])
+METADATA_TEXT_COLUMNS = ['titles', 'text']
+
+
+def read_ratings(json_obj):
+    """
+    Returns a dict with the rating of each aspect in `RATING_ASPECTS` for the
+    review `json_obj`. Aspects the review does not rate get its overall
+    rating.
+    """
+    ratings = json_obj['ratings']
+    return {aspect: int(ratings[aspect]) if aspect in ratings
+                    else int(ratings['overall'])
+            for aspect in RATING_ASPECTS}
+
+
+def convert_ratings(ratings, rescale=None, one_hot=False):
+    """
+    Rescales `ratings` (1 to 5) to the range `rescale`, or converts them to
+    one-hot vectors if `one_hot` is True, or to an int32 array of class IDs
+    (0 to 4) if `one_hot` is 'sparse'.
+    """
+    if rescale is not None and one_hot == False:
+        return datasets.rescale(ratings, rescale, [1.0, 5.0])
+    elif rescale is None and one_hot == True:
+        return to_categorical([x - 1 for x in ratings], nb_classes=5)
+    elif rescale is None and one_hot == 'sparse':
+        return np.asarray(ratings, dtype=np.int32) - 1
+    elif rescale is None and one_hot == False:
+        return ratings
+    else:
+        raise ValueError('rescale and one_hot cannot be set together')
+
+
+def read_review(json_obj):
+    """
+    Returns a dict with the text ('text'), title ('titles'), helpful votes
+    ('helpful_votes') and the rating of each aspect (e.g. 'ratings_service')
+    of the review `json_obj`.
+    """
+    review = {'text': json_obj["text"], 'titles': json_obj["title"],
+              'helpful_votes': int(json_obj["num_helpful_votes"])}
+    for aspect, rating in read_ratings(json_obj).items():
+        review['ratings_' + aspect] = rating
+    return review
+
+
+def tokenize_reviews(reviews, tokenizer='spacy', sentence_splitter='parser'):
+    """
+    Returns a dict with the tokenized text ('text'), titles ('titles')
+    and sentences ('sentences'), the ratings of each aspect (e.g.
+    'ratings_service') and the helpful votes ('helpful_votes') of
+    `reviews`, dicts as `read_review` returns them.
+    """
+    parsed = {
+        'text': datasets.tokenize_batch([r['text'] for r in reviews],
+                                        tokenizer),
+        'titles': datasets.tokenize_batch([r['titles'] for r in reviews]),
+        'sentences': datasets.sentence_tokenizer_batch(
+                [r['text'] for r in reviews], sentence_splitter),
+        'helpful_votes': [r['helpful_votes'] for r in reviews]
+    }
+    for aspect in RATING_ASPECTS:
+        parsed['ratings_' + aspect] = [r['ratings_' + aspect]
+                                       for r in reviews]
+    return parsed
+
+
+def parse_reviews(rows, tokenizer='spacy', sentence_splitter='parser'):
+    """
+    Returns `tokenize_reviews` of the reviews in `rows`.
+    """
+    return tokenize_reviews([read_review(json.loads(row.strip()))
+                             for row in rows], tokenizer, sentence_splitter)
+
+
 class DataSet(object):
-    def __init__(self, path, vocab):
+    def __init__(self, path, vocab, use_cache=False, n_workers=0,
+                 shard_index=0, num_shards=1, use_metadata=False):
 
         self.path = path
         self._epochs_completed = 0
@@ -85,6 +178,37 @@ class DataSet(object):
         self.vocab_i2w = vocab[1]
         self.datafile = None
 
+        # If True, `next_batch` reads the tokenized and encoded reviews from
+        # a `datasets.CorpusCache` whenever `raw` and `mark_entities` are
+        # False. It keeps its own position in the split.
+        self.use_cache = use_cache
+        self._caches = {}
+        self._cache_position = 0
+
+        # If True, `next_batch` reads the reviews from the
+        # `datasets.ReviewMetadata` of the split instead of decoding the JSON
+        # lines, whenever it does not read them from the corpus cache. It
+        # keeps its own position in the split too.
+        self.use_metadata = use_metadata
+        self._metadata = None
+        self._metadata_position = 0
+
+        # Number of processes that parse the rows of each batch (see
+        # `datasets.map_rows`). 0 parses them in this process.
+        self.n_workers = n_workers
+        self.pool = None
+        self._line_index = None
+        # State taken back to when the split is opened (see
+        # `load_state_dict`)
+        self._state = None
+
+        # `next_batch` only reads the shard `shard_index` of the
+        # `num_shards` byte ranges of the file (see `datasets.ShardedFile`),
+        # or of the rows of the cache, and an epoch is a pass over that
+        # shard. `get`, `get_many` and `len` still refer to the whole file.
+        datasets.validate_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
 
         self.Batch = collections.namedtuple('Batch', ['text', 'lengths', 'sentence_lengths',
                   'sentences', 'ratings_service', 'ratings_cleanliness',
@@ -92,259 +216,368 @@ class DataSet(object):
                   'ratings_rooms', 'titles', 'helpful_votes'])
 
     def open(self):
-        self.datafile = open(self.path, 'r')
+        self.datafile = datasets.open_shard(self.path, self.shard_index,
+                                            self.num_shards)
+        self._cache_position = 0
+        self._metadata_position = 0
+        self.restore_state()
+        self.start_workers()
 
     def close(self):
         self.datafile.close()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self._line_index is not None:
+            self._line_index.close()
+            self._line_index = None
+        if self._metadata is not None:
+            self._metadata.close()
+
+    def start_workers(self):
+        if self.n_workers > 0 and self.pool is None:
+            self.pool = multiprocessing.get_context('fork').Pool(
+                                                            self.n_workers)
+
+    def line_index(self):
+        """
+        Returns the `datasets.LineIndex` of the split.
+        """
+        if self._line_index is None:
+            self._line_index = datasets.open_line_index(self.path)
+        return self._line_index
+
+    def __len__(self):
+        return len(self.line_index())
+
+    def review_metadata(self):
+        """
+        Returns the `datasets.ReviewMetadata` of the split, building it the
+        first time.
+        """
+        if self._metadata is None:
+            self._metadata = datasets.review_metadata(
+                    self.path, read_review, METADATA_COLUMNS,
+                    METADATA_TEXT_COLUMNS)
+        return self._metadata
+
+    def ratings(self, aspect='overall'):
+        """
+        Returns an array with the rating of `aspect` of every review in the
+        split, read from its `datasets.ReviewMetadata`.
+        """
+        metadata = self.review_metadata()
+        return np.asarray(metadata.column('ratings_' + aspect)
+                          [metadata.valid_rows()])
+
+    def get(self, i, **kwargs):
+        """
+        Returns a `Batch` with the review in line `i`. `kwargs` are the ones
+        of `next_batch` (but `batch_size`).
+        """
+        return self.get_many([i], **kwargs)
+
+    def get_many(self, indices, **kwargs):
+        """
+        Returns a `Batch` with the reviews in the lines `indices`, in that
+        order. `kwargs` are the ones of `next_batch` (but `batch_size`).
+        """
+        return self.batch_from_rows(self.line_index().lines(indices),
+                                    **kwargs)
+
+    def next_row(self):
+        """
+        Returns the next line of the split, starting a new epoch at its end.
+        """
+        row = self.datafile.readline()
+        while row == '':
+            self._epochs_completed += 1
+            self.datafile.seek(0)
+            row = self.datafile.readline()
+        return row
+
+    def parse_rows(self, rows, tokenizer='spacy', sentence_splitter='parser'):
+        """
+        Returns `parse_reviews(rows)`, split among the worker processes if
+        there are any.
+        """
+        return datasets.map_rows(functools.partial(
+                                    parse_reviews, tokenizer=tokenizer,
+                                    sentence_splitter=sentence_splitter),
+                                 rows, self.pool, self.n_workers)
+
+    def tokenize_reviews(self, reviews, tokenizer='spacy',
+                         sentence_splitter='parser'):
+        """
+        Returns `tokenize_reviews(reviews)`, split among the worker processes
+        if there are any.
+        """
+        return datasets.map_rows(functools.partial(
+                                    tokenize_reviews, tokenizer=tokenizer,
+                                    sentence_splitter=sentence_splitter),
+                                 reviews, self.pool, self.n_workers)
+
+    def corpus_cache(self, tokenizer='spacy', sentence_splitter='parser'):
+        """
+        Returns the `datasets.CorpusCache` of the split.
+        """
+        if (tokenizer, sentence_splitter) not in self._caches:
+            fields = {'text': 'sequence', 'titles': 'sequence',
+                      'sentences': 'documents', 'helpful_votes': 'labels'}
+            for aspect in RATING_ASPECTS:
+                fields['ratings_' + aspect] = 'labels'
+            self._caches[(tokenizer, sentence_splitter)] = \
+                datasets.corpus_cache(
+                    self.path,
+                    lambda rows: self.parse_rows(rows, tokenizer,
+                                                 sentence_splitter),
+                    fields, self.vocab_w2i, tokenizer=tokenizer, lang='en',
+                    sentence_splitter=sentence_splitter)
+        return self._caches[(tokenizer, sentence_splitter)]
 
     def next_batch(self, batch_size=64, seq_begin=False, seq_end=False,
                    rescale=None, pad=0, raw=False, mark_entities=False,
-                   tokenizer='spacy', sentence_pad=0, one_hot=False):
+                   tokenizer='spacy', sentence_pad=0, one_hot=False,
+                   sentence_splitter='parser'):
         if not self.datafile:
             raise Exception('The dataset needs to be open before being used. '
                             'Please call dataset.open() before calling '
                             'dataset.next_batch()')
-        text, sentences, ratings_service, ratings_cleanliness, ratings_overall,\
-        ratings_value, ratings_sleep_quality, ratings_rooms, titles, helpful_votes,\
-        lengths = [], [], [], [], [], [], [], [], [], [], []
 
-        while len(text) < batch_size:
-            row = self.datafile.readline()
-            if row == '':
-                self._epochs_completed += 1
-                self.datafile.seek(0)
-                continue
-            json_obj = json.loads(row.strip())
-            text.append(datasets.tokenize(json_obj["text"], tokenizer))
-            lengths.append(len(text[-1]))
-            sentences.append(datasets.sentence_tokenizer((json_obj["text"])))
-            ratings_service.append(int(json_obj["ratings"]["service"])
-                                   if 'service' in json_obj['ratings']
-                                   else int(json_obj['ratings']['overall']))
-            ratings_cleanliness.append(int(json_obj["ratings"]["cleanliness"])
-                                       if 'cleanliness' in json_obj['ratings']
-                                       else int(json_obj['ratings']['overall']))
-            ratings_overall.append(int(json_obj["ratings"]["overall"]))
-            ratings_value.append(int(json_obj["ratings"]["value"])
-                                 if 'value' in json_obj['ratings']
-                                 else int(json_obj['ratings']['overall']))
-            ratings_sleep_quality.append(int(json_obj["ratings"]["sleep_quality"])
-                                         if 'sleep_quality' in json_obj['ratings']
-                                         else int(json_obj['ratings']['overall']))
-            ratings_rooms.append(int(json_obj["ratings"]["rooms"])
-                                 if 'rooms' in json_obj['ratings']
-                                 else int(json_obj['ratings']['overall']))
-            helpful_votes.append(json_obj["num_helpful_votes"])
-            titles.append(datasets.tokenize(json_obj["title"]))
-
-        if rescale is not None and one_hot == False:
-            ratings_service = datasets.rescale(ratings_service, rescale, [1.0, 5.0])
-            ratings_cleanliness = datasets.rescale(ratings_cleanliness, rescale,
-                                                   [1.0, 5.0])
-            ratings_overall = datasets.rescale(ratings_overall, rescale, [1.0, 5.0])
-            ratings_value = datasets.rescale(ratings_value, rescale, [1.0, 5.0])
-            ratings_sleep_quality = datasets.rescale(ratings_sleep_quality, rescale,
-                                                     [1.0, 5.0])
-            ratings_rooms = datasets.rescale(ratings_rooms, rescale, [1.0, 5.0])
-        elif rescale is None and one_hot == True:
-            ratings_service = to_categorical([x - 1 for x in ratings_service],
-                                             nb_classes=5)
-            ratings_cleanliness = to_categorical([x - 1 for x in ratings_cleanliness],
-                                                 nb_classes=5)
-            ratings_overall = to_categorical([x - 1 for x in ratings_overall],
-                                             nb_classes=5)
-            ratings_value = to_categorical([x - 1 for x in ratings_value],
-                                           nb_classes=5)
-            ratings_sleep_quality = to_categorical([x - 1 for x in ratings_sleep_quality],
-                                                   nb_classes=5)
-            ratings_rooms = to_categorical([x - 1 for x in ratings_rooms],
-                                           nb_classes=5)
-        elif rescale is None and one_hot == False:
-            pass
-        else:
-            raise ValueError('rescale and one_hot cannot be set together')
+        if self.use_cache and not raw and not mark_entities:
+            return self.next_cached_batch(batch_size, seq_begin, seq_end,
+                                          rescale, pad, tokenizer,
+                                          sentence_pad, one_hot,
+                                          sentence_splitter)
+
+        if self.use_metadata:
+            return self.next_metadata_batch(batch_size, seq_begin, seq_end,
+                                            rescale, pad, raw, mark_entities,
+                                            tokenizer, sentence_pad, one_hot,
+                                            sentence_splitter)
+
+        return self.batch_from_rows(
+                [self.next_row() for _ in range(batch_size)], seq_begin,
+                seq_end, rescale, pad, raw, mark_entities, tokenizer,
+                sentence_pad, one_hot, sentence_splitter)
+
+    def batch_from_rows(self, rows, seq_begin=False, seq_end=False,
+                        rescale=None, pad=0, raw=False, mark_entities=False,
+                        tokenizer='spacy', sentence_pad=0, one_hot=False,
+                        sentence_splitter='parser'):
+        """
+        Returns a `Batch` with the reviews in `rows`.
+        """
+        return self.batch_from_parsed(
+                self.parse_rows(rows, tokenizer, sentence_splitter),
+                seq_begin, seq_end, rescale, pad, raw, mark_entities,
+                sentence_pad, one_hot)
+
+    def next_metadata_batch(self, batch_size=64, seq_begin=False,
+                            seq_end=False, rescale=None, pad=0, raw=False,
+                            mark_entities=False, tokenizer='spacy',
+                            sentence_pad=0, one_hot=False,
+                            sentence_splitter='parser'):
+        metadata = self.review_metadata()
+        rows = metadata.valid_rows()
+        first, last = datasets.shard_bounds(len(rows), self.shard_index,
+                                            self.num_shards)
+        indices, self._metadata_position, n_wraps = datasets.next_indices(
+                                self._metadata_position, batch_size,
+                                last - first)
+        self._epochs_completed += n_wraps
+
+        return self.batch_from_parsed(
+                self.tokenize_reviews(metadata.reviews(rows[indices + first]),
+                                      tokenizer, sentence_splitter),
+                seq_begin, seq_end, rescale, pad, raw, mark_entities,
+                sentence_pad, one_hot)
+
+    def batch_from_parsed(self, parsed, seq_begin=False, seq_end=False,
+                          rescale=None, pad=0, raw=False, mark_entities=False,
+                          sentence_pad=0, one_hot=False):
+        """
+        Returns a `Batch` with the reviews tokenized in `parsed` (see
+        `tokenize_reviews`).
+        """
+        text, titles, sentences = \
+            parsed['text'], parsed['titles'], parsed['sentences']
+        lengths = [len(t) for t in text]
+        sentence_lengths = [[len(s) for s in document]
+                            for document in sentences]
 
         if mark_entities:
             text = datasets.mark_entities(text)
             titles = datasets.mark_entities(titles)
-            sentences = [datasets.mark_entities(sentence)
-                         for sentence in sentences]
-
-        if not raw:
-            text = datasets.seq2id(text[:batch_size], self.vocab_w2i, seq_begin,
-                                   seq_end)
-            titles = datasets.seq2id(titles[:batch_size], self.vocab_w2i,
-                                     seq_begin, seq_end)
-            sentences = [datasets.seq2id(sentence, self.vocab_w2i,
-                                         seq_begin, seq_end) for sentence in sentences[:batch_size]]
-        else:
-            text = datasets.append_seq_markers(text[:batch_size],
-                                               seq_begin, seq_end)
-            titles = datasets.append_seq_markers(titles[:batch_size],
-                                                 seq_begin, seq_end)
-            sentences = [datasets.append_seq_markers(sentence, seq_begin,
-                                                     seq_end) for sentence in sentences[:batch_size]]
-
-        if pad != 0:
-            text = datasets.padseq(text[:batch_size], pad, raw)
-            titles = datasets.padseq(titles[:batch_size], pad, raw)
-            sentences = [datasets.padseq(sentence, pad, raw) for sentence in
-                         sentences[:batch_size]]
-        if sentence_pad != 0:
-            sentences = [datasets.pad_sentences(sentence, pad, raw) for
-                         sentence in sentences[:batch_size]]
-
-        batch = self.Batch(text=text, sentences=sentences,
-                           ratings_service=ratings_service,
-                           ratings_cleanliness=ratings_cleanliness,
-                           ratings=ratings_overall,
-                           ratings_value=ratings_value,
-                           ratings_sleep_quality=ratings_sleep_quality,
-                           ratings_rooms=ratings_rooms,
-                           titles=titles, helpful_votes=helpful_votes, lengths=lengths)
-        return batch
+            sentences = datasets.mark_document_entities(sentences)
+
+        text = datasets.encode_sequences(text, self.vocab_w2i, pad, raw,
+                                         seq_begin, seq_end)
+        titles = datasets.encode_sequences(titles, self.vocab_w2i, pad, raw,
+                                           seq_begin, seq_end)
+        sentences = datasets.encode_documents(sentences, self.vocab_w2i, pad,
+                                              sentence_pad, raw, seq_begin,
+                                              seq_end)
+
+        return self.Batch(text=text, sentences=sentences, lengths=lengths,
+                          sentence_lengths=sentence_lengths, titles=titles,
+                          helpful_votes=parsed['helpful_votes'],
+                          **self.batch_ratings(parsed, rescale, one_hot))
+
+    def next_cached_batch(self, batch_size=64, seq_begin=False, seq_end=False,
+                          rescale=None, pad=0, tokenizer='spacy',
+                          sentence_pad=0, one_hot=False,
+                          sentence_splitter='parser'):
+        cache = self.corpus_cache(tokenizer, sentence_splitter)
+        first, last = datasets.shard_bounds(len(cache), self.shard_index,
+                                            self.num_shards)
+        indices, self._cache_position, n_wraps = datasets.next_indices(
+                                self._cache_position, batch_size,
+                                last - first)
+        indices += first
+        self._epochs_completed += n_wraps
+
+        begin_id = self.vocab_w2i['SEQ_BEGIN'] if seq_begin else None
+        end_id = self.vocab_w2i['SEQ_END'] if seq_end else None
+        parsed = {name: cache.labels(name, indices).tolist()
+                  for name in ['ratings_' + aspect
+                               for aspect in RATING_ASPECTS]}
+
+        return self.Batch(
+                text=cache.sequences('text', indices, pad, begin_id, end_id),
+                titles=cache.sequences('titles', indices, pad, begin_id,
+                                       end_id),
+                sentences=cache.documents('sentences', indices, pad,
+                                          sentence_pad, begin_id, end_id),
+                lengths=cache.lengths('text', indices).tolist(),
+                sentence_lengths=cache.document_lengths('sentences', indices),
+                helpful_votes=cache.labels('helpful_votes', indices).tolist(),
+                **self.batch_ratings(parsed, rescale, one_hot))
+
+    def batch_ratings(self, parsed, rescale=None, one_hot=False):
+        """
+        Returns the ratings fields of a batch from the ratings in `parsed`.
+        """
+        return {'ratings' if aspect == 'overall' else 'ratings_' + aspect:
+                convert_ratings(parsed['ratings_' + aspect], rescale, one_hot)
+                for aspect in RATING_ASPECTS}
 
     def set_vocab(self, vocab):
         self.vocab_w2i = vocab[0]
         self.vocab_i2w = vocab[1]
+        self._caches = {}
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def is_open(self):
+        return self.datafile is not None and not self.datafile.closed
+
+    def state_dict(self):
+        """
+        Returns the position of the split (the offset of its next line in
+        the file, the positions in the corpus cache and in the metadata, and
+        the number of epochs completed), to resume reading it from there
+        with `load_state_dict`, e.g. from a checkpoint.
+        """
+        return {'epochs_completed': self._epochs_completed,
+                'offset': self.datafile.tell() if self.is_open() else 0,
+                'cache_position': self._cache_position,
+                'metadata_position': self._metadata_position}
+
+    def load_state_dict(self, state):
+        """
+        Takes the split back to the position in `state` (see `state_dict`).
+        If the split is not open, it gets there when it is opened.
+        """
+        self._state = state
+        if self.is_open():
+            self.restore_state()
+
+    def restore_state(self):
+        if self._state is None:
+            return
+        self._epochs_completed = self._state['epochs_completed']
+        self.datafile.seek(self._state['offset'])
+        self._cache_position = self._state['cache_position']
+        self._metadata_position = self._state['metadata_position']
+        self._state = None
 
     @property
     def epochs_completed(self):
         return self._epochs_completed
 
 
-class DataSetBalanced(object):
-    def __init__(self, path_list, vocab,):
-
-        self.path_list = path_list
-        self._epochs_completed = 0
-        self.vocab_w2i = vocab[0]
-        self.vocab_i2w = vocab[1]
-        self.datafile = None
-
-        self.Batch = collections.namedtuple('Batch', ['text', 'lengths',
-                                                      'sentences', 'ratings_service', 'ratings_cleanliness',
-                                                      'ratings', 'ratings_value', 'ratings_sleep_quality',
-                                                      'ratings_rooms', 'titles', 'helpful_votes'])
+class DataSetBalanced(DataSet):
+    """
+    The training split with balanced ratings. `next_batch` draws the
+    reviews straight from the split with a `datasets.BalancedSampler` built
+    on the overall ratings of its `datasets.ReviewMetadata`: every rating is
+    drawn with the same probability, or with the ones in `class_weights`
+    (a dict from rating to weight). An epoch is `epoch_size` reviews, by
+    default as many reviews of each rating as the rarest one has.
+    """
+    def __init__(self, path, vocab, n_workers=0, shard_index=0,
+                 num_shards=1, class_weights=None, epoch_size=None,
+                 seed=None):
+        super(DataSetBalanced, self).__init__(path, vocab,
+                                              n_workers=n_workers,
+                                              shard_index=shard_index,
+                                              num_shards=num_shards)
+        self.class_weights = class_weights
+        self.epoch_size = epoch_size
+        self.seed = seed
+        self.sampler = None
+        self._sampler_rows = None
 
     def open(self):
-        self.datafile = open(self.path_list[0], 'r')
-
-    def close(self):
-        self.datafile.close()
+        # The sampler is built first, so that opening the split can restore
+        # its state
+        if self.sampler is None:
+            metadata = self.review_metadata()
+            rows = metadata.valid_rows()
+            first, last = datasets.shard_bounds(len(rows), self.shard_index,
+                                                self.num_shards)
+            self._sampler_rows = rows[first:last]
+            self.sampler = datasets.BalancedSampler(
+                    metadata.column('ratings_overall')[self._sampler_rows],
+                    self.class_weights, self.epoch_size, self.seed)
+        super(DataSetBalanced, self).open()
+
+    def state_dict(self):
+        """
+        Returns the state of the split (see `DataSet.state_dict`), with the
+        state of its sampler.
+        """
+        state = super(DataSetBalanced, self).state_dict()
+        state['sampler'] = None if self.sampler is None \
+            else self.sampler.state_dict()
+        return state
+
+    def restore_state(self):
+        if self._state is not None and self._state['sampler'] is not None:
+            self.sampler.load_state_dict(self._state['sampler'])
+        super(DataSetBalanced, self).restore_state()
 
     def next_batch(self, batch_size=64, seq_begin=False, seq_end=False,
                    rescale=None, pad=0, raw=False, mark_entities=False,
-                   tokenizer='spacy', sentence_pad=0, one_hot=False):
+                   tokenizer='spacy', sentence_pad=0, one_hot=False,
+                   sentence_splitter='parser'):
         if not self.datafile:
             raise Exception('The dataset needs to be open before being used. '
                             'Please call dataset.open() before calling '
                             'dataset.next_batch()')
-        text, sentences, ratings_service, ratings_cleanliness, \
-        ratings_overall, ratings_value, ratings_sleep_quality, ratings_rooms, \
-        titles, helpful_votes, lengths = [], [], [], [], [], [], [], [], [], [], []
 
-        while len(text) < batch_size:
-            row = self.datafile.readline()
-            if row == '':
-                self._epochs_completed += 1
-                self.close()
-                self.datafile = open(self.path_list[self.epochs_completed % len(self.path_list)])
-                continue
-            json_obj = json.loads(row.strip())
-            text.append(datasets.tokenize(json_obj["text"], tokenizer))
-            lengths.append(len(text[-1]))
-            sentences.append(datasets.sentence_tokenizer((json_obj["text"])))
-            ratings_service.append(int(json_obj["ratings"]["service"])
-                                   if 'service' in json_obj['ratings']
-                                   else int(json_obj['ratings']['overall']))
-            ratings_cleanliness.append(int(json_obj["ratings"]["cleanliness"])
-                                       if 'cleanliness' in json_obj['ratings']
-                                       else int(json_obj['ratings']['overall']))
-            ratings_overall.append(int(json_obj["ratings"]["overall"]))
-            ratings_value.append(int(json_obj["ratings"]["value"])
-                                 if 'value' in json_obj['ratings']
-                                 else int(json_obj['ratings']['overall']))
-            ratings_sleep_quality.append(int(json_obj["ratings"]["sleep_quality"])
-                                         if 'sleep_quality' in json_obj['ratings']
-                                         else int(json_obj['ratings']['overall']))
-            ratings_rooms.append(int(json_obj["ratings"]["rooms"])
-                                 if 'rooms' in json_obj['ratings']
-                                 else int(json_obj['ratings']['overall']))
-            helpful_votes.append(json_obj["num_helpful_votes"])
-            titles.append(datasets.tokenize(json_obj["title"]))
-
-        if rescale is not None and one_hot == False:
-            ratings_service = datasets.rescale(ratings_service, rescale, [1.0, 5.0])
-            ratings_cleanliness = datasets.rescale(ratings_cleanliness, rescale,
-                                                   [1.0, 5.0])
-            ratings_overall = datasets.rescale(ratings_overall, rescale, [1.0, 5.0])
-            ratings_value = datasets.rescale(ratings_value, rescale, [1.0, 5.0])
-            ratings_sleep_quality = datasets.rescale(ratings_sleep_quality, rescale,
-                                                     [1.0, 5.0])
-            ratings_rooms = datasets.rescale(ratings_rooms, rescale, [1.0, 5.0])
-        elif rescale is None and one_hot == True:
-            ratings_service = to_categorical([x - 1 for x in ratings_service],
-                                             nb_classes=5)
-            ratings_cleanliness = to_categorical([x - 1 for x in ratings_cleanliness],
-                                                 nb_classes=5)
-            ratings_overall = to_categorical([x - 1 for x in ratings_overall],
-                                             nb_classes=5)
-            ratings_value = to_categorical([x - 1 for x in ratings_value],
-                                           nb_classes=5)
-            ratings_sleep_quality = to_categorical([x - 1 for x in ratings_sleep_quality],
-                                                   nb_classes=5)
-            ratings_rooms = to_categorical([x - 1 for x in ratings_rooms],
-                                           nb_classes=5)
-        elif rescale is None and one_hot == False:
-            pass
-        else:
-            raise ValueError('rescale and one_hot cannot be set together')
-
-        if mark_entities:
-            text = datasets.mark_entities(text)
-            titles = datasets.mark_entities(titles)
-            sentences = [datasets.mark_entities(sentence)
-                         for sentence in sentences]
-
-        if not raw:
-            text = datasets.seq2id(text[:batch_size], self.vocab_w2i, seq_begin,
-                                   seq_end)
-            titles = datasets.seq2id(titles[:batch_size], self.vocab_w2i,
-                                     seq_begin, seq_end)
-            sentences = [datasets.seq2id(sentence, self.vocab_w2i,
-                                         seq_begin, seq_end) for sentence in sentences[:batch_size]]
-        else:
-            text = datasets.append_seq_markers(text[:batch_size],
-                                               seq_begin, seq_end)
-            titles = datasets.append_seq_markers(titles[:batch_size],
-                                                 seq_begin, seq_end)
-            sentences = [datasets.append_seq_markers(sentence, seq_begin,
-                                                     seq_end) for sentence in sentences[:batch_size]]
-
-        if pad != 0:
-            text = datasets.padseq(text[:batch_size], pad, raw)
-            titles = datasets.padseq(titles[:batch_size], pad, raw)
-            sentences = [datasets.padseq(sentence, pad, raw) for sentence in
-                         sentences[:batch_size]]
-        if sentence_pad != 0:
-            sentences = [datasets.pad_sentences(sentence, pad, raw) for
-                         sentence in sentences[:batch_size]]
-
-        batch = self.Batch(text=text, sentences=sentences,
-                           ratings_service=ratings_service,
-                           ratings_cleanliness=ratings_cleanliness,
-                           ratings=ratings_overall,
-                           ratings_value=ratings_value,
-                           ratings_sleep_quality=ratings_sleep_quality,
-                           ratings_rooms=ratings_rooms,
-                           titles=titles, helpful_votes=helpful_votes, lengths=lengths)
-        return batch
-
-    def set_vocab(self, vocab):
-        self.vocab_w2i = vocab[0]
-        self.vocab_i2w = vocab[1]
-
-    @property
-    def epochs_completed(self):
-        return self._epochs_completed
+        indices, n_epochs = self.sampler.next_indices(batch_size)
+        self._epochs_completed += n_epochs
+        reviews = self.review_metadata().reviews(self._sampler_rows[indices])
+        return self.batch_from_parsed(
+                self.tokenize_reviews(reviews, tokenizer, sentence_splitter),
+                seq_begin, seq_end, rescale, pad, raw, mark_entities,
+                sentence_pad, one_hot)
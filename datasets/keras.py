@@ -0,0 +1,66 @@
+import numpy as np
+
+from keras.utils import Sequence
+
+
+class SequenceAdapter(Sequence):
+    """
+    A `keras.utils.Sequence` over a split with a line index (TwitterEmotion,
+    HotelReviews, AmazonReviewsGerman and the STS family), so that
+    `fit_generator(workers=N, use_multiprocessing=True)` prepares the
+    batches in parallel while the model trains.
+
+    The batch `i` holds the lines in the `i`-th slice of `batch_size` of a
+    permutation of the split, read with `split.get_many`. It only depends
+    on `i` and the permutation, so any worker can make any batch. The
+    permutation is drawn again at the end of every epoch if `shuffle` is
+    True. Splits that are read per fold (TwitterEmotion) have to be open
+    with the fold to read. Splits with worker processes of their own
+    (`n_workers`) should not be used with `use_multiprocessing`.
+
+    Keyword arguments:
+    split      -- The split to read from, e.g. `te.train`.
+    batch_size -- Number of lines per batch. The last batch of an epoch may
+                  be smaller.
+    inputs     -- Name (or list of names) of the `Batch` fields given to the
+                  model as input, e.g. 'text'.
+    targets    -- Name (or list of names) of the `Batch` fields given to the
+                  model as targets, e.g. 'emotion'.
+    shuffle    -- If True, the lines are read in a new random order every
+                  epoch.
+    seed       -- Seed of the permutations.
+    kwargs     -- Passed to `split.get_many`, e.g. `pad` or `one_hot`.
+    """
+    def __init__(self, split, batch_size, inputs, targets, shuffle=True,
+                 seed=None, **kwargs):
+        self.split = split
+        self.batch_size = batch_size
+        self.inputs = inputs
+        self.targets = targets
+        self.shuffle = shuffle
+        self.kwargs = kwargs
+        self.random = np.random.RandomState(seed)
+        self.order = np.arange(len(split))
+        if self.shuffle:
+            self.random.shuffle(self.order)
+
+    def __len__(self):
+        return (len(self.order) + self.batch_size - 1) // self.batch_size
+
+    def fields(self, batch, names):
+        if isinstance(names, str):
+            return np.asarray(getattr(batch, names))
+        return [np.asarray(getattr(batch, name)) for name in names]
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError('Batch {} is out of range. There are {} '
+                             'batches'.format(i, len(self)))
+        indices = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+        batch = self.split.get_many(indices.tolist(), **self.kwargs)
+        return self.fields(batch, self.inputs), \
+            self.fields(batch, self.targets)
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random.shuffle(self.order)
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+
+
+# Size of the blocks read while looking for line breaks
+BLOCK_SIZE = 1 << 24
+
+
+def index_path(path):
+    """
+    Returns the path of the line index of the text file `path`.
+    """
+    return path + '.idx'
+
+
+def write_line_index(path):
+    """
+    Writes the line index of the text file `path`: a uint64 array with the
+    byte offset at which each line starts, followed by the size of the file
+    (so line `i` spans offsets[i]:offsets[i + 1]).
+    """
+    starts = [np.zeros(1, dtype=np.uint64)]
+    position = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if len(block) == 0:
+                break
+            breaks = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) ==
+                                    ord('\n'))
+            starts.append((breaks + position + 1).astype(np.uint64))
+            position += len(block)
+    offsets = np.concatenate(starts)
+    # A line break at the end of the file does not start another line
+    if offsets[-1] != position:
+        offsets = np.append(offsets, np.uint64(position))
+
+    tmp_path = '{}.{}.tmp'.format(index_path(path), os.getpid())
+    offsets.tofile(tmp_path)
+    os.replace(tmp_path, index_path(path))
+
+
+class LineIndex(object):
+    """
+    Random access to the lines of a text file through its line index (see
+    `write_line_index`), which is memory-mapped.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offsets = np.memmap(index_path(path), dtype=np.uint64, mode='r')
+        self.datafile = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def is_valid(self):
+        """
+        Returns False if `path` changed after its index was written.
+        """
+        return os.path.getsize(self.path) == int(self.offsets[-1]) and \
+            os.path.getmtime(self.path) <= \
+            os.path.getmtime(index_path(self.path))
+
+    def line(self, i):
+        """
+        Returns the line `i` (counting from 0), with its line break.
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError('Line {} is out of range. {} has {} lines'
+                             .format(i, self.path, len(self)))
+        if i < 0:
+            i += len(self)
+        if self.datafile is None:
+            self.datafile = open(self.path, 'rb')
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        # pread does not move the offset of the file, which threads and
+        # forked processes reading the same index share
+        return os.pread(self.datafile.fileno(), end - start,
+                        start).decode('utf-8')
+
+    def lines(self, indices):
+        """
+        Returns the lines `indices`, in that order. They are read in the
+        order in which they are in the file.
+        """
+        lines = {i: None for i in indices}
+        for i in sorted(lines):
+            lines[i] = self.line(i)
+        return [lines[i] for i in indices]
+
+    def close(self):
+        if self.datafile is not None:
+            self.datafile.close()
+            self.datafile = None
+
+
+def open_line_index(path):
+    """
+    Returns the `LineIndex` of the text file `path`, writing the index the
+    first time and whenever `path` changes.
+    """
+    if os.path.exists(index_path(path)):
+        line_index = LineIndex(path)
+        if line_index.is_valid():
+            return line_index
+        line_index.close()
+    write_line_index(path)
+    return LineIndex(path)
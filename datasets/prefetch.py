@@ -0,0 +1,123 @@
+import queue
+import threading
+
+
+class Prefetcher(object):
+    """
+    Prepares the batches of a split on a background thread, so that the
+    training loop does not wait while lines are read, parsed, tokenized and
+    encoded. Up to `depth` batches are kept ready in a queue.
+
+    `next_batch` returns the same batches, in the same order, as calling
+    `dataset.next_batch(**next_batch_kwargs)` directly would, and
+    `epochs_completed` is the number of epochs the split had completed
+    after producing the last batch returned (not the ones still in the
+    queue). If no `next_batch_kwargs` are given, the ones of the first call
+    to `next_batch` are used; all calls have to use the same ones, as the
+    batches are prepared before they are requested.
+
+    With `depth=0`, `next_batch` just calls `dataset.next_batch`, so that
+    templates can turn prefetching on and off with a single flag. Call
+    `close` before closing the split.
+
+    Likewise, `state_dict` returns the state of the split after the last
+    batch returned, so that training resumed with `load_state_dict` goes
+    on with the batch after it, not after the ones that were in the queue.
+    The split cannot be taken back to that batch afterwards, so its
+    `state_dict` is queued with every batch. It should only hold positions
+    and seeds, never copies of the data or of its order.
+    """
+    def __init__(self, dataset, depth=2, **next_batch_kwargs):
+        self.dataset = dataset
+        self.depth = depth
+        self.next_batch_kwargs = next_batch_kwargs or None
+        self._epochs_completed = dataset.epochs_completed
+        self._state = None
+        self.queue = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.queue = queue.Queue(maxsize=self.depth)
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+
+    def produce(self):
+        while not self.stopped.is_set():
+            try:
+                item = (self.dataset.next_batch(**self.next_batch_kwargs),
+                        self.dataset.epochs_completed, self.dataset_state(),
+                        None)
+            except Exception as e:
+                item = (None, None, None, e)
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if item[3] is not None:
+                return
+
+    def next_batch(self, **next_batch_kwargs):
+        if self.next_batch_kwargs is None:
+            self.next_batch_kwargs = next_batch_kwargs
+        elif next_batch_kwargs and next_batch_kwargs != self.next_batch_kwargs:
+            raise ValueError('A Prefetcher always produces batches with the '
+                             'same arguments: {}. {} was given'.format(
+                              self.next_batch_kwargs, next_batch_kwargs))
+
+        if self.depth == 0:
+            batch = self.dataset.next_batch(**self.next_batch_kwargs)
+            self._epochs_completed = self.dataset.epochs_completed
+            return batch
+
+        if self.thread is None:
+            self.start()
+        batch, epochs_completed, state, error = self.queue.get()
+        if error is not None:
+            self.thread = None
+            raise error
+        self._epochs_completed = epochs_completed
+        self._state = state
+        return batch
+
+    def dataset_state(self):
+        if hasattr(self.dataset, 'state_dict'):
+            return self.dataset.state_dict()
+        return None
+
+    def state_dict(self):
+        """
+        Returns the `state_dict` of the split after the last batch returned.
+        """
+        if self.depth == 0 or self._state is None:
+            return self.dataset.state_dict()
+        return self._state
+
+    def load_state_dict(self, state):
+        """
+        Discards the batches in the queue and restores the `state_dict` of
+        the split, so that the next batch is the one that followed it.
+        """
+        self.close()
+        self.dataset.load_state_dict(state)
+        self._epochs_completed = self.dataset.epochs_completed
+        self._state = None
+
+    def close(self):
+        """
+        Stops the background thread. The batches in the queue are
+        discarded.
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.queue = None
+
+    @property
+    def epochs_completed(self):
+        return self._epochs_completed
@@ -0,0 +1,127 @@
+import numpy as np
+
+import datasets
+
+
+class RaggedRows(object):
+    """
+    The rows of an in-memory split (lists with a string per column), with
+    their columns tokenized and encoded only once, into the IDs of the words
+    of all the rows one after the other (int32) and the offsets at which
+    each row starts (see `datasets.ragged_arrays`). Batches are gathered and
+    padded from these arrays, and the rows are shuffled by permuting
+    `order` instead of the rows themselves. Each `order` is the result of a
+    number of shuffles from `seed`, so the state of the rows is just these
+    two numbers.
+
+    A column is encoded the first time it is read with a tokenizer, so
+    creating the split stays cheap.
+
+    Keyword arguments:
+    rows               -- The rows of the split.
+    generate_sequences -- Takes a list of strings and a tokenizer, and
+                          returns the list of words of each string (e.g. the
+                          `generate_sequences` method of the split).
+    seed               -- Seed of the shuffles. None draws one.
+    """
+    def __init__(self, rows, generate_sequences, seed=None):
+        self.rows = rows
+        self.generate_sequences = generate_sequences
+        if seed is None:
+            seed = np.random.randint(2 ** 31)
+        self.seed = seed
+        self.random = np.random.RandomState(seed)
+        self.order = np.arange(len(rows))
+        self.shuffles = 0
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def next_indices(self, position, batch_size):
+        """
+        Returns the indices of the `batch_size` rows from `position` in
+        `order`, the position after them and whether the end of `order` was
+        passed. In that case `order` is shuffled before the rest of the
+        batch is taken from its beginning.
+        """
+        if position + batch_size <= len(self.order):
+            return self.order[position:position + batch_size].copy(), \
+                   position + batch_size, False
+
+        indices = self.order[position:].copy()
+        self.random.shuffle(self.order)
+        self.shuffles += 1
+        missing = batch_size - len(indices)
+        return np.concatenate([indices, self.order[:missing]]), missing, True
+
+    def state_dict(self):
+        """
+        Returns the seed and the number of shuffles of the current `order`.
+        It is a few numbers rather than a copy of `order`, so it is cheap to
+        take after every batch.
+        """
+        return {'seed': self.seed, 'shuffles': self.shuffles,
+                'rows': len(self.rows)}
+
+    def load_state_dict(self, state):
+        """
+        Rebuilds the `order` and random generator of a `state_dict` by
+        shuffling again from its seed.
+        """
+        if state['rows'] != len(self.rows):
+            raise ValueError('The state is of a split of {} rows. This one '
+                             'has {}'.format(state['rows'], len(self.rows)))
+        self.seed = state['seed']
+        self.random = np.random.RandomState(self.seed)
+        self.order = np.arange(len(self.rows))
+        for _ in range(state['shuffles']):
+            self.random.shuffle(self.order)
+        self.shuffles = state['shuffles']
+
+    def column(self, i, tokenizer, w2i):
+        """
+        Returns the IDs of the words of the column `i` of all the rows and
+        their offsets, tokenizing and encoding the column the first time.
+        """
+        if (i, tokenizer) not in self._columns:
+            sequences = self.generate_sequences([row[i] for row in self.rows],
+                                                tokenizer)
+            self._columns[(i, tokenizer)] = datasets.ragged_arrays(sequences,
+                                                                   w2i)
+        return self._columns[(i, tokenizer)]
+
+    def forget(self, i=None):
+        """
+        Drops the encoded column `i` (by default, all of them), e.g. because
+        its vocabulary changed.
+        """
+        for key in list(self._columns):
+            if i is None or key[0] == i:
+                del self._columns[key]
+
+    def lengths(self, i, indices, tokenizer, w2i, pad=0):
+        """
+        Returns the number of words of the column `i` in the rows `indices`,
+        at most `pad` if it is not 0.
+        """
+        _, offsets = self.column(i, tokenizer, w2i)
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = offsets[indices + 1] - offsets[indices]
+        if pad != 0:
+            lengths = np.minimum(lengths, pad)
+        return lengths.tolist()
+
+    def sequences(self, i, indices, tokenizer, w2i, pad=0):
+        """
+        Returns the column `i` of the rows `indices` as
+        `datasets.encode_sequences` would: lists of IDs if `pad` is 0, else
+        an int32 matrix.
+        """
+        tokens, offsets = self.column(i, tokenizer, w2i)
+        indices = np.asarray(indices, dtype=np.int64)
+        ids, lengths = datasets.pad_ragged(tokens, offsets[indices],
+                                           offsets[indices + 1], pad)
+        if pad == 0:
+            return [row[:length].tolist() for row, length in zip(ids, lengths)]
+        return ids
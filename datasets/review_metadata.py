@@ -0,0 +1,214 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+import datasets
+
+
+# Version of the layout of the metadata directories. Directories of other
+# versions are rebuilt
+FORMAT_VERSION = 2
+
+
+def string_span(line, line_start, value):
+    """
+    Returns the (byte offset, length) of the JSON literal of the string
+    `value` in `line`, a line of the split that starts at `line_start`. If
+    the literal is escaped differently than `json.dumps` would, the length
+    is that of the whole line and negative, meaning that the line has to
+    be decoded again to read `value`.
+    """
+    if len(value) == 0:
+        return line_start, 0
+    for literal in [json.dumps(value), json.dumps(value, ensure_ascii=False)]:
+        position = line.find(literal.encode('utf-8'))
+        if position >= 0:
+            return line_start + position, len(literal.encode('utf-8'))
+    return line_start, -len(line)
+
+
+def build_review_metadata(directory, path, read_review, columns,
+                          text_columns):
+    """
+    Decodes each line of the file `path` once and stores the reviews in
+    `directory` column by column:
+
+     * each numeric column in `columns` (a dict with the name of the NumPy
+       dtype of each one), e.g. the ratings, in <name>.npy
+     * for each string column in `text_columns`, e.g. the titles, where its
+       value is in `path`: <name>_spans.npy holds the byte offset and the
+       length of its JSON literal in each line (see `string_span`). The
+       text itself is not copied
+     * valid.npy, False for the lines that are not JSON or that
+       `read_review` cannot read (a ValueError or KeyError). Their line
+       numbers are printed, and any other error is raised
+
+    `read_review` takes the decoded JSON object of a line and returns a dict
+    with a value for each column. Row `i` is line `i` of `path`.
+    """
+    # Written to a temporary directory first, so that an interrupted build
+    # is never taken for a complete one
+    tmp_directory = '{}.{}.tmp'.format(directory, os.getpid())
+    os.makedirs(tmp_directory)
+    values = {name: [] for name in columns}
+    spans = {name: [] for name in text_columns}
+    valid = []
+    skipped = []
+    line_start = 0
+    try:
+        with open(path, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                # Only lines that are not a review in the expected format are
+                # skipped. Any other error stops the build
+                try:
+                    review = read_review(json.loads(line.decode('utf-8')))
+                except (ValueError, KeyError):
+                    review = None
+                    skipped.append(line_number)
+                valid.append(review is not None)
+                for name in columns:
+                    values[name].append(0 if review is None else review[name])
+                for name in text_columns:
+                    spans[name].append((line_start, 0) if review is None else
+                                       string_span(line, line_start,
+                                                   review[name]))
+                line_start += len(line)
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+
+    for name in text_columns:
+        np.save(os.path.join(tmp_directory, name + '_spans'),
+                np.array(spans[name], dtype=np.int64).reshape(-1, 2))
+    for name, dtype in columns.items():
+        np.save(os.path.join(tmp_directory, name),
+                np.array(values[name], dtype=dtype))
+    np.save(os.path.join(tmp_directory, 'valid'), np.array(valid, dtype=bool))
+    if len(skipped) > 0:
+        print('Skipped {} invalid lines of {}: {}{}'.format(
+              len(skipped), path, ', '.join(str(n) for n in skipped[:10]),
+              ', ...' if len(skipped) > 10 else ''))
+    return tmp_directory, len(valid)
+
+
+class ReviewMetadata(object):
+    """
+    The reviews of a split decoded once (see `build_review_metadata`), with
+    each column memory-mapped. Reading the ratings of the whole split is
+    then a matter of loading one small array, and the text of a review is
+    read from the split without decoding its whole JSON line again.
+    `read_review` is only needed for the few values whose literal could not
+    be found in their line.
+    """
+    def __init__(self, directory, path, read_review=None):
+        self.directory = directory
+        self.path = path
+        self.read_review = read_review
+        with open(os.path.join(directory, 'key.json'), 'r') as kf:
+            self.key = json.load(kf)
+        self.n_rows = self.key['n_rows']
+        self.arrays = {}
+        for name in list(self.key['columns']) + ['valid']:
+            self.arrays[name] = np.load(os.path.join(directory, name + '.npy'),
+                                        mmap_mode='r')
+        for name in self.key['text_columns']:
+            self.arrays[name + '_spans'] = np.load(
+                    os.path.join(directory, name + '_spans.npy'),
+                    mmap_mode='r')
+        self.datafile = None
+        self._valid_rows = None
+
+    def __len__(self):
+        return self.n_rows
+
+    def column(self, name):
+        """
+        Returns the (memory-mapped) array of the numeric column `name`, with
+        one value per line of the split.
+        """
+        return self.arrays[name]
+
+    def valid_rows(self):
+        """
+        Returns the indices of the rows whose line could be read.
+        """
+        if self._valid_rows is None:
+            self._valid_rows = np.flatnonzero(self.arrays['valid'])
+        return self._valid_rows
+
+    def read(self, offset, length):
+        if self.datafile is None:
+            self.datafile = open(self.path, 'rb')
+        # pread does not move the offset of the file, which forked
+        # processes share
+        return os.pread(self.datafile.fileno(), length, offset)
+
+    def strings(self, name, indices):
+        """
+        Returns the values of the string column `name` for the rows
+        `indices`, read from the split.
+        """
+        spans = self.arrays[name + '_spans']
+        strings = []
+        for i in indices:
+            offset, length = int(spans[i][0]), int(spans[i][1])
+            if length == 0:
+                strings.append('')
+            elif length > 0:
+                strings.append(json.loads(
+                        self.read(offset, length).decode('utf-8')))
+            else:
+                line = self.read(offset, -length).decode('utf-8')
+                strings.append(self.read_review(json.loads(line))[name])
+        return strings
+
+    def reviews(self, indices):
+        """
+        Returns the rows `indices` as the dicts `read_review` made them from.
+        """
+        values = {name: self.arrays[name][indices].tolist()
+                  for name in self.key['columns']}
+        for name in self.key['text_columns']:
+            values[name] = self.strings(name, indices)
+        return [{name: values[name][i] for name in values}
+                for i in range(len(indices))]
+
+    def close(self):
+        if self.datafile is not None:
+            self.datafile.close()
+            self.datafile = None
+
+
+def review_metadata(path, read_review, columns, text_columns):
+    """
+    Returns the `ReviewMetadata` of the split in the file `path`, building
+    it if it does not exist yet or if `path` or the columns changed since
+    it was built. It is kept in the directory `path` + '.metadata'.
+    """
+    key = {'version': FORMAT_VERSION,
+           'source': datasets.file_digest(path),
+           'columns': columns,
+           'text_columns': text_columns}
+    directory = path + '.metadata'
+    key_path = os.path.join(directory, 'key.json')
+    if os.path.exists(key_path):
+        with open(key_path, 'r') as kf:
+            old_key = json.load(kf)
+        if all(old_key.get(k) == key[k] for k in key):
+            return ReviewMetadata(directory, path, read_review)
+
+    print('Building the review metadata of {}'.format(path))
+    tmp_directory, key['n_rows'] = build_review_metadata(
+            directory, path, read_review, columns, text_columns)
+    with open(os.path.join(tmp_directory, 'key.json'), 'w') as kf:
+        json.dump(key, kf)
+    if os.path.exists(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another process finished the same metadata first
+        shutil.rmtree(tmp_directory)
+    return ReviewMetadata(directory, path, read_review)
@@ -0,0 +1,63 @@
+import os
+
+import datasets
+
+
+class ShardedFile(object):
+    """
+    One of the `num_shards` byte ranges of the text file `path` (see
+    `datasets.byte_range_shards`), read as if it were the whole file: it
+    holds the lines that start in the range, `readline` returns '' after
+    the last of them, and `tell` and `seek` count the offsets from the
+    beginning of the shard, so `seek(0)` goes back to its first line. This
+    is what the streaming `DataSet`s use to read only their shard of a
+    split.
+    """
+    def __init__(self, path, shard_index, num_shards):
+        start, end = datasets.shard_bounds(os.path.getsize(path),
+                                           shard_index, num_shards)
+        self.path = path
+        self.end = end
+        self.datafile = open(path, 'rb')
+        if start > 0:
+            # Same alignment as `datasets.read_byte_range`
+            self.datafile.seek(start - 1)
+            self.datafile.readline()
+        self.begin = self.datafile.tell()
+        if self.begin >= self.end:
+            self.datafile.close()
+            raise ValueError('Shard {} of {} of {} holds no line. Please '
+                             'use fewer shards'.format(shard_index,
+                                                       num_shards, path))
+
+    def readline(self):
+        if self.datafile.tell() >= self.end:
+            return ''
+        return self.datafile.readline().decode('utf-8')
+
+    def tell(self):
+        return self.datafile.tell() - self.begin
+
+    def seek(self, offset):
+        if not 0 <= offset <= self.end - self.begin:
+            raise ValueError('Offset {} is out of the shard, which has {} '
+                             'bytes'.format(offset, self.end - self.begin))
+        self.datafile.seek(self.begin + offset)
+
+    def close(self):
+        self.datafile.close()
+
+    @property
+    def closed(self):
+        return self.datafile.closed
+
+
+def open_shard(path, shard_index=0, num_shards=1):
+    """
+    Opens the text file `path` for reading, or only its shard `shard_index`
+    of `num_shards` (a `ShardedFile`).
+    """
+    datasets.validate_shard(shard_index, num_shards)
+    if num_shards == 1:
+        return open(path, 'r')
+    return ShardedFile(path, shard_index, num_shards)
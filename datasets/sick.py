@@ -3,5 +3,7 @@ from datasets.sts import STS
 
 class Sick(STS):
     def __init__(self, train_validation_split=None, test_split=None,
-                 use_defaults=True, name='sick'):
-        super().__init__(subset=name)
+                 use_defaults=True, name='sick', shard_index=0,
+                 num_shards=1):
+        super().__init__(subset=name, shard_index=shard_index,
+                         num_shards=num_shards)
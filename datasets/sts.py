@@ -5,7 +5,8 @@ import collections
 
 class STS(object):
     def __init__(self, train_validation_split=None, test_split=None,
-                 use_defaults=True, subset='sts_small'):
+                 use_defaults=True, subset='sts_small', shard_index=0,
+                 num_shards=1):
         if train_validation_split is not None or test_split is not None or \
                 use_defaults is False:
             raise NotImplementedError('This Dataset does not implement '
@@ -34,9 +35,12 @@ class STS(object):
         self.w2v = datasets.load_w2v(self.w2v_path)
 
         self.vocab_size = len(self.w2i)
-        self.train = DataSet(self.train_path, (self.w2i, self.i2w))
-        self.validation = DataSet(self.validation_path, (self.w2i, self.i2w))
-        self.test = DataSet(self.test_path, (self.w2i, self.i2w))
+        self.train = DataSet(self.train_path, (self.w2i, self.i2w),
+                             shard_index, num_shards)
+        self.validation = DataSet(self.validation_path, (self.w2i, self.i2w),
+                                  shard_index, num_shards)
+        self.test = DataSet(self.test_path, (self.w2i, self.i2w), shard_index,
+                            num_shards)
         self.__refresh(load_w2v=False)
 
     def create_vocabulary(self, min_frequency=5, tokenizer='spacy',
@@ -60,21 +64,104 @@ class STS(object):
 
 
 class DataSet(object):
-    def __init__(self, path, vocab):
+    def __init__(self, path, vocab, shard_index=0, num_shards=1):
 
         self.path = path
+        self.shards_path = path + '.shards'
+        self.pairs_path = path + '.pairs'
         self._epochs_completed = 0
         self.vocab_w2i = vocab[0]
         self.vocab_i2w = vocab[1]
         self.datafile = None
+        self._line_index = None
+        # State taken back to when the split is opened (see
+        # `load_state_dict`)
+        self._state = None
+
+        # `next_batch` only reads the shard `shard_index` of the
+        # `num_shards` byte ranges of the file (see `datasets.ShardedFile`),
+        # and an epoch is a pass over that shard. `get`, `get_many` and
+        # `len` still refer to the whole file.
+        datasets.validate_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
 
         self.Batch = collections.namedtuple('Batch', ['s1', 's2', 'sim'])
 
     def open(self):
-        self.datafile = open(self.path, 'r')
+        self.datafile = datasets.open_shard(self.path, self.shard_index,
+                                            self.num_shards)
+        self.restore_state()
 
     def close(self):
         self.datafile.close()
+        if self._line_index is not None:
+            self._line_index.close()
+            self._line_index = None
+
+    def line_index(self):
+        """
+        Returns the `datasets.LineIndex` of the split.
+        """
+        if self._line_index is None:
+            self._line_index = datasets.open_line_index(self.path)
+        return self._line_index
+
+    def __len__(self):
+        return len(self.line_index())
+
+    def get(self, i, **kwargs):
+        """
+        Returns a `Batch` with the pair in line `i`. `kwargs` are the ones of
+        `next_batch` (but `batch_size`).
+        """
+        return self.get_many([i], **kwargs)
+
+    def get_many(self, indices, **kwargs):
+        """
+        Returns a `Batch` with the pairs in the lines `indices`, in that
+        order. `kwargs` are the ones of `next_batch` (but `batch_size`).
+        """
+        return self.batch_from_rows(self.line_index().lines(indices),
+                                    **kwargs)
+
+    def open_shards(self):
+        """
+        Returns a `datasets.STSShards` that reads the split from the binary
+        shards written by `tools/sts_shards.py`. Raises a ValueError if they
+        do not exist or were written from other contents of the split or
+        with another vocabulary.
+        """
+        if not os.path.exists(self.shards_path):
+            raise ValueError('{} has not been converted to shards. Please '
+                             'run tools/sts_shards.py'.format(self.path))
+        shards = datasets.STSShards(self.shards_path,
+                                    self.vocab_w2i.get('SEQ_BEGIN'),
+                                    self.vocab_w2i.get('SEQ_END'))
+        if not shards.is_valid(self.path, self.vocab_w2i):
+            raise ValueError('The shards in {} are out of date. Please run '
+                             'tools/sts_shards.py again'
+                             .format(self.shards_path))
+        return shards
+
+    def open_pairs(self):
+        """
+        Returns a `datasets.STSPairs` that reads the split from the table of
+        distinct sentences written by `tools/sts_shards.py --pairs`. Raises
+        a ValueError if it does not exist or was written from other contents
+        of the split or with another vocabulary.
+        """
+        if not os.path.exists(self.pairs_path):
+            raise ValueError('{} has not been converted to pairs. Please run '
+                             'tools/sts_shards.py --pairs'.format(self.path))
+        pairs = datasets.STSPairs(self.pairs_path,
+                                  self.vocab_w2i.get('SEQ_BEGIN'),
+                                  self.vocab_w2i.get('SEQ_END'))
+        if not pairs.is_valid(self.path, self.vocab_w2i):
+            raise ValueError('The pairs in {} are out of date. Please run '
+                             'tools/sts_shards.py --pairs again'
+                             .format(self.pairs_path))
+        return pairs
 
     def remove_entities(self, data):
         entities = ['PERSON' , 'NORP' , 'FACILITY' , 'ORG' , 'GPE' , 'LOC' +
@@ -96,16 +183,26 @@ class DataSet(object):
             raise Exception('The dataset needs to be open before being used. '
                             'Please call dataset.open() before calling '
                             'dataset.next_batch()')
-        datasets.validate_rescale(rescale)
-
-        s1s, s2s, sims = [], [], []
 
-        while len(s1s) < batch_size:
+        rows = []
+        while len(rows) < batch_size:
             row = self.datafile.readline()
             if row == '':
                 self._epochs_completed += 1
                 self.datafile.seek(0)
                 continue
+            rows.append(row)
+        return self.batch_from_rows(rows, seq_begin, seq_end, rescale, pad,
+                                    raw, keep_entities)
+
+    def batch_from_rows(self, rows, seq_begin=False, seq_end=False,
+                        rescale=(0.0, 1.0), pad=0, raw=False,
+                        keep_entities=False):
+        datasets.validate_rescale(rescale)
+
+        s1s, s2s, sims = [], [], []
+
+        for row in rows:
             cols = row.strip().split('\t')
             s1, s2, sim = cols[0], cols[1], float(cols[2])
             s1, s2 = s1.split(' '), s2.split(' ')
@@ -120,27 +217,56 @@ class DataSet(object):
             s1s = self.remove_entities(s1s)
             s2s = self.remove_entities(s2s)
 
-        if not raw:
-            s1s = datasets.seq2id(s1s[:batch_size], self.vocab_w2i, seq_begin,
-                                  seq_end)
-            s2s = datasets.seq2id(s2s[:batch_size], self.vocab_w2i, seq_begin,
-                                  seq_end)
-        else:
-            s1s = datasets.append_seq_markers(s1s[:batch_size], seq_begin, seq_end)
-            s2s = datasets.append_seq_markers(s2s[:batch_size], seq_begin, seq_end)
-        if pad != 0:
-            s1s = datasets.padseq(s1s, pad, raw)
-            s2s = datasets.padseq(s2s, pad, raw)
+        s1s = datasets.encode_sequences(s1s, self.vocab_w2i, pad, raw,
+                                        seq_begin, seq_end)
+        s2s = datasets.encode_sequences(s2s, self.vocab_w2i, pad, raw,
+                                        seq_begin, seq_end)
         batch = self.Batch(
             s1=s1s,
             s2=s2s,
-            sim=datasets.rescale(sims[:batch_size], rescale, (0.0, 1.0)))
+            sim=datasets.rescale(sims, rescale, (0.0, 1.0)))
         return batch
 
     def set_vocab(self, vocab):
         self.vocab_w2i = vocab[0]
         self.vocab_i2w = vocab[1]
 
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def is_open(self):
+        return self.datafile is not None and not self.datafile.closed
+
+    def state_dict(self):
+        """
+        Returns the position of the split (the offset of its next line in
+        the file and the number of epochs completed), to resume reading it
+        from there with `load_state_dict`, e.g. from a checkpoint.
+        """
+        return {'epochs_completed': self._epochs_completed,
+                'offset': self.datafile.tell() if self.is_open() else 0}
+
+    def load_state_dict(self, state):
+        """
+        Takes the split back to the position in `state` (see `state_dict`).
+        If the split is not open, it gets there when it is opened.
+        """
+        self._state = state
+        if self.is_open():
+            self.restore_state()
+
+    def restore_state(self):
+        if self._state is None:
+            return
+        self._epochs_completed = self._state['epochs_completed']
+        self.datafile.seek(self._state['offset'])
+        self._state = None
+
     @property
     def epochs_completed(self):
         return self._epochs_completed
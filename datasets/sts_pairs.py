@@ -0,0 +1,203 @@
+import os
+import json
+import shutil
+import collections
+
+import numpy as np
+
+import datasets
+from datasets.corpus_cache import vocabulary_digest
+from datasets.sts_shards import read_pairs
+
+
+# Arrays stored for a split: the IDs of the words of each distinct sentence
+# one after the other, the offsets at which each of them starts (plus the
+# end of the last one), and for each pair the index of its s1 and s2 in the
+# sentences and its similarity
+PAIR_ARRAYS = {'sentence_tokens': np.int32, 'sentence_offsets': np.int64,
+               's1_idx': np.int32, 's2_idx': np.int32, 'sims': np.float32}
+
+FORMAT_VERSION = 1
+
+
+def write_sts_pairs(split, directory, keep_entities=False):
+    """
+    Converts the STS `split` (a `datasets.sts.DataSet`) into a table of its
+    distinct sentences, encoded once, and the pairs as indices into it. The
+    sentences that appear in many pairs (e.g. the questions of Quora) are
+    only stored once. The arrays (see `PAIR_ARRAYS`) are written to
+    `directory`, together with a meta.json that records the contents of the
+    split and the vocabulary they were made from.
+    """
+    sentence_ids = {}
+    sentences, s1_idx, s2_idx, sims = [], [], [], []
+
+    def sentence_id(sentence):
+        sentence = tuple(sentence)
+        if sentence not in sentence_ids:
+            sentence_ids[sentence] = len(sentences)
+            sentences.append(sentence)
+        return sentence_ids[sentence]
+
+    for s1, s2, sim in read_pairs(split, keep_entities):
+        s1_idx.append(sentence_id(s1))
+        s2_idx.append(sentence_id(s2))
+        sims.append(sim)
+
+    arrays = {'s1_idx': s1_idx, 's2_idx': s2_idx, 'sims': sims}
+    arrays = {name: np.asarray(values, dtype=PAIR_ARRAYS[name])
+              for name, values in arrays.items()}
+    arrays['sentence_tokens'], arrays['sentence_offsets'] = \
+        datasets.ragged_arrays(sentences, split.vocab_w2i)
+
+    tmp_directory = '{}.{}.tmp'.format(directory, os.getpid())
+    os.makedirs(tmp_directory)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_directory, name), array)
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as mf:
+        json.dump({'version': FORMAT_VERSION,
+                   'source': datasets.file_digest(split.path),
+                   'vocabulary': vocabulary_digest(split.vocab_w2i),
+                   'keep_entities': keep_entities,
+                   'n_rows': len(sims),
+                   'n_sentences': len(sentences)}, mf)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(tmp_directory, directory)
+
+
+class STSPairs(object):
+    """
+    Reads the pairs of an STS split converted with `write_sts_pairs`. The
+    arrays are memory-mapped, and the sentences of a batch are gathered from
+    the table of distinct sentences, so each of them is only encoded and
+    stored once however many pairs it is part of.
+
+    Like `datasets.STSShards`, the pairs are read in order, and
+    `epochs_completed` counts how many times the split has been read.
+    `begin_id` and `end_id` are the IDs of 'SEQ_BEGIN' and 'SEQ_END' in the
+    vocabulary, needed if `next_batch` is asked to add them.
+    """
+    def __init__(self, directory, begin_id=None, end_id=None):
+        self.directory = directory
+        self.begin_id = begin_id
+        self.end_id = end_id
+        with open(os.path.join(directory, 'meta.json'), 'r') as mf:
+            self.meta = json.load(mf)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError('{} was written with version {} of the STS '
+                             'pair format. Please convert the split again'
+                             .format(directory, self.meta['version']))
+        self.arrays = {name: np.load(os.path.join(directory, name + '.npy'),
+                                     mmap_mode='r')
+                       for name in PAIR_ARRAYS}
+        self.position = 0
+        self._epochs_completed = 0
+
+        self.Batch = collections.namedtuple('Batch', ['s1', 's2', 'sim',
+                                                      's1_lengths',
+                                                      's2_lengths'])
+        # The distinct sentences of a batch, and the position of the s1 and
+        # s2 of each pair among them
+        self.UniqueBatch = collections.namedtuple('UniqueBatch',
+                                                  ['sentences', 'lengths',
+                                                   's1_idx', 's2_idx', 'sim'])
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def is_valid(self, path, w2i):
+        """
+        Returns False if the text split `path` or the vocabulary `w2i`
+        changed after the pairs were written.
+        """
+        return self.meta['source'] == datasets.file_digest(path) and \
+            self.meta['vocabulary'] == vocabulary_digest(w2i)
+
+    def sentences(self, ids, pad=0, begin_id=None, end_id=None):
+        """
+        Returns the sentences `ids` of the table: a list of int32 arrays if
+        `pad` is 0 (and no sequence markers are added), else an int32
+        matrix.
+        """
+        tokens = self.arrays['sentence_tokens']
+        offsets = self.arrays['sentence_offsets']
+        ids = np.asarray(ids, dtype=np.int64)
+        if pad == 0 and begin_id is None and end_id is None:
+            return [tokens[offsets[i]:offsets[i + 1]] for i in ids]
+        return datasets.pad_ragged(tokens, offsets[ids], offsets[ids + 1],
+                                   pad, begin_id, end_id)[0]
+
+    def lengths(self, ids):
+        offsets = self.arrays['sentence_offsets']
+        ids = np.asarray(ids, dtype=np.int64)
+        return offsets[ids + 1] - offsets[ids]
+
+    def next_batch(self, batch_size=64, seq_begin=False, seq_end=False,
+                   rescale=(0.0, 1.0), pad=0, unique=False):
+        """
+        Returns the next `batch_size` pairs, as `datasets.STSShards` does.
+
+        If `unique` is True, returns an `UniqueBatch` instead: `sentences`
+        holds each distinct sentence of the batch once (with its `lengths`),
+        and `s1_idx` and `s2_idx` give the row of `sentences` of the s1 and
+        s2 of each pair. A siamese encoder can then encode `sentences` and
+        gather the encodings of both sides (e.g. with `tf.gather`), instead
+        of encoding the same sentence once per pair it is part of.
+        """
+        datasets.validate_rescale(rescale)
+        if (seq_begin and self.begin_id is None) or \
+                (seq_end and self.end_id is None):
+            raise ValueError('begin_id and end_id are needed to add '
+                             'sequence markers')
+        begin_id = self.begin_id if seq_begin else None
+        end_id = self.end_id if seq_end else None
+
+        indices, self.position, n_wraps = datasets.next_indices(
+                                    self.position, batch_size, len(self))
+        self._epochs_completed += n_wraps
+
+        s1_ids = self.arrays['s1_idx'][indices]
+        s2_ids = self.arrays['s2_idx'][indices]
+        sims = self.arrays['sims'][indices]
+        if tuple(rescale) != (0.0, 1.0):
+            sims = sims * (rescale[1] - rescale[0]) + rescale[0]
+
+        if unique:
+            ids, positions = np.unique(np.concatenate([s1_ids, s2_ids]),
+                                       return_inverse=True)
+            positions = positions.astype(np.int32)
+            return self.UniqueBatch(
+                    sentences=self.sentences(ids, pad, begin_id, end_id),
+                    lengths=self.lengths(ids),
+                    s1_idx=positions[:len(indices)],
+                    s2_idx=positions[len(indices):], sim=sims)
+
+        return self.Batch(s1=self.sentences(s1_ids, pad, begin_id, end_id),
+                          s2=self.sentences(s2_ids, pad, begin_id, end_id),
+                          sim=sims, s1_lengths=self.lengths(s1_ids),
+                          s2_lengths=self.lengths(s2_ids))
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def state_dict(self):
+        """
+        Returns the position of the split and the number of epochs
+        completed, to resume reading it from there with `load_state_dict`.
+        """
+        return {'position': self.position,
+                'epochs_completed': self._epochs_completed}
+
+    def load_state_dict(self, state):
+        self.position = state['position']
+        self._epochs_completed = state['epochs_completed']
+
+    @property
+    def epochs_completed(self):
+        return self._epochs_completed
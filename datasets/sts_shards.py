@@ -0,0 +1,231 @@
+import os
+import json
+import shutil
+import itertools
+import collections
+
+import numpy as np
+
+import datasets
+from datasets.corpus_cache import vocabulary_digest
+
+
+# Arrays stored in each shard: the IDs of the words of all the s1 (and s2)
+# sentences one after the other, the offsets at which each sentence starts
+# (plus the end of the last one) and the similarity of each pair
+SHARD_ARRAYS = {'s1_tokens': np.int32, 's1_offsets': np.int64,
+                's2_tokens': np.int32, 's2_offsets': np.int64,
+                'sims': np.float32}
+
+FORMAT_VERSION = 1
+
+
+def shard_name(i):
+    return 'shard_{:05d}'.format(i)
+
+
+def read_pairs(split, keep_entities=False, chunk_size=10000):
+    """
+    Yields the (s1, s2, sim) pairs of the STS `split` (a
+    `datasets.sts.DataSet`), parsed as `split.next_batch` parses them.
+    """
+    with open(split.path, 'r') as f:
+        rows = []
+        for row in itertools.chain(f, [None]):
+            if row is not None:
+                rows.append(row)
+                if len(rows) < chunk_size:
+                    continue
+            batch = split.batch_from_rows(rows, raw=True,
+                                          keep_entities=keep_entities)
+            for pair in zip(batch.s1, batch.s2, batch.sim):
+                yield pair
+            rows = []
+
+
+def write_sts_shards(split, directory, rows_per_shard=100000,
+                     keep_entities=False):
+    """
+    Converts the STS `split` (a `datasets.sts.DataSet`) into binary shards
+    of `rows_per_shard` pairs each (the last one can have fewer), written to
+    `directory`. Each shard is a directory with one .npy file per array in
+    `SHARD_ARRAYS`, holding the pairs already parsed (see `read_pairs`) and
+    encoded with the vocabulary of `split`. `directory` is replaced if it
+    exists.
+    """
+    tmp_directory = '{}.{}.tmp'.format(directory, os.getpid())
+    os.makedirs(tmp_directory)
+
+    n_shards, n_rows = 0, 0
+    pairs = read_pairs(split, keep_entities)
+    while True:
+        shard = list(itertools.islice(pairs, rows_per_shard))
+        if len(shard) == 0:
+            break
+        s1s, s2s, sims = zip(*shard)
+        arrays = {'sims': np.asarray(sims, dtype=np.float32)}
+        arrays['s1_tokens'], arrays['s1_offsets'] = \
+            datasets.ragged_arrays(s1s, split.vocab_w2i)
+        arrays['s2_tokens'], arrays['s2_offsets'] = \
+            datasets.ragged_arrays(s2s, split.vocab_w2i)
+
+        shard_directory = os.path.join(tmp_directory, shard_name(n_shards))
+        os.makedirs(shard_directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(shard_directory, name), array)
+        n_shards += 1
+        n_rows += len(shard)
+
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as mf:
+        json.dump({'version': FORMAT_VERSION,
+                   'source': datasets.file_digest(split.path),
+                   'vocabulary': vocabulary_digest(split.vocab_w2i),
+                   'keep_entities': keep_entities,
+                   'rows_per_shard': rows_per_shard,
+                   'n_shards': n_shards,
+                   'n_rows': n_rows}, mf)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(tmp_directory, directory)
+
+
+def join_pieces(pieces):
+    """
+    Joins the sentences read from several pieces of shards: lists of arrays
+    are concatenated, and matrices are padded to the widest one (they only
+    differ when `pad` is 0) and stacked.
+    """
+    if isinstance(pieces[0], list):
+        return [sentence for piece in pieces for sentence in piece]
+    if len(pieces) == 1:
+        return pieces[0]
+    width = max(piece.shape[1] for piece in pieces)
+    return np.concatenate([np.pad(piece, ((0, 0), (0, width - piece.shape[1])),
+                                  'constant') for piece in pieces])
+
+
+class STSShards(object):
+    """
+    Reads the pairs of an STS split converted with `write_sts_shards`. The
+    arrays of the shards are memory-mapped, and `next_batch` returns NumPy
+    batches sliced from them: with `pad=0` the sentences are int32 views of
+    the shards, without any copy.
+
+    Like `datasets.sts.DataSet`, the pairs are read in order, and
+    `epochs_completed` counts how many times the split has been read.
+    `begin_id` and `end_id` are the IDs of 'SEQ_BEGIN' and 'SEQ_END' in the
+    vocabulary, needed if `next_batch` is asked to add them.
+    """
+    def __init__(self, directory, begin_id=None, end_id=None):
+        self.directory = directory
+        self.begin_id = begin_id
+        self.end_id = end_id
+        with open(os.path.join(directory, 'meta.json'), 'r') as mf:
+            self.meta = json.load(mf)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError('{} was written with version {} of the STS '
+                             'shard format. Please convert the split again'
+                             .format(directory, self.meta['version']))
+        self.shards = [{name: np.load(os.path.join(directory, shard_name(i),
+                                                   name + '.npy'),
+                                      mmap_mode='r')
+                        for name in SHARD_ARRAYS}
+                       for i in range(self.meta['n_shards'])]
+        self.shard_starts = np.cumsum([0] + [len(shard['sims'])
+                                             for shard in self.shards])
+        self.position = 0
+        self._epochs_completed = 0
+
+        self.Batch = collections.namedtuple('Batch', ['s1', 's2', 'sim',
+                                                      's1_lengths',
+                                                      's2_lengths'])
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def is_valid(self, path, w2i):
+        """
+        Returns False if the text split `path` or the vocabulary `w2i`
+        changed after the shards were written.
+        """
+        return self.meta['source'] == datasets.file_digest(path) and \
+            self.meta['vocabulary'] == vocabulary_digest(w2i)
+
+    def sentences(self, shard, name, first, last, pad=0, begin_id=None,
+                  end_id=None):
+        tokens = shard[name + '_tokens']
+        offsets = shard[name + '_offsets'][first:last + 1]
+        if pad == 0 and begin_id is None and end_id is None:
+            return [tokens[start:end]
+                    for start, end in zip(offsets[:-1], offsets[1:])]
+        return datasets.pad_ragged(tokens, offsets[:-1], offsets[1:], pad,
+                                   begin_id, end_id)[0]
+
+    def next_batch(self, batch_size=64, seq_begin=False, seq_end=False,
+                   rescale=(0.0, 1.0), pad=0):
+        """
+        Returns the next `batch_size` pairs. `s1` and `s2` are lists of
+        int32 arrays if `pad` is 0 (and no sequence markers are added), else
+        int32 matrices. `sim` is a float32 array.
+        """
+        datasets.validate_rescale(rescale)
+        if (seq_begin and self.begin_id is None) or \
+                (seq_end and self.end_id is None):
+            raise ValueError('begin_id and end_id are needed to add '
+                             'sequence markers')
+        begin_id = self.begin_id if seq_begin else None
+        end_id = self.end_id if seq_end else None
+
+        indices, self.position, n_wraps = datasets.next_indices(
+                                    self.position, batch_size, len(self))
+        self._epochs_completed += n_wraps
+
+        # Consecutive pairs of the same shard are sliced together
+        s1s, s2s, sims, s1_lengths, s2_lengths = [], [], [], [], []
+        shard_ids = np.searchsorted(self.shard_starts, indices, 'right') - 1
+        breaks = np.flatnonzero((np.diff(indices) != 1) |
+                                (np.diff(shard_ids) != 0)) + 1
+        for piece in np.split(np.arange(len(indices)), breaks):
+            shard = self.shards[shard_ids[piece[0]]]
+            first = indices[piece[0]] - self.shard_starts[shard_ids[piece[0]]]
+            last = first + len(piece)
+            s1s.append(self.sentences(shard, 's1', first, last, pad,
+                                      begin_id, end_id))
+            s2s.append(self.sentences(shard, 's2', first, last, pad,
+                                      begin_id, end_id))
+            sims.append(shard['sims'][first:last])
+            s1_lengths.append(np.diff(shard['s1_offsets'][first:last + 1]))
+            s2_lengths.append(np.diff(shard['s2_offsets'][first:last + 1]))
+
+        s1s, s2s = join_pieces(s1s), join_pieces(s2s)
+        sims = sims[0] if len(sims) == 1 else np.concatenate(sims)
+        if tuple(rescale) != (0.0, 1.0):
+            sims = sims * (rescale[1] - rescale[0]) + rescale[0]
+
+        return self.Batch(s1=s1s, s2=s2s, sim=sims,
+                          s1_lengths=np.concatenate(s1_lengths),
+                          s2_lengths=np.concatenate(s2_lengths))
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def state_dict(self):
+        """
+        Returns the position of the split and the number of epochs
+        completed, to resume reading it from there with `load_state_dict`.
+        """
+        return {'position': self.position,
+                'epochs_completed': self._epochs_completed}
+
+    def load_state_dict(self, state):
+        self.position = state['position']
+        self._epochs_completed = state['epochs_completed']
+
+    @property
+    def epochs_completed(self):
+        return self._epochs_completed
@@ -0,0 +1,142 @@
+import numpy as np
+import tensorflow as tf
+
+
+def batch_arrays(batch, fields):
+    """
+    Returns the values of the `fields` of `batch` as arrays. Floats and
+    integers are narrowed to float32 and int32, the types of the models'
+    placeholders, and strings are encoded as UTF-8.
+    """
+    arrays = []
+    for name in fields:
+        try:
+            array = np.asarray(getattr(batch, name))
+        except ValueError:
+            array = None
+        if array is None or array.dtype == np.object_:
+            raise ValueError('The field {} is not rectangular. Please pad it '
+                             '(pad, sentence_pad) or leave it out of '
+                             'fields'.format(name))
+        if array.dtype == np.float64:
+            array = array.astype(np.float32)
+        elif array.dtype == np.int64:
+            array = array.astype(np.int32)
+        elif array.dtype.kind == 'U':
+            array = np.char.encode(array, 'utf-8')
+        arrays.append(array)
+    return tuple(arrays)
+
+
+def tf_dtype(array):
+    if array.dtype.kind == 'S':
+        return tf.string
+    return tf.as_dtype(array.dtype)
+
+
+def has_tf_data():
+    """
+    True if TensorFlow has `tf.data.Dataset.from_generator` (1.4 and
+    later). The version in requirements.txt (1.2) does not.
+    """
+    return hasattr(tf, 'data') and \
+        hasattr(tf.data.Dataset, 'from_generator')
+
+
+def first_batch(split, fields, next_batch_kwargs):
+    """
+    Returns the fields to use (by default all those of the `Batch` of
+    `split`) and a function that returns the arrays of the next batch, the
+    first of which is made right away.
+    """
+    first = split.next_batch(**next_batch_kwargs)
+    if fields is None:
+        fields = list(first._fields)
+    pending = [batch_arrays(first, fields)]
+
+    def next_arrays():
+        if pending:
+            return pending.pop()
+        return batch_arrays(split.next_batch(**next_batch_kwargs), fields)
+    return fields, pending[0], next_arrays
+
+
+def as_tf_dataset(split, prefetch=1, fields=None, **next_batch_kwargs):
+    """
+    Returns a `tf.data.Dataset` whose elements are the batches of `split`,
+    as dicts from the name of each field in `fields` (by default all the
+    fields of its `Batch`) to a tensor. The batches come from
+    `split.next_batch(**next_batch_kwargs)`, called in a Python generator,
+    and up to `prefetch` of them are kept ready, so they are prepared while
+    the graph runs instead of between `sess.run` calls. It needs TensorFlow
+    1.4 or later; `batch_inputs` works with older versions too.
+
+    The dataset never ends, just like `next_batch`; `split.epochs_completed`
+    is ahead by the batches already prepared. The split must not be read
+    elsewhere while the dataset is in use. The first batch is made right
+    away to find the types and shapes of the fields, which have to be
+    rectangular (e.g. sequences need `pad`).
+
+    Keyword arguments:
+    split             -- The split to read from, e.g. `sts.train`.
+    prefetch          -- Number of batches prepared in advance. 0 prepares
+                         each batch when it is requested.
+    fields            -- Names of the `Batch` fields to include.
+    next_batch_kwargs -- Passed to `split.next_batch`, e.g. `batch_size`.
+    """
+    if not has_tf_data():
+        raise ValueError('tf.data.Dataset.from_generator needs TensorFlow '
+                         '1.4 or later ({} is installed). Please use '
+                         'datasets.batch_inputs'.format(tf.__version__))
+    fields, first, next_arrays = first_batch(split, fields,
+                                             next_batch_kwargs)
+
+    def generate():
+        while True:
+            yield next_arrays()
+
+    dataset = tf.data.Dataset.from_generator(
+            generate,
+            tuple(tf_dtype(array) for array in first),
+            tuple(tf.TensorShape([None] * array.ndim) for array in first))
+    dataset = dataset.map(lambda *values: dict(zip(fields, values)))
+    if prefetch > 0:
+        dataset = dataset.prefetch(prefetch)
+    return dataset
+
+
+def batch_inputs(split, prefetch=1, fields=None, **next_batch_kwargs):
+    """
+    Returns a dict from the name of each field in `fields` to a tensor that
+    evaluates to that field of the next batch of `split`, e.g. the `inputs`
+    of a `Model`. The arguments are those of `as_tf_dataset`.
+
+    With TensorFlow 1.4 or later, the tensors are the `get_next()` of an
+    iterator over `as_tf_dataset`. With older versions (e.g. the 1.2 of
+    requirements.txt), a `tf.py_func` makes the batches and a
+    `tf.train.QueueRunner` keeps up to `prefetch` (at least 1) of them in a
+    `tf.FIFOQueue`. Its thread is started by
+    `tf.train.start_queue_runners(sess)`, which has to be called once the
+    variables are initialized.
+    """
+    if has_tf_data():
+        return as_tf_dataset(split, prefetch, fields, **next_batch_kwargs) \
+            .make_one_shot_iterator().get_next()
+
+    fields, first, next_arrays = first_batch(split, fields,
+                                             next_batch_kwargs)
+    dtypes = [tf_dtype(array) for array in first]
+    queue = tf.FIFOQueue(max(prefetch, 1), dtypes)
+    # A single enqueue op, so that the batches keep their order
+    enqueue = queue.enqueue(tf.py_func(lambda: list(next_arrays()), [],
+                                       dtypes))
+    tf.train.add_queue_runner(tf.train.QueueRunner(queue, [enqueue]))
+
+    values = queue.dequeue()
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    inputs = {}
+    for name, value, array in zip(fields, values, first):
+        value.set_shape([None] * array.ndim)
+        inputs[name] = value
+    return inputs
@@ -2,13 +2,15 @@ import os
 import json
 import datasets
 import collections
+import numpy as np
 
 from tflearn.data_utils import to_categorical
 
 
 class TwitterEmotion(object):
     def __init__(self, train_validation_split=None, test_split=None,
-                 use_defaults=True):
+                 use_defaults=True, use_cache=False, shard_index=0,
+                 num_shards=1):
         if train_validation_split is not None or test_split is not None or \
                 use_defaults is False:
             raise NotImplementedError('This Dataset does not implement '
@@ -46,11 +48,14 @@ class TwitterEmotion(object):
 
         self.vocab_size = len(self.w2i)
         self.train = DataSet(self.train_paths, (self.w2i, self.i2w),
-                             (self.c2i, self.i2c), self.n_classes)
+                             (self.c2i, self.i2c), self.n_classes, use_cache,
+                             shard_index, num_shards)
         self.validation = DataSet(self.validation_paths, (self.w2i, self.i2w),
-                                  (self.c2i, self.i2c), self.n_classes)
+                                  (self.c2i, self.i2c), self.n_classes,
+                                  use_cache, shard_index, num_shards)
         self.test = DataSet(self.test_paths, (self.w2i, self.i2w),
-                            (self.c2i, self.i2c), self.n_classes)
+                            (self.c2i, self.i2c), self.n_classes, use_cache,
+                            shard_index, num_shards)
         self.__refresh(load_w2v=False)
 
     def create_vocabulary(self, min_frequency=5, tokenizer='spacy',
@@ -68,6 +73,37 @@ class TwitterEmotion(object):
                                     line_processor=line_processor, lang='de')
         self.__refresh(load_w2v)
 
+    def encode_folds(self, folds=range(5), pad=30, tokenizer='spacy'):
+        """
+        Returns a `datasets.EncodedFold` for each fold in `folds`, with the
+        tweets of its splits tokenized and encoded once (through their
+        corpus caches), padded to `pad` words and kept in shared memory, for
+        `datasets.cross_validate`. The splits are left closed.
+        """
+        if pad <= 0:
+            raise ValueError('The folds are encoded as matrices, so pad has '
+                             'to be positive. {} was given'.format(pad))
+        encoded = []
+        for fold in folds:
+            splits = {}
+            for name in ['train', 'validation', 'test']:
+                split = getattr(self, name)
+                split.open(fold)
+                cache = split.corpus_cache(tokenizer)
+                rows = np.arange(len(cache))
+                splits[name] = datasets.EncodedSplit(
+                        text=datasets.shared_array(
+                                cache.sequences('text', rows, pad)),
+                        lengths=datasets.shared_array(np.minimum(
+                                cache.lengths('text', rows), pad)
+                                .astype(np.int32)),
+                        labels=datasets.shared_array(
+                                cache.labels('emotion', rows)
+                                .astype(np.int32)))
+                split.close()
+            encoded.append(datasets.EncodedFold(fold=fold, **splits))
+        return encoded
+
     def __refresh(self, load_w2v):
         self.w2i, self.i2w = datasets.load_vocabulary(self.vocab_path)
         self.vocab_size = len(self.w2i)
@@ -80,7 +116,8 @@ class TwitterEmotion(object):
 
 
 class DataSet(object):
-    def __init__(self, paths, vocab, classes, n_classes):
+    def __init__(self, paths, vocab, classes, n_classes, use_cache=False,
+                 shard_index=0, num_shards=1):
 
         self.paths = paths
         self._epochs_completed = 0
@@ -89,21 +126,81 @@ class DataSet(object):
         self.vocab_i2w = vocab[1]
         self.c2i = classes[0]
         self.i2c = classes[1]
-        self.datafiles = None
+        self.datafile = None
+        self.fold = None
+
+        # If True, `next_batch` reads the tokenized and encoded tweets from
+        # a `datasets.CorpusCache` whenever `raw` and `mark_entities` are
+        # False. It keeps its own position in the fold.
+        self.use_cache = use_cache
+        self._caches = {}
+        self._cache_position = 0
+        self._line_indexes = {}
+        # State taken back to when its fold is opened (see
+        # `load_state_dict`)
+        self._state = None
+
+        # `next_batch` only reads the shard `shard_index` of the
+        # `num_shards` byte ranges of the fold (see `datasets.ShardedFile`),
+        # or of the rows of its cache, and an epoch is a pass over that
+        # shard. `get`, `get_many` and `len` still refer to the whole fold.
+        datasets.validate_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
 
         self.Batch = collections.namedtuple('Batch', ['text', 'emotion'])
 
     def open(self, fold=0):
         if self.valid_fold(fold=fold):
-            self.datafile = open(self.paths[fold], 'r')
+            self.datafile = datasets.open_shard(self.paths[fold],
+                                                self.shard_index,
+                                                self.num_shards)
+            self.fold = fold
             self._epochs_completed = 0
+            self._cache_position = 0
+            self.restore_state()
         else:
             raise ValueError('Only 5 folds are available. fold can take '
                              'values from 0 - 4 Please use folds in this range')
 
     def close(self):
         self.datafile.close()
-        
+        for line_index in self._line_indexes.values():
+            line_index.close()
+        self._line_indexes = {}
+
+    def line_index(self):
+        """
+        Returns the `datasets.LineIndex` of the open fold.
+        """
+        if self.fold is None:
+            raise Exception('The dataset needs to be open before being used. '
+                            'Please call dataset.open() first')
+        if self.fold not in self._line_indexes:
+            self._line_indexes[self.fold] = datasets.open_line_index(
+                                                        self.paths[self.fold])
+        return self._line_indexes[self.fold]
+
+    def __len__(self):
+        return len(self.line_index())
+
+    def get(self, i, **kwargs):
+        """
+        Returns a `Batch` with the tweet in line `i` of the open fold.
+        `kwargs` are the ones of `next_batch` (but `batch_size`).
+        """
+        return self.get_many([i], **kwargs)
+
+    def get_many(self, indices, **kwargs):
+        """
+        Returns a `Batch` with the tweets in the lines `indices` of the open
+        fold, in that order. Invalid lines are skipped. `kwargs` are the
+        ones of `next_batch` (but `batch_size`).
+        """
+        pairs = [self.parse_row(row)
+                 for row in self.line_index().lines(indices)]
+        return self.batch_from_pairs([p for p in pairs if p is not None],
+                                     **kwargs)
 
     def valid_fold(self, fold):
         if fold >=0 and fold <= 4:
@@ -111,6 +208,40 @@ class DataSet(object):
         else:
             return False
 
+    def parse_row(self, row):
+        """
+        Returns the (tweet, emotion) pair in `row`, or None if `row` is
+        not a valid data instance.
+        """
+        cols = row.strip().split('\t')
+        try:
+            return cols[0], int(cols[1])
+        except Exception as e:
+            print('Invalid data instance. Skipping line.')
+            return None
+
+    def parse_rows(self, rows, tokenizer='spacy'):
+        """
+        Returns a dict with the tokenized tweets ('text') and the emotions
+        ('emotion') of the valid data instances in `rows`.
+        """
+        pairs = [p for p in map(self.parse_row, rows) if p is not None]
+        return {'text': datasets.tokenize_batch([p[0] for p in pairs],
+                                                tokenizer),
+                'emotion': [p[1] for p in pairs]}
+
+    def corpus_cache(self, tokenizer='spacy'):
+        """
+        Returns the `datasets.CorpusCache` of the open fold.
+        """
+        if (self.fold, tokenizer) not in self._caches:
+            self._caches[(self.fold, tokenizer)] = datasets.corpus_cache(
+                    self.paths[self.fold],
+                    lambda rows: self.parse_rows(rows, tokenizer),
+                    {'text': 'sequence', 'emotion': 'labels'},
+                    self.vocab_w2i, tokenizer=tokenizer, lang='en')
+        return self._caches[(self.fold, tokenizer)]
+
     def next_batch(self, batch_size=64, seq_begin=False, seq_end=False,
                    pad=0, raw=False, mark_entities=False, tokenizer='spacy',
                    one_hot=False):
@@ -119,22 +250,33 @@ class DataSet(object):
             raise Exception('The dataset needs to be open before being used. '
                             'Please call dataset.open() before calling '
                             'dataset.next_batch()')
-        text, emotion = [], []
 
-        while len(text) < batch_size:
+        if self.use_cache and not raw and not mark_entities:
+            return self.next_cached_batch(batch_size, seq_begin, seq_end,
+                                          pad, tokenizer, one_hot)
+
+        pairs = []
+        while len(pairs) < batch_size:
             row = self.datafile.readline()
             if row == '':
                 self._epochs_completed += 1
                 self.datafile.seek(0)
                 continue
-            cols = row.strip().split('\t')
-            try:
-                tweet, emo = cols[0], int(cols[1])
-            except Exception as e:
-                print('Invalid data instance. Skipping line.')
+            pair = self.parse_row(row)
+            if pair is None:
                 continue
-            text.append(datasets.tokenize(tweet, tokenizer))
-            emotion.append(emo)
+            pairs.append(pair)
+        return self.batch_from_pairs(pairs, seq_begin, seq_end, pad, raw,
+                                     mark_entities, tokenizer, one_hot)
+
+    def batch_from_pairs(self, pairs, seq_begin=False, seq_end=False, pad=0,
+                         raw=False, mark_entities=False, tokenizer='spacy',
+                         one_hot=False):
+        """
+        Returns a `Batch` with the (tweet, emotion) `pairs`.
+        """
+        text = datasets.tokenize_batch([p[0] for p in pairs], tokenizer)
+        emotion = [p[1] for p in pairs]
 
         if one_hot:
             emotion = to_categorical(emotion, nb_classes=self.n_classes)
@@ -142,22 +284,91 @@ class DataSet(object):
         if mark_entities:
             text = datasets.mark_entities(text, lang='en')
 
-        if not raw:
-            text = datasets.seq2id(text[:batch_size], self.vocab_w2i, seq_begin,
-                                  seq_end)
-        else:
-            text = datasets.append_seq_markers(text[:batch_size],
-                                               seq_begin, seq_end)
-
-        if pad != 0:
-            text = datasets.padseq(text[:batch_size], pad, raw)
+        text = datasets.encode_sequences(text, self.vocab_w2i, pad, raw,
+                                         seq_begin, seq_end)
 
         batch = self.Batch(text=text, emotion=emotion)
         return batch
 
+    def next_cached_batch(self, batch_size=64, seq_begin=False, seq_end=False,
+                          pad=0, tokenizer='spacy', one_hot=False):
+        cache = self.corpus_cache(tokenizer)
+        first, last = datasets.shard_bounds(len(cache), self.shard_index,
+                                            self.num_shards)
+        indices, self._cache_position, n_wraps = datasets.next_indices(
+                                self._cache_position, batch_size,
+                                last - first)
+        indices += first
+        self._epochs_completed += n_wraps
+
+        text = cache.sequences('text', indices, pad,
+                   self.vocab_w2i['SEQ_BEGIN'] if seq_begin else None,
+                   self.vocab_w2i['SEQ_END'] if seq_end else None)
+        emotion = cache.labels('emotion', indices).tolist()
+        if one_hot:
+            emotion = to_categorical(emotion, nb_classes=self.n_classes)
+        return self.Batch(text=text, emotion=emotion)
+
     def set_vocab(self, vocab):
         self.vocab_w2i = vocab[0]
         self.vocab_i2w = vocab[1]
+        self._caches = {}
+
+    def as_tf_dataset(self, prefetch=1, fields=None, **next_batch_kwargs):
+        """
+        Returns a `tf.data.Dataset` with the batches of `next_batch` (see
+        `datasets.as_tf_dataset`).
+        """
+        return datasets.as_tf_dataset(self, prefetch, fields,
+                                      **next_batch_kwargs)
+
+    def is_open(self):
+        return self.datafile is not None and not self.datafile.closed
+
+    def state_dict(self):
+        """
+        Returns the position of the split (the open fold, the offset of its
+        next line in the file, the position in the corpus cache and the
+        number of epochs completed), to resume reading it from there with
+        `load_state_dict`, e.g. from a checkpoint.
+        """
+        return {'fold': self.fold,
+                'epochs_completed': self._epochs_completed,
+                'offset': self.datafile.tell() if self.is_open() else 0,
+                'cache_position': self._cache_position}
+
+    def load_state_dict(self, state):
+        """
+        Takes the split back to the position in `state` (see `state_dict`),
+        opening its fold if another one is open. If the split is not open,
+        it gets there when the fold is opened: `open` raises a ValueError
+        (and leaves the split closed) for any other fold than the one in
+        `state`.
+        """
+        self._state = state
+        if not self.is_open():
+            return
+        if state['fold'] is not None and state['fold'] != self.fold:
+            self.datafile.close()
+            self.open(state['fold'])
+        else:
+            self.restore_state()
+
+    def restore_state(self):
+        if self._state is None:
+            return
+        state = self._state
+        if state['fold'] not in (None, self.fold):
+            # The state stays pending until its own fold is opened
+            self.datafile.close()
+            raise ValueError('The state was saved in fold {}, not in fold {}.'
+                             ' Please open fold {} to resume from '
+                             'it'.format(state['fold'], self.fold,
+                                         state['fold']))
+        self._epochs_completed = state['epochs_completed']
+        self.datafile.seek(state['offset'])
+        self._cache_position = state['cache_position']
+        self._state = None
 
     @property
     def epochs_completed(self):
@@ -0,0 +1,277 @@
+import os
+import mmap
+import zlib
+import struct
+import numbers
+
+import numpy as np
+
+
+# Identifies (and versions) the binary vocabulary files
+MAGIC = b'OVVOCAB1'
+
+# Number of int64 fields in the header, after the magic string:
+# n_terms, strings_size, table_size, source_size, source_mtime_ns
+N_HEADER_FIELDS = 5
+HEADER_SIZE = len(MAGIC) + 8 * N_HEADER_FIELDS
+
+
+def binary_path(vocab_path):
+    """
+    Returns the path of the binary vocabulary cached next to `vocab_path`.
+    For example, `vocab.txt` is cached as `vocab.bin`.
+    """
+    return os.path.splitext(vocab_path)[0] + '.bin'
+
+
+def read_terms(vocab_path):
+    """
+    Returns the list of terms in the text vocabulary `vocab_path`, in order
+    and without repetitions. The ID of a term is its index in the list.
+    """
+    terms = []
+    seen = set()
+    with open(vocab_path, 'r') as vf:
+        for line in vf:
+            term = line.strip().split('\t')[0]
+            if term not in seen:
+                seen.add(term)
+                terms.append(term)
+    return terms
+
+
+def write_binary_vocabulary(terms, path, source_size=0, source_mtime_ns=0):
+    """
+    Writes `terms` to `path` in the binary vocabulary format:
+
+     * the header (see `MAGIC` and `N_HEADER_FIELDS`)
+     * an int64 array with the offset of each term in the string table
+       (plus the end of the table)
+     * an int32 open-addressing hash table (linear probing, crc32 of the
+       UTF-8 bytes), holding the ID of a term in each used slot and -1 in the
+       empty ones
+     * the string table: all the terms encoded in UTF-8, one after the other
+
+    `source_size` and `source_mtime_ns` describe the text vocabulary from
+    which the terms were read, so that stale files can be detected.
+    """
+    encoded = [term.encode('utf-8') for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+
+    # At most half of the slots are used
+    table_size = 1 << max(3, (2 * len(encoded)).bit_length())
+    mask = table_size - 1
+    table = [-1] * table_size
+    for wid, e in enumerate(encoded):
+        slot = zlib.crc32(e) & mask
+        while table[slot] != -1:
+            slot = (slot + 1) & mask
+        table[slot] = wid
+
+    header = np.array([len(encoded), offsets[-1], table_size, source_size,
+                       source_mtime_ns], dtype=np.int64)
+
+    # Written under a temporary name so that other processes never see a
+    # half-written file
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(header.tobytes())
+        f.write(offsets.tobytes())
+        f.write(np.array(table, dtype=np.int32).tobytes())
+        f.write(b''.join(encoded))
+    os.replace(tmp_path, path)
+
+
+class Vocabulary(object):
+    """
+    A read-only vocabulary backed by a memory-mapped binary file (see
+    `write_binary_vocabulary`). All processes that open the same file share
+    its pages, instead of each keeping its own pair of dicts.
+
+    `w2i` and `i2w` are views that behave like the dicts returned by
+    `datasets.load_vocabulary` used to.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a binary vocabulary'.format(path))
+
+        self.n_terms, strings_size, table_size, self.source_size, \
+            self.source_mtime_ns = struct.unpack_from(
+                                '={}q'.format(N_HEADER_FIELDS), self._mm,
+                                len(MAGIC))
+
+        self._buffer = memoryview(self._mm)
+        position = HEADER_SIZE
+        self._offsets = self._buffer[position:
+                                position + 8 * (self.n_terms + 1)].cast('q')
+        position += 8 * (self.n_terms + 1)
+        self._table = self._buffer[position:
+                                   position + 4 * table_size].cast('i')
+        self._mask = table_size - 1
+        position += 4 * table_size
+        self._strings = self._buffer[position:position + strings_size]
+
+        self.w2i = Word2Index(self)
+        self.i2w = Index2Word(self)
+        self.unk_id = self.lookup('UNK')
+
+    def __reduce__(self):
+        # Other processes map the same file instead of receiving a copy
+        return (Vocabulary, (self.path,))
+
+    def __len__(self):
+        return self.n_terms
+
+    def term_bytes(self, wid):
+        return self._strings[self._offsets[wid]:self._offsets[wid + 1]]
+
+    def term(self, wid):
+        """
+        Returns the term with ID `wid`.
+        """
+        return bytes(self.term_bytes(wid)).decode('utf-8')
+
+    def lookup(self, term):
+        """
+        Returns the ID of `term`, or -1 if it is not in the vocabulary.
+        """
+        encoded = term.encode('utf-8')
+        slot = zlib.crc32(encoded) & self._mask
+        while True:
+            wid = self._table[slot]
+            if wid == -1:
+                return -1
+            if self.term_bytes(wid) == encoded:
+                return wid
+            slot = (slot + 1) & self._mask
+
+    def encode(self, tokens, unk_id=None):
+        """
+        Returns an int32 array with the ID of each term in `tokens`. Terms
+        that are not in the vocabulary get `unk_id` (by default, the ID of
+        'UNK'). The hash table is only probed once for each distinct term,
+        and the IDs found are kept for this call only, so no process holds
+        a dict of the whole vocabulary.
+        """
+        if unk_id is None:
+            unk_id = self.unk_id
+        found = {}
+        for token in tokens:
+            if token not in found:
+                wid = self.lookup(token)
+                found[token] = unk_id if wid == -1 else wid
+        ids = np.array([found[token] for token in tokens], dtype=np.int32)
+        if unk_id == -1 and (ids == -1).any():
+            raise KeyError(tokens[int(np.argmax(ids == -1))])
+        return ids
+
+    def terms(self):
+        for wid in range(self.n_terms):
+            yield self.term(wid)
+
+    def close(self):
+        self._offsets.release()
+        self._table.release()
+        self._strings.release()
+        self._buffer.release()
+        self._mm.close()
+        self._file.close()
+
+
+class Word2Index(object):
+    """
+    Dict-like view mapping each term of a `Vocabulary` to its ID.
+    """
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+
+    def __getitem__(self, term):
+        wid = self.vocabulary.lookup(term)
+        if wid == -1:
+            raise KeyError(term)
+        return wid
+
+    def __contains__(self, term):
+        return isinstance(term, str) and self.vocabulary.lookup(term) != -1
+
+    def get(self, term, default=None):
+        wid = self.vocabulary.lookup(term)
+        return default if wid == -1 else wid
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __iter__(self):
+        return self.vocabulary.terms()
+
+    def keys(self):
+        return self.vocabulary.terms()
+
+    def values(self):
+        return iter(range(len(self.vocabulary)))
+
+    def items(self):
+        return zip(self.vocabulary.terms(), range(len(self.vocabulary)))
+
+    def encode(self, tokens, unk_id=None):
+        return self.vocabulary.encode(tokens, unk_id)
+
+
+class Index2Word(object):
+    """
+    Dict-like view mapping each ID of a `Vocabulary` to its term.
+    """
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+
+    def __getitem__(self, wid):
+        if wid not in self:
+            raise KeyError(wid)
+        return self.vocabulary.term(int(wid))
+
+    def __contains__(self, wid):
+        return isinstance(wid, numbers.Integral) and \
+               0 <= wid < len(self.vocabulary)
+
+    def get(self, wid, default=None):
+        return self[wid] if wid in self else default
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __iter__(self):
+        return iter(range(len(self.vocabulary)))
+
+    def keys(self):
+        return iter(range(len(self.vocabulary)))
+
+    def values(self):
+        return self.vocabulary.terms()
+
+    def items(self):
+        return zip(range(len(self.vocabulary)), self.vocabulary.terms())
+
+
+def open_vocabulary(vocab_path):
+    """
+    Returns the `Vocabulary` for the text vocabulary `vocab_path`. The binary
+    version is created next to it the first time, and recreated whenever
+    `vocab_path` changes.
+    """
+    stat = os.stat(vocab_path)
+    path = binary_path(vocab_path)
+    if os.path.exists(path):
+        vocabulary = Vocabulary(path)
+        if vocabulary.source_size == stat.st_size and \
+                vocabulary.source_mtime_ns == stat.st_mtime_ns:
+            return vocabulary
+        vocabulary.close()
+
+    write_binary_vocabulary(read_terms(vocab_path), path,
+                            stat.st_size, stat.st_mtime_ns)
+    return Vocabulary(path)
@@ -116,11 +116,11 @@ class AttentionBlstmQuora(Model):
         """
 
         # Prepare data to feed to the computation graph
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input: sents_batch,
             self.input_sim: sim_batch,
             self.input_length: lens
-        }
+        })
 
         # create a list of operations that you want to run and observe
         ops = [self.tr_op_set, self.global_step, self.loss, self.output]
@@ -151,11 +151,11 @@ class AttentionBlstmQuora(Model):
         """
 
         # Prepare the data to be fed to the computation graph
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input: sents_batch,
             self.input_sim: sim_batch,
             self.input_length: lens
-        }
+        })
 
         # create a list of operations that you want to run and observe
         ops = [self.global_step, self.loss, self.output, self.pco,
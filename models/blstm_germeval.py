@@ -22,9 +22,9 @@ class BLSTMGermEval(Model):
         self.pos = tf.placeholder(tf.int32,
                                     [None, self.args.get("sequence_length")])
         self.input_lengths = tf.placeholder(tf.int32, [None])
-        self.output = tf.placeholder(tf.float32,
-                                      [None, self.args.get("sequence_length"),
-                                       self.args['n_classes']])
+        self.output = self.label_placeholder(
+                            [None, self.args.get("sequence_length")],
+                            self.args['n_classes'])
 
     # Inspired by:
     # https://github.com/monikkinom/ner-lstm/blob/master/model.py
@@ -68,17 +68,17 @@ class BLSTMGermEval(Model):
         prediction = tf.nn.softmax(logits)
         self.prediction = tf.reshape(prediction, [-1, self.args.get("sequence_length"),
                                                   self.args['n_classes']])
-        open_targets = tf.reshape(self.output, [-1, self.args['n_classes']])
+        open_targets = self.flat_labels(self.output, self.args['n_classes'])
         with tf.name_scope("loss"):
             #self.loss = self.cost()
-            self.loss = tf.losses.softmax_cross_entropy(open_targets, logits)
+            self.loss = self.softmax_loss(open_targets, logits)
 
             if self.args["l2_reg_beta"] > 0.0:
                 self.regularizer = ops.get_regularizer(self.args["l2_reg_beta"])
                 self.loss = tf.reduce_mean(self.loss + self.regularizer)
         with tf.name_scope('accuracy'):
             self.correct_prediction = tf.equal(tf.argmax(prediction, 1),
-                                               tf.argmax(open_targets, 1))
+                                               self.label_ids(open_targets))
             self.accuracy = tf.reduce_mean(tf.cast(self.correct_prediction, tf.float32))
 
     def create_scalar_summary(self, sess):
@@ -105,11 +105,11 @@ class BLSTMGermEval(Model):
             """
             A single train step
             """
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.input: text_batch,
                 self.output: ne_batch,
                 self.input_lengths: lengths_batch
-            }
+            })
             ops = [self.tr_op_set, self.global_step,
                    self.loss, self.prediction, self.accuracy]
             if hasattr(self, 'train_summary_op'):
@@ -131,11 +131,11 @@ class BLSTMGermEval(Model):
         """
         A single evaluation step
         """
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input: text_batch,
             self.output: ne_batch,
             self.input_lengths : lengths_batch
-        }
+        })
         ops = [self.global_step, self.loss, self.prediction, self.accuracy]
         if hasattr(self, 'dev_summary_op'):
             ops.append(self.dev_summary_op)
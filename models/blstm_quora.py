@@ -106,10 +106,10 @@ class BLSTM_Quora(Model):
             """
 
             # Prepare data to feed to the computation graph
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.input: sents_batch,
                 self.input_sim: sim_batch,
-            }
+            })
 
             # create a list of operations that you want to run and observe
             ops = [self.tr_op_set, self.global_step, self.loss, self.out]
@@ -140,10 +140,10 @@ class BLSTM_Quora(Model):
         """
 
         # Prepare the data to be fed to the computation graph
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input: sents_batch,
             self.input_sim: sim_batch
-        }
+        })
 
         # create a list of operations that you want to run and observe
         ops = [self.global_step, self.loss, self.out, self.pco,
@@ -142,11 +142,11 @@ class HeirarchicalAttentionSentimentClassifier(Model):
             """
             A single train step
             """
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.input: text_batch,
                 self.sentiment_: sent_batch,
                 self.input_length: lengths
-            }
+            })
             ops = [self.tr_op_set, self.global_step, self.loss, self.output]
             if hasattr(self, 'train_summary_op'):
                 ops.append(self.train_summary_op)
@@ -170,11 +170,11 @@ class HeirarchicalAttentionSentimentClassifier(Model):
         """
         A single evaluation step
         """
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input: text_batch,
             self.sentiment_: sent_batch,
             self.input_length: lengths
-        }
+        })
         ops = [self.global_step, self.loss, self.output]
         if hasattr(self, 'dev_summary_op'):
             ops.append(self.dev_summary_op)
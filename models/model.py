@@ -101,7 +101,7 @@ class Model(ABC):
     #                         CONCRETE IMPLEMENTATIONS                        #
     ###########################################################################
 
-    def __init__(self, train_options):
+    def __init__(self, train_options, inputs=None):
         """
         This constructs a Model Object and sets some training options,
         which is a dictionary of hyper parameters.
@@ -110,14 +110,95 @@ class Model(ABC):
 
         :param train_options: This is a dictionary of training options and
         hyperparameters that will be required to train and evaluate the model
+        :param inputs: Optional dictionary from the name of a placeholder
+        (e.g. 'sentence') to the tensor it should read from, e.g. a field of
+        `datasets.batch_inputs(split)`. See use_inputs()
         """
         self.args = train_options
         self.create_experiment_dirs()
         self.load_train_options()
         self.save_train_options()
         self.create_placeholders()
+        if inputs is not None:
+            self.use_inputs(inputs)
         self.create_scalars()
 
+    def use_inputs(self, inputs):
+        """
+        Replaces the placeholders named in `inputs` by
+        tf.placeholder_with_default()s of the given tensors, with the types
+        and shapes of the placeholders. The model then reads its batches from
+        the tensors (e.g. from datasets.batch_inputs(), so that the next
+        batch is prepared while the current one runs) unless a value is
+        fed. Pass None instead of those batches to train_step() and
+        evaluate_step(). Steps that compute measures in Python from a batch
+        (e.g. the Pearson correlation of the regressors) still need that
+        batch fed.
+        :param inputs: dictionary from placeholder name to tensor
+        :return:
+        """
+        for name, tensor in inputs.items():
+            placeholder = getattr(self, name)
+            setattr(self, name, tf.placeholder_with_default(
+                        tf.cast(tensor, placeholder.dtype), placeholder.shape,
+                        name=placeholder.op.name + '_input'))
+
+    def feed_dict(self, feeds):
+        """
+        Returns the feed_dict with the values in `feeds` that are not None.
+        The placeholders left out read from their inputs (see use_inputs()).
+        """
+        return {placeholder: value for placeholder, value in feeds.items()
+                if value is not None}
+
+    def uses_sparse_labels(self):
+        """
+        True if the train option 'sparse_labels' is set. The labels of the
+        classifiers are then fed as int32 class IDs (e.g. the batches of
+        next_batch(one_hot=False)) instead of one-hot vectors, and the loss
+        is the sparse softmax cross-entropy, which has the same value.
+        :return:
+        """
+        return self.args.get('sparse_labels', False)
+
+    def label_placeholder(self, shape, n_classes, name=None):
+        """
+        Returns the placeholder of labels of `shape`: class IDs if
+        uses_sparse_labels(), else one-hot vectors of `n_classes`.
+        :param shape: the shape of the labels, without the classes
+        :param n_classes: number of classes
+        :return:
+        """
+        if self.uses_sparse_labels():
+            return tf.placeholder(tf.int32, shape, name=name)
+        return tf.placeholder(tf.float32, shape + [n_classes], name=name)
+
+    def flat_labels(self, labels, n_classes):
+        """
+        Returns `labels` (see label_placeholder()) with a row per label.
+        """
+        if self.uses_sparse_labels():
+            return tf.reshape(labels, [-1])
+        return tf.reshape(labels, [-1, n_classes])
+
+    def softmax_loss(self, labels, logits):
+        """
+        Returns the mean softmax cross-entropy of `logits` (one row per
+        label) with the labels of label_placeholder().
+        """
+        if self.uses_sparse_labels():
+            return tf.losses.sparse_softmax_cross_entropy(labels, logits)
+        return tf.losses.softmax_cross_entropy(labels, logits)
+
+    def label_ids(self, labels):
+        """
+        Returns the class IDs of the labels of label_placeholder(), to
+        compare with the tf.argmax() of the predictions.
+        """
+        if self.uses_sparse_labels():
+            return tf.cast(labels, tf.int64)
+        return tf.argmax(labels, -1)
+
     def create_optimizer(self):
         """
         Create your optimizer here. You can choose from an exhaustive list
@@ -253,6 +334,57 @@ class Model(ABC):
         else:
             print('Could not load checkpoints.  Training a new model')
 
+    def data_state_path(self, checkpoint):
+        return checkpoint + '.data_state.pkl'
+
+    def save_data_state(self, step, state):
+        """
+        Save the state of the training data (e.g. the state_dict() of the
+        training split) with the checkpoint of `step`, so that training
+        resumes from the same batch, and with the same shuffles, as the
+        weights. The states of the checkpoints that the saver deleted are
+        removed.
+        :param step: The global step of the checkpoint just saved
+        :param state: Any picklable object
+        :return:
+        """
+        checkpoint = '{}-{}'.format(self.checkpoint_prefix, step)
+        path = self.data_state_path(checkpoint)
+        # Written aside and moved, so that a crash never leaves a truncated
+        # state next to the checkpoint
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, path)
+
+        checkpoint_state = tf.train.get_checkpoint_state(self.checkpoint_dir)
+        if checkpoint_state is None:
+            return
+        kept = set(self.data_state_path(os.path.basename(path)) for path in
+                   checkpoint_state.all_model_checkpoint_paths)
+        kept.add(os.path.basename(self.data_state_path(checkpoint)))
+        for name in os.listdir(self.checkpoint_dir):
+            if name.endswith(self.data_state_path('')) and name not in kept:
+                os.remove(os.path.join(self.checkpoint_dir, name))
+
+    def restore_data_state(self, split):
+        """
+        Load the state of the training data saved with the latest checkpoint
+        (see save_data_state()) into `split` with its load_state_dict(). The
+        split keeps its position if there is no checkpoint, or if it was
+        saved without that state.
+        :param split: The training split (or its Prefetcher)
+        :return: True if the state was restored
+        """
+        checkpoint = tf.train.latest_checkpoint(self.checkpoint_dir)
+        if checkpoint is None or \
+                not os.path.exists(self.data_state_path(checkpoint)):
+            return False
+        with open(self.data_state_path(checkpoint), 'rb') as f:
+            split.load_state_dict(pickle.load(f))
+        print('Resuming the training data from {}'.format(checkpoint))
+        return True
+
     def easy_setup(self, sess):
         print('Computing Gradients')
         self.compute_gradients()
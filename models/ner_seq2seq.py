@@ -20,9 +20,9 @@ class AcnerSeq2Seq(Model):
         self.input_target = tf.placeholder(tf.int32,
                                  [None, self.args.get("sequence_length")])
 
-        self.output = tf.placeholder(tf.float32,
-                                      [None, self.args.get("sequence_length"),
-                                       self.args['n_classes']])
+        self.output = self.label_placeholder(
+                            [None, self.args.get("sequence_length")],
+                            self.args['n_classes'])
 
     # Inspired by:
     # https://github.com/monikkinom/ner-lstm/blob/master/model.py
@@ -73,11 +73,10 @@ class AcnerSeq2Seq(Model):
         self.prediction_open = tf.nn.softmax(softmax_logits)
         self.prediction = tf.reshape(self.prediction_open,
                          shape=[-1, self.args['sequence_length'], self.args['n_classes']])
-        reshaped_output = tf.reshape(self.output, [-1, self.args['n_classes']])
+        reshaped_output = self.flat_labels(self.output, self.args['n_classes'])
 
         with tf.name_scope("loss"):
-            self.loss = tf.losses.softmax_cross_entropy(reshaped_output,
-                                                        softmax_logits)
+            self.loss = self.softmax_loss(reshaped_output, softmax_logits)
 
             if self.args["l2_reg_beta"] > 0.0:
                 self.regularizer = ops.get_regularizer(self.args["l2_reg_beta"])
@@ -85,7 +84,7 @@ class AcnerSeq2Seq(Model):
 
         with tf.name_scope("Graph_Accuracy"):
             self.correct_preds = tf.equal(tf.argmax(self.prediction_open, 1),
-                                          tf.argmax(reshaped_output, 1))
+                                          self.label_ids(reshaped_output))
             self.accuracy = tf.reduce_mean(
                                 tf.cast(self.correct_preds, tf.float32),
                                 name="accuracy")
@@ -117,11 +116,11 @@ class AcnerSeq2Seq(Model):
             A single train step
             """
 
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.input_source: text_batch,
                 self.input_target: ne_batch,
                 self.output: categorical_ne_batch,
-            }
+            })
             ops = [self.tr_op_set, self.global_step,
                    self.loss, self.prediction, self.accuracy]
             if hasattr(self, 'train_summary_op'):
@@ -142,11 +141,11 @@ class AcnerSeq2Seq(Model):
         """
         A single evaluation step
         """
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input_source : text_batch,
             self.input_target : ne_batch,
             self.output : categorical_ne_batch,
-        }
+        })
         ops = [self.global_step, self.loss, self.prediction, self.accuracy]
         if hasattr(self, 'dev_summary_op'):
             ops.append(self.dev_summary_op)
@@ -5,7 +5,6 @@ import datetime
 import tensorflow as tf
 
 from utils import ops
-from utils import losses
 from .model import Model
 from tflearn.layers.core import fully_connected
 from tensorflow.contrib.tensorboard.plugins import projector
@@ -20,7 +19,7 @@ class SentenceSentimentClassifier(Model):
         self.sentence = tf.placeholder(tf.int32,
                                 [None, self.args.get("sequence_length")],
                                 name="sentence")
-        self.sentiment = tf.placeholder(tf.float32, [None, 5], name="sentiment")
+        self.sentiment = self.label_placeholder([None], 5, name="sentiment")
 
 
     def build_model(self, metadata_path=None, embedding_weights=None):
@@ -43,7 +42,7 @@ class SentenceSentimentClassifier(Model):
             self.out = fully_connected(self.lstm_out, 5)
 
         with tf.name_scope("loss"):
-            self.loss = losses.categorical_cross_entropy(self.sentiment, self.out)
+            self.loss = self.softmax_loss(self.sentiment, self.out)
 
             if self.args["l2_reg_beta"] > 0.0:
                 self.regularizer = ops.get_regularizer(self.args["l2_reg_beta"])
@@ -52,7 +51,7 @@ class SentenceSentimentClassifier(Model):
         #### Evaluation Measures.
         with tf.name_scope("Graph_Accuracy"):
             self.correct_preds = tf.equal(tf.argmax(self.out, 1),
-                                          tf.argmax(self.sentiment, 1))
+                                          self.label_ids(self.sentiment))
             self.accuracy = tf.reduce_mean(
                                 tf.cast(self.correct_preds, tf.float32),
                                 name="accuracy")
@@ -83,10 +82,10 @@ class SentenceSentimentClassifier(Model):
             """
             A single train step
             """
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.sentence: text_batch,
                 self.sentiment: sentiment_batch,
-            }
+            })
             ops = [self.tr_op_set, self.global_step,
                    self.loss, self.out, self.accuracy]
             if hasattr(self, 'train_summary_op'):
@@ -108,10 +107,10 @@ class SentenceSentimentClassifier(Model):
         """
         A single evaluation step
         """
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.sentence: text_batch,
             self.sentiment: sentiment_batch
-        }
+        })
         ops = [self.global_step, self.loss, self.out,
                self.accuracy, self.correct_preds]
         if hasattr(self, 'dev_summary_op'):
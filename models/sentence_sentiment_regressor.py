@@ -89,10 +89,10 @@ class SentenceSentimentRegressor(Model):
             """
             A single train step
             """
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.input: text_batch,
                 self.sentiment: sent_batch
-            }
+            })
             ops = [self.tr_op_set, self.global_step, self.loss, self.out]
             if hasattr(self, 'train_summary_op'):
                 ops.append(self.train_summary_op)
@@ -116,10 +116,10 @@ class SentenceSentimentRegressor(Model):
         """
         A single evaluation step
         """
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input: text_batch,
             self.sentiment: sent_batch
-        }
+        })
         ops = [self.global_step, self.loss, self.out, self.pco,
                self.pco_update, self.mse, self.mse_update]
         if hasattr(self, 'dev_summary_op'):
@@ -142,11 +142,11 @@ class SiameseCNNLSTM(Model):
             """
 
             # Prepare data to feed to the computation graph
-            feed_dict = {
+            feed_dict = self.feed_dict({
                 self.input_s1: s1_batch,
                 self.input_s2: s2_batch,
                 self.input_sim: sim_batch,
-            }
+            })
 
             # create a list of operations that you want to run and observe
             ops = [self.tr_op_set, self.global_step, self.loss, self.distance]
@@ -177,11 +177,11 @@ class SiameseCNNLSTM(Model):
         """
 
         # Prepare the data to be fed to the computation graph
-        feed_dict = {
+        feed_dict = self.feed_dict({
             self.input_s1: s1_batch,
             self.input_s2: s2_batch,
             self.input_sim: sim_batch
-        }
+        })
 
         # create a list of operations that you want to run and observe
         ops = [self.global_step, self.loss, self.distance, self.pco,
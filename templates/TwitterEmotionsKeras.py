@@ -6,7 +6,9 @@ from keras.layers import Embedding
 from keras.layers import LSTM
 from keras.layers import Conv1D
 from keras.layers import MaxPooling1D
+from keras.callbacks import ModelCheckpoint
 from datasets import TwitterEmotion
+from datasets.keras import SequenceAdapter
 
 # setup the dataset
 te = TwitterEmotion()
@@ -34,6 +36,12 @@ lstm_output_size = 70
 # Training
 batch_size = 500
 epochs = 2
+# Number of processes preparing batches (at least 1: Keras 2.0.8 has no
+# mode that prepares them in the main thread)
+workers = 4
+if workers < 1:
+	raise ValueError('workers has to be at least 1. {} was '
+					 'given'.format(workers))
 
 print('Building the Model...')
 model = Sequential()
@@ -50,62 +58,34 @@ model.add(LSTM(lstm_output_size))
 model.add(Dense(te.n_classes))
 model.add(Activation('sigmoid'))
 
-model.compile(loss = 'categorical_crossentropy',
+model.compile(loss = 'sparse_categorical_crossentropy',
 			  optimizer = 'adam', metrics = ['accuracy'])
 
-min_val_loss = float("inf")
-prev_epoch = 0
-while te.train.epochs_completed < epochs:
-
-	train_batch = te.train.next_batch(batch_size = batch_size, pad = maxlen,
-									  one_hot = True, mark_entities = True)
-	[loss, accuracy] = model.train_on_batch(train_batch.text,
-											train_batch.emotion)
-	print('Epoch {}\tLoss: {}\tAcc: {}'.format(te.train.epochs_completed,
-											   loss, accuracy))
-	if prev_epoch != te.train.epochs_completed:
-		prev_epoch = te.train.epochs_completed
-
-		print('validating')
-		total_val_loss, total_val_acc, n_val_iterations = 0.0, 0.0, 0
-		while te.validation.epochs_completed < 1:
-			val_batch = te.validation.next_batch(batch_size = batch_size,
-												 pad = maxlen, one_hot = True,
-												 mark_entities = True)
-			[val_loss, val_accuracy] = model.test_on_batch(val_batch.text,
-														   val_batch.emotion)
-
-			total_val_loss += val_loss
-			total_val_acc += val_accuracy
-			n_val_iterations += 1
-		te.validation._epochs_completed = 0
-		avg_val_loss = total_val_loss / n_val_iterations
-		avg_val_acc = total_val_acc / n_val_iterations
-		print("Average Validation Loss: {}\t"
-			  "Average Validation Accuracy: {}".format(avg_val_loss,
-													   avg_val_acc))
-		if avg_val_loss < min_val_loss:
-			print('saving model as the validation loss improved. '
-				  'Previous val loss: {}\t current val loss: {}'.format(
-				min_val_loss, avg_val_loss))
-			model.save('model_{}.h5'.format(te.train.epochs_completed))
-			min_val_loss = avg_val_loss
+# The batches are read through the line indexes of the folds, in a new
+# order every epoch, so that Keras can prepare them in parallel
+train_data = SequenceAdapter(te.train, batch_size, 'text', 'emotion',
+							 pad = maxlen, one_hot = False,
+							 mark_entities = True)
+validation_data = SequenceAdapter(te.validation, batch_size, 'text',
+								  'emotion', shuffle = False, pad = maxlen,
+								  one_hot = False, mark_entities = True)
+test_data = SequenceAdapter(te.test, batch_size, 'text', 'emotion',
+							shuffle = False, pad = maxlen, one_hot = False,
+							mark_entities = True)
+
+# Saves the model whenever the validation loss improves
+checkpoint = ModelCheckpoint('model_{epoch}.h5', monitor = 'val_loss',
+							 save_best_only = True, verbose = 1)
+model.fit_generator(train_data, steps_per_epoch = len(train_data),
+					epochs = epochs, validation_data = validation_data,
+					validation_steps = len(validation_data),
+					callbacks = [checkpoint], workers = workers,
+					use_multiprocessing = True)
 
 print('Testing')
-total_test_loss, total_test_acc, n_test_iterations = 0.0, 0.0, 0
-while te.test.epochs_completed < 1:
-	te.test._epochs_completed = 0
-	test_batch = te.test.next_batch(batch_size = batch_size,
-									pad = maxlen, one_hot = True,
-									mark_entities = True)
-	[test_loss, test_accuracy] = model.test_on_batch(test_batch.text,
-													 test_batch.emotion)
-	total_test_loss += test_loss
-	total_test_acc += test_accuracy
-	n_test_iterations += 1
-
-avg_test_loss = total_test_loss / n_test_iterations
-avg_test_acc = total_test_acc / n_test_iterations
+[avg_test_loss, avg_test_acc] = model.evaluate_generator(
+	test_data, steps = len(test_data), workers = workers,
+	use_multiprocessing = True)
 print("Avg Test Accuracy: {}\nAverage Test Loss: {}".format(avg_test_acc,
 															avg_test_loss))
 
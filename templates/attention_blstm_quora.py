@@ -19,6 +19,7 @@ from datasets import SemEval
 from datasets import StackExchange
 
 from datasets import id2seq
+from datasets import Prefetcher
 from pyqt_fit import npr_methods
 from models import AttentionBlstmQuora
 
@@ -48,6 +49,9 @@ tf.flags.DEFINE_integer("sequence_length", 30, "maximum length of a sequence")
 tf.flags.DEFINE_integer("max_checkpoints", 100, "Maximum number of "
                                                 "checkpoints to save.")
 tf.flags.DEFINE_integer("batch_size", 64, "Batch Size (default: 64)")
+tf.flags.DEFINE_integer("prefetch_depth", 0, "Number of training batches "
+                        "prepared in the background (default: 0, no "
+                        "prefetching)")
 tf.flags.DEFINE_integer("num_epochs", 300, "Number of training epochs"
                                            " (default: 200)")
 tf.flags.DEFINE_integer("evaluate_every", 300, "Evaluate model on dev set "
@@ -115,8 +119,11 @@ def train(dataset, metadata_path, w2v):
         avg_val_loss = 0.0
         prev_epoch = 0
         tflearn.is_training(True, session=sess)
-        while dataset.train.epochs_completed < FLAGS.num_epochs:
-            train_batch = dataset.train.next_batch(batch_size=FLAGS.batch_size,
+        train_data = Prefetcher(dataset.train, depth=FLAGS.prefetch_depth)
+        if siamese_model.restore_data_state(train_data):
+            prev_epoch = train_data.epochs_completed
+        while train_data.epochs_completed < FLAGS.num_epochs:
+            train_batch = train_data.next_batch(batch_size=FLAGS.batch_size,
                                    pad=0)
 
             sents_batch, lens = datasets.merge_sentences(train_batch,
@@ -128,7 +135,7 @@ def train(dataset, metadata_path, w2v):
                                                  sents_batch,
                                                  train_batch.sim,
                                                  lens,
-                                                 dataset.train.epochs_completed)
+                                                 train_data.epochs_completed)
 
             if step % FLAGS.evaluate_every == 0:
                 avg_val_loss, avg_val_pco, _ = evaluate(sess=sess,
@@ -137,26 +144,32 @@ def train(dataset, metadata_path, w2v):
 
             if step % FLAGS.checkpoint_every == 0:
                 validation_loss = maybe_save_checkpoint(sess,
-                     min_validation_loss, avg_val_loss, step, siamese_model)
+                     min_validation_loss, avg_val_loss, step, siamese_model,
+                     train_data)
                 if validation_loss is not None:
                     min_validation_loss = validation_loss
 
-            if dataset.train.epochs_completed != prev_epoch:
-                prev_epoch = dataset.train.epochs_completed
+            if train_data.epochs_completed != prev_epoch:
+                prev_epoch = train_data.epochs_completed
                 avg_test_loss, avg_test_pco, _ = evaluate(sess=sess,
                                      dataset=dataset.test, model=siamese_model,
                                      max_dev_itr=0, mode='test', step=step)
                 min_test_loss = maybe_save_checkpoint(sess,
-                        min_validation_loss, avg_val_loss, step, siamese_model)
+                        min_validation_loss, avg_val_loss, step, siamese_model,
+                        train_data)
 
+        train_data.close()
         dataset.train.close()
         dataset.validation.close()
         dataset.test.close()
 
 
-def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model):
+def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model,
+                          train_data=None):
     if val_loss <= min_validation_loss:
         model.saver.save(sess, model.checkpoint_prefix, global_step=step)
+        if train_data is not None:
+            model.save_data_state(step, train_data.state_dict())
         tf.train.write_graph(sess.graph.as_graph_def(), model.checkpoint_prefix,
                              "graph" + str(step) + ".pb", as_text=False)
         print("Saved model {} with avg_mse={} checkpoint"
@@ -6,6 +6,7 @@ import tensorflow as tf
 
 from datasets import Germeval
 from datasets import id2seq
+from datasets import Prefetcher
 from models import BLSTMGermEval
 from datasets import onehot2seq
 
@@ -28,11 +29,16 @@ tf.flags.DEFINE_string("optimizer", 'adam', "Which Optimizer to use. "
                     "adadelta, rmsprop")
 tf.flags.DEFINE_integer("learning_rate", 0.0001, "Learning Rate")
 tf.flags.DEFINE_integer("sequence_length", 50, "maximum length of a sequence")
+tf.flags.DEFINE_boolean("sparse_labels", True, "Feed the labels as class "
+                        "IDs instead of one-hot vectors")
 
 # Training parameters
 tf.flags.DEFINE_integer("max_checkpoints", 100, "Maximum number of "
                                                 "checkpoints to save.")
 tf.flags.DEFINE_integer("batch_size", 64, "Batch Size (default: 64)")
+tf.flags.DEFINE_integer("prefetch_depth", 0, "Number of training batches "
+                        "prepared in the background (default: 0, no "
+                        "prefetching)")
 tf.flags.DEFINE_integer("num_epochs", 300, "Number of training epochs"
                                            " (default: 200)")
 tf.flags.DEFINE_integer("evaluate_every", 100, "Evaluate model on dev set "
@@ -93,12 +99,16 @@ def train(dataset, metadata_path, w2v, n_classes):
         avg_val_loss = 0.0
         prev_epoch = 0
         tflearn.is_training(True, session=sess)
-        while dataset.train.epochs_completed < FLAGS.num_epochs:
-            train_batch = dataset.train.next_batch(batch_size=FLAGS.batch_size,
-                        pad=ner_model.args["sequence_length"], one_hot=True)
+        train_data = Prefetcher(dataset.train, depth=FLAGS.prefetch_depth)
+        if ner_model.restore_data_state(train_data):
+            prev_epoch = train_data.epochs_completed
+        while train_data.epochs_completed < FLAGS.num_epochs:
+            train_batch = train_data.next_batch(batch_size=FLAGS.batch_size,
+                        pad=ner_model.args["sequence_length"],
+                        one_hot=not ner_model.uses_sparse_labels())
             pred, loss, step, acc = ner_model.train_step(sess,
                                 train_batch.sentences, train_batch.ner1,
-                                    train_batch.lengths, dataset.train.epochs_completed)
+                                    train_batch.lengths, train_data.epochs_completed)
 
             if step % FLAGS.evaluate_every == 0:
                 avg_val_loss, avg_val_acc, _ = evaluate(sess=sess,
@@ -108,19 +118,27 @@ def train(dataset, metadata_path, w2v, n_classes):
 
             if step % FLAGS.checkpoint_every == 0:
                 min_validation_loss = maybe_save_checkpoint(sess,
-                    min_validation_loss, avg_val_loss, step, ner_model)
+                    min_validation_loss, avg_val_loss, step, ner_model,
+                    train_data)
 
-            if dataset.train.epochs_completed != prev_epoch:
-                prev_epoch = dataset.train.epochs_completed
+            if train_data.epochs_completed != prev_epoch:
+                prev_epoch = train_data.epochs_completed
                 avg_test_loss, avg_test_acc, _ = evaluate(
                             sess=sess, dataset=dataset.test, model=ner_model,
                             max_dev_itr=0, mode='test', step=step)
                 min_validation_loss = maybe_save_checkpoint(sess,
-                            min_validation_loss, avg_val_loss, step, ner_model)
+                            min_validation_loss, avg_val_loss, step, ner_model,
+                            train_data)
 
-def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model):
+        train_data.close()
+
+
+def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model,
+                          train_data=None):
     if val_loss <= min_validation_loss:
         model.saver.save(sess, model.checkpoint_prefix, global_step=step)
+        if train_data is not None:
+            model.save_data_state(step, train_data.state_dict())
         tf.train.write_graph(sess.graph.as_graph_def(), model.checkpoint_prefix,
                              "graph" + str(step) + ".pb", as_text=False)
         print("Saved model {} with avg_loss={} checkpoint"
@@ -151,14 +169,18 @@ def evaluate(sess, dataset, model, step, max_dev_itr=100, verbose=True,
             or mode in ['test', 'train']:
         val_batch = dataset.next_batch(FLAGS.batch_size,
                                        pad=model.args["sequence_length"],
-                                       one_hot=True, raw=False)
+                                       one_hot=not model.uses_sparse_labels(),
+                                       raw=False)
         loss, pred, acc = model.evaluate_step(sess, val_batch.sentences,
                                               val_batch.ner1, val_batch.lengths)
         avg_val_loss += loss
         avg_acc += acc
         all_dev_text += id2seq(val_batch.sentences, dataset.vocab_i2w[0])
         all_dev_pred += onehot2seq(pred, dataset.vocab_i2w[2])
-        all_dev_gt += onehot2seq(val_batch.ner1, dataset.vocab_i2w[2])
+        if model.uses_sparse_labels():
+            all_dev_gt += id2seq(val_batch.ner1, dataset.vocab_i2w[2])
+        else:
+            all_dev_gt += onehot2seq(val_batch.ner1, dataset.vocab_i2w[2])
         dev_itr += 1
 
         if mode == 'test' and dataset.epochs_completed == 1: break
@@ -13,6 +13,7 @@ from sklearn.metrics import mean_squared_error
 from datasets import AmazonReviewsGerman
 from datasets import HotelReviews
 from datasets import id2seq
+from datasets import Prefetcher
 from pyqt_fit import npr_methods
 from models import SentenceSentimentClassifier
 
@@ -40,11 +41,16 @@ tf.flags.DEFINE_integer("learning_rate", 0.0001, "Learning Rate")
 tf.flags.DEFINE_boolean("bidirectional", True, "Flag to have Bidirectional "
                                                "LSTMs")
 tf.flags.DEFINE_integer("sequence_length", 100, "maximum length of a sequence")
+tf.flags.DEFINE_boolean("sparse_labels", True, "Feed the labels as class "
+                        "IDs instead of one-hot vectors")
 
 # Training parameters
 tf.flags.DEFINE_integer("max_checkpoints", 100, "Maximum number of "
                                                 "checkpoints to save.")
 tf.flags.DEFINE_integer("batch_size", 64, "Batch Size (default: 64)")
+tf.flags.DEFINE_integer("prefetch_depth", 0, "Number of training batches "
+                        "prepared in the background (default: 0, no "
+                        "prefetching)")
 tf.flags.DEFINE_integer("num_epochs", 300, "Number of training epochs"
                                            " (default: 200)")
 tf.flags.DEFINE_integer("evaluate_every", 500, "Evaluate model on dev set "
@@ -98,9 +104,17 @@ def initialize_tf_graph(metadata_path, w2v):
     return sess, model
 
 
-def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model):
+def rating_labels(model):
+    # The `one_hot` of the batches: class IDs or one-hot vectors
+    return 'sparse' if model.uses_sparse_labels() else True
+
+
+def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model,
+                          train_data=None):
     if val_loss <= min_validation_loss:
         model.saver.save(sess, model.checkpoint_prefix, global_step=step)
+        if train_data is not None:
+            model.save_data_state(step, train_data.state_dict())
         tf.train.write_graph(sess.graph.as_graph_def(), model.checkpoint_prefix,
                              "graph" + str(step) + ".pb", as_text=False)
         print("Saved model {} with avg_loss={} checkpoint"
@@ -125,13 +139,17 @@ def train(dataset, metadata_path, w2v):
         avg_val_loss = 0.0
         prev_epoch = 0
         tflearn.is_training(True, session=sess)
-        while dataset.train.epochs_completed < FLAGS.num_epochs:
-            train_batch = dataset.train.next_batch(batch_size=FLAGS.batch_size,
-                                   pad=model.args["sequence_length"], one_hot=True)
+        train_data = Prefetcher(dataset.train, depth=FLAGS.prefetch_depth)
+        if model.restore_data_state(train_data):
+            prev_epoch = train_data.epochs_completed
+        while train_data.epochs_completed < FLAGS.num_epochs:
+            train_batch = train_data.next_batch(batch_size=FLAGS.batch_size,
+                                   pad=model.args["sequence_length"],
+                                   one_hot=rating_labels(model))
             accuracy, loss, step =  model.train_step(sess,
                                                  train_batch.text,
                                                  train_batch.ratings,
-                                                 dataset.train.epochs_completed)
+                                                 train_data.epochs_completed)
 
 
             if step % FLAGS.evaluate_every == 0:
@@ -141,18 +159,21 @@ def train(dataset, metadata_path, w2v):
 
             if step % FLAGS.checkpoint_every == 0:
                 validation_loss = maybe_save_checkpoint(sess,
-                     min_validation_loss, avg_val_loss, step, model)
+                     min_validation_loss, avg_val_loss, step, model,
+                     train_data)
                 if validation_loss is not None:
                     min_validation_loss = validation_loss
 
-            if dataset.train.epochs_completed != prev_epoch:
-                prev_epoch = dataset.train.epochs_completed
+            if train_data.epochs_completed != prev_epoch:
+                prev_epoch = train_data.epochs_completed
                 avg_test_loss, avg_test_accuracy, _ = evaluate(sess=sess,
                          dataset=dataset.test, model=model,
                          max_dev_itr=0, mode='test', step=step)
                 min_test_loss = maybe_save_checkpoint(sess,
-                        min_validation_loss, avg_val_loss, step, model)
+                        min_validation_loss, avg_val_loss, step, model,
+                        train_data)
 
+        train_data.close()
         dataset.train.close()
         dataset.validation.close()
         dataset.test.close()
@@ -178,7 +199,8 @@ def evaluate(sess, dataset, model, step, max_dev_itr=100, verbose=True,
     dev_itr = 0
     while (dev_itr < max_dev_itr and max_dev_itr != 0) \
                                     or mode in ['test', 'train']:
-        val_batch = dataset.next_batch(FLAGS.batch_size, one_hot=True,
+        val_batch = dataset.next_batch(FLAGS.batch_size,
+                                       one_hot=rating_labels(model),
                                        pad=model.args["sequence_length"])
         val_loss, val_accuracy, val_correct_preds, val_ratings = \
             model.evaluate_step(sess, val_batch.text, val_batch.ratings)
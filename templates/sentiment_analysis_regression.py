@@ -13,6 +13,7 @@ from sklearn.metrics import mean_squared_error
 from datasets import AmazonReviewsGerman
 from datasets import HotelReviews
 from datasets import id2seq
+from datasets import Prefetcher
 from pyqt_fit import npr_methods
 from models import SentenceSentimentRegressor
 
@@ -42,6 +43,9 @@ tf.flags.DEFINE_integer("sequence_length", 100, "maximum length of a sequence")
 tf.flags.DEFINE_integer("max_checkpoints", 100, "Maximum number of "
                                                 "checkpoints to save.")
 tf.flags.DEFINE_integer("batch_size", 64, "Batch Size (default: 64)")
+tf.flags.DEFINE_integer("prefetch_depth", 0, "Number of training batches "
+                        "prepared in the background (default: 0, no "
+                        "prefetching)")
 tf.flags.DEFINE_integer("num_epochs", 300, "Number of training epochs"
                                            " (default: 200)")
 tf.flags.DEFINE_integer("evaluate_every", 200, "Evaluate model on dev set "
@@ -110,13 +114,16 @@ def train(dataset, metadata_path, w2v):
         avg_val_loss = 0.0
         prev_epoch = 0
         tflearn.is_training(True, session=sess)
-        while dataset.train.epochs_completed < FLAGS.num_epochs:
-            train_batch = dataset.train.next_batch(batch_size=FLAGS.batch_size,
+        train_data = Prefetcher(dataset.train, depth=FLAGS.prefetch_depth)
+        if spr_model.restore_data_state(train_data):
+            prev_epoch = train_data.epochs_completed
+        while train_data.epochs_completed < FLAGS.num_epochs:
+            train_batch = train_data.next_batch(batch_size=FLAGS.batch_size,
                                rescale=[0.0, 1.0], pad=spr_model.args["sequence_length"])
             pco, mse, loss, step = spr_model.train_step(sess,
                                                  train_batch.text,
                                                  train_batch.ratings,
-                                                 dataset.train.epochs_completed)
+                                                 train_data.epochs_completed)
 
             if step % FLAGS.evaluate_every == 0:
                 avg_val_loss, avg_val_pco, _ = evaluate(sess=sess,
@@ -125,24 +132,30 @@ def train(dataset, metadata_path, w2v):
 
             if step % FLAGS.checkpoint_every == 0:
                 min_validation_loss = maybe_save_checkpoint(sess,
-                    min_validation_loss, avg_val_loss, step, spr_model)
+                    min_validation_loss, avg_val_loss, step, spr_model,
+                    train_data)
 
-            if dataset.train.epochs_completed != prev_epoch:
-                prev_epoch = dataset.train.epochs_completed
+            if train_data.epochs_completed != prev_epoch:
+                prev_epoch = train_data.epochs_completed
                 avg_test_loss, avg_test_pco, _ = evaluate(
                             sess=sess, dataset=dataset.test, model=spr_model,
                             max_dev_itr=0, mode='test', step=step)
                 min_validation_loss = maybe_save_checkpoint(sess,
-                            min_validation_loss, avg_val_loss, step, spr_model)
+                            min_validation_loss, avg_val_loss, step, spr_model,
+                            train_data)
 
+        train_data.close()
         dataset.train.close()
         dataset.validation.close()
         dataset.test.close()
 
 
-def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model):
+def maybe_save_checkpoint(sess, min_validation_loss, val_loss, step, model,
+                          train_data=None):
     if val_loss <= min_validation_loss:
         model.saver.save(sess, model.checkpoint_prefix, global_step=step)
+        if train_data is not None:
+            model.save_data_state(step, train_data.state_dict())
         tf.train.write_graph(sess.graph.as_graph_def(), model.checkpoint_prefix,
                              "graph" + str(step) + ".pb", as_text=False)
         print("Saved model {} with avg_mse={} checkpoint"
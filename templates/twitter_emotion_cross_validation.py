@@ -0,0 +1,96 @@
+import os
+import functools
+
+from datasets import TwitterEmotion
+from datasets import cross_validate
+
+# Hyper Params
+maxlen = 30
+
+# Convolution
+kernel_size = 5
+filters = 64
+pool_size = 4
+
+# LSTM
+lstm_output_size = 70
+
+# Training
+batch_size = 500
+epochs = 2
+
+# Number of folds trained at the same time (None: all of them)
+n_processes = None
+
+
+def train_fold(fold, w2v, n_classes, maxlen=maxlen, kernel_size=kernel_size,
+               filters=filters, pool_size=pool_size,
+               lstm_output_size=lstm_output_size, batch_size=batch_size,
+               epochs=epochs):
+    # Everything the fold needs comes in its arguments (bound with
+    # functools.partial), not from globals set under __main__, so that it
+    # also works when imported or run in a spawned process.
+    # Each fold runs in its own process, so Keras (and TensorFlow) are only
+    # set up there, with as many threads as CPUs the process is pinned to
+    import tensorflow as tf
+    from keras import backend as K
+    from keras.models import Sequential
+    from keras.layers import Dense
+    from keras.layers import Dropout
+    from keras.layers import Activation
+    from keras.layers import Embedding
+    from keras.layers import LSTM
+    from keras.layers import Conv1D
+    from keras.layers import MaxPooling1D
+
+    n_threads = len(os.sched_getaffinity(0))
+    K.set_session(tf.Session(config=tf.ConfigProto(
+                        intra_op_parallelism_threads=n_threads,
+                        inter_op_parallelism_threads=n_threads)))
+
+    model = Sequential()
+    model.add(Embedding(w2v.shape[0], w2v.shape[-1], input_length=maxlen,
+                        weights=[w2v]))
+    model.add(Dropout(0.25))
+    model.add(Conv1D(filters, kernel_size, padding='valid',
+                     activation='relu', strides=1))
+    model.add(MaxPooling1D(pool_size=pool_size))
+    model.add(LSTM(lstm_output_size))
+    model.add(Dense(n_classes))
+    model.add(Activation('sigmoid'))
+    model.compile(loss='sparse_categorical_crossentropy', optimizer='adam',
+                  metrics=['accuracy'])
+
+    model.fit(fold.train.text, fold.train.labels,
+              batch_size=batch_size, epochs=epochs, verbose=0,
+              validation_data=(fold.validation.text, fold.validation.labels))
+    test_loss, test_accuracy = model.evaluate(
+            fold.test.text, fold.test.labels, batch_size=batch_size,
+            verbose=0)
+    return {'test_loss': test_loss, 'test_accuracy': test_accuracy}
+
+
+if __name__ == '__main__':
+    te = TwitterEmotion()
+    te.create_vocabulary(min_frequency=2)
+
+    print('Encoding the folds...')
+    folds = te.encode_folds(pad=maxlen)
+
+    print('Training {} folds...'.format(len(folds)))
+    results = cross_validate(
+            functools.partial(train_fold, w2v=te.w2v, n_classes=te.n_classes,
+                              maxlen=maxlen, kernel_size=kernel_size,
+                              filters=filters, pool_size=pool_size,
+                              lstm_output_size=lstm_output_size,
+                              batch_size=batch_size, epochs=epochs),
+            folds, n_processes=n_processes)
+
+    for result in results['folds']:
+        print('Fold {}\t{:.1f}s\tTest Loss: {}\tTest Accuracy: {}'.format(
+                result['fold'], result['seconds'],
+                result['metrics']['test_loss'],
+                result['metrics']['test_accuracy']))
+    print('Test Accuracy: {:.4f} +- {:.4f}\tTotal time: {:.1f}s'.format(
+            results['mean']['test_accuracy'], results['std']['test_accuracy'],
+            results['seconds']))
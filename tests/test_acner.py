@@ -1,4 +1,6 @@
 import os
+from unittest import mock
+
 from nose.tools import *
 
 import datasets
@@ -110,3 +112,28 @@ def test_specific_sizes():
     assert_equal(validate_len, 10072)
     assert_equal(test_len, 33571)
 
+
+def test_warm_build():
+    ds = Acner(use_defaults=True)
+    key = ds.build_key(datasets.train_validate_split,
+                       datasets.test_split_small, True)
+    build = ds.find_build(key)
+    assert_is_not_none(build)
+    assert_equal(build['key'], key)
+
+    # The same splits, vocabularies and w2v files are loaded again, without
+    # tokenizing the source or looking up the vectors
+    with mock.patch.object(datasets, 'tokenize_batch',
+                           wraps=datasets.tokenize_batch) as tokenize_batch, \
+            mock.patch.object(datasets, 'new_vocabulary',
+                              wraps=datasets.new_vocabulary) as new_vocabulary, \
+            mock.patch.object(datasets, 'preload_w2v',
+                              wraps=datasets.preload_w2v) as preload_w2v:
+        warm = Acner(use_defaults=True)
+    assert_false(tokenize_batch.called)
+    assert_false(new_vocabulary.called)
+    assert_false(preload_w2v.called)
+    assert_equal([r[3] for r in warm.train.data],
+                 [str(r[3]) for r in ds.train.data])
+    assert_equal(warm.vocab_paths, ds.vocab_paths)
+    assert_equal(warm.w2v[0].shape, ds.w2v[0].shape)
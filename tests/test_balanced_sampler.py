@@ -0,0 +1,68 @@
+import numpy as np
+from nose.tools import *
+
+from datasets.balanced_sampler import BalancedSampler
+
+
+class TestBalancedSampler(object):
+    def setUp(self):
+        # 90 rows rated 5, 8 rated 3 and 2 rated 1
+        self.labels = np.array([5] * 90 + [3] * 8 + [1] * 2)
+
+    def test_balanced(self):
+        sampler = BalancedSampler(self.labels, seed=1)
+        assert_equal(sampler.epoch_size, 6)
+        indices, n_epochs = sampler.next_indices(3000)
+        assert_equal(n_epochs, 499)
+        counts = np.bincount(self.labels[indices], minlength=6)
+        for rating in [1, 3, 5]:
+            assert_true(abs(counts[rating] - 1000) < 100)
+        # The two rows rated 1 are used equally often
+        assert_equal(sorted(set(indices[self.labels[indices] == 1])),
+                     [98, 99])
+
+    def test_class_weights(self):
+        sampler = BalancedSampler(self.labels, {3: 1.0, 5: 3.0},
+                                  epoch_size=100, seed=1)
+        indices, n_epochs = sampler.next_indices(2000)
+        assert_equal(n_epochs, 19)
+        counts = np.bincount(self.labels[indices], minlength=6)
+        assert_equal(counts[1], 0)
+        assert_true(abs(counts[5] - 1500) < 100)
+
+    def test_rows_not_repeated_within_a_pass(self):
+        sampler = BalancedSampler(self.labels, {3: 1.0}, seed=1)
+        indices, _ = sampler.next_indices(8)
+        assert_equal(sorted(indices.tolist()), list(range(90, 98)))
+
+    def test_invalid_weights(self):
+        assert_raises(ValueError, BalancedSampler, self.labels, {2: 1.0})
+        assert_raises(ValueError, BalancedSampler, self.labels, {5: 0})
+
+    def test_state_dict(self):
+        sampler = BalancedSampler(self.labels, seed=1)
+        sampler.next_indices(10)
+        state = sampler.state_dict()
+        expected = sampler.next_indices(50)
+
+        resumed = BalancedSampler(self.labels, seed=2)
+        resumed.load_state_dict(state)
+        indices, n_epochs = resumed.next_indices(50)
+        assert_equal(indices.tolist(), expected[0].tolist())
+        assert_equal(n_epochs, expected[1])
+
+    def test_state_dict_across_shuffles(self):
+        sampler = BalancedSampler(self.labels, {1: 1.0, 3: 1.0}, seed=3)
+        sampler.next_indices(25)
+        state = sampler.state_dict()
+        assert_equal(sorted(state), ['draws', 'position', 'positions',
+                                     'seed', 'shuffles'])
+        assert_true(min(state['shuffles']) > 1)
+        expected = [sampler.next_indices(7)[0].tolist() for _ in range(5)]
+
+        resumed = BalancedSampler(self.labels, {1: 1.0, 3: 1.0})
+        resumed.load_state_dict(state)
+        assert_equal([resumed.next_indices(7)[0].tolist()
+                      for _ in range(5)], expected)
+        assert_raises(ValueError, BalancedSampler(self.labels).load_state_dict,
+                      state)
@@ -0,0 +1,56 @@
+import collections
+from nose.tools import *
+
+from datasets.bucketing import BucketSampler
+
+
+class InMemoryDataSet(object):
+    """
+    A split with examples of lengths 1, 2, ..., 20, 1, 2, ...
+    """
+    def __init__(self):
+        self.Batch = collections.namedtuple('Batch', ['x', 'y'])
+        self.position = 0
+        self.epochs_completed = 0
+
+    def next_batch(self, batch_size=64, pad=0):
+        x, y = [], []
+        for _ in range(batch_size):
+            length = self.position % 20 + 1
+            x.append(list(range(1, length + 1)))
+            y.append(length)
+            self.position += 1
+            self.epochs_completed = self.position // 20
+        return self.Batch(x=x, y=y)
+
+
+class TestBucketSampler(object):
+    def setUp(self):
+        self.sampler = BucketSampler(InMemoryDataSet(), [5, 10], ['x'],
+                                     batch_size=4, window=40, max_length=15,
+                                     seed=0)
+
+    def test_batches_padded_to_bucket(self):
+        for _ in range(20):
+            batch = self.sampler.next_batch()
+            assert_equal(batch.x.shape[0], 4)
+            assert_equal(batch.x.shape[1], min(max(batch.y), 15))
+            if max(batch.y) <= 5:
+                assert_true(min(batch.y) >= 1)
+            elif max(batch.y) <= 10:
+                assert_true(min(batch.y) > 5)
+            else:
+                assert_true(min(batch.y) > 10)
+            for row, length in zip(batch.x, batch.y):
+                assert_equal(row[:min(length, 15)].tolist(),
+                             list(range(1, min(length, 15) + 1)))
+                assert_equal(row[min(length, 15):].sum(), 0)
+
+    def test_stats(self):
+        for _ in range(10):
+            self.sampler.next_batch()
+        stats = self.sampler.stats()
+        assert_equal(stats['batches'], 10)
+        assert_equal(stats['examples'], 40)
+        assert_true(stats['efficiency'] > stats['fixed_efficiency'])
+        assert_true(stats['efficiency'] <= 1.0)
@@ -0,0 +1,51 @@
+import os
+import functools
+import numpy as np
+from nose.tools import *
+
+from datasets.cross_validation import EncodedFold
+from datasets.cross_validation import EncodedSplit
+from datasets.cross_validation import shared_array
+from datasets.cross_validation import cross_validate
+
+
+def train_fold(fold):
+    return {'mean_label': float(np.mean(fold.train.labels)),
+            'n_cpus': len(os.sched_getaffinity(0))}
+
+
+def scaled_train_fold(fold, scale):
+    return {'mean_label': scale * float(np.mean(fold.train.labels))}
+
+
+def make_fold(fold):
+    split = EncodedSplit(text=shared_array(np.zeros((4, 3), np.int32)),
+                         lengths=shared_array(np.full(4, 3, np.int32)),
+                         labels=shared_array(np.full(4, fold, np.int32)))
+    return EncodedFold(fold=fold, train=split, validation=split, test=split)
+
+
+class TestCrossValidation(object):
+    def test_shared_array(self):
+        array = np.arange(6, dtype=np.int32).reshape(2, 3)
+        shared = shared_array(array)
+        assert_equal(shared.tolist(), array.tolist())
+        assert_equal(shared.dtype, np.int32)
+
+    def test_cross_validate(self):
+        results = cross_validate(train_fold, [make_fold(i) for i in range(3)])
+        assert_equal([r['fold'] for r in results['folds']], [0, 1, 2])
+        assert_equal([r['metrics']['mean_label'] for r in results['folds']],
+                     [0.0, 1.0, 2.0])
+        assert_equal(results['mean']['mean_label'], 1.0)
+        n_cpus = len(os.sched_getaffinity(0))
+        if n_cpus >= 3:
+            assert_true(all(r['metrics']['n_cpus'] <= n_cpus // 3 + 1
+                            for r in results['folds']))
+
+    def test_options_through_partial(self):
+        results = cross_validate(functools.partial(scaled_train_fold,
+                                                   scale=10),
+                                 [make_fold(i) for i in range(2)])
+        assert_equal([r['metrics']['mean_label'] for r in results['folds']],
+                     [0.0, 10.0])
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+from nose.tools import *
+
+import datasets
+from datasets.entity_cache import EntityCache
+
+
+class TestEntityCache(object):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'entities')
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lru(self):
+        cache = EntityCache(capacity=2)
+        cache.put('en', ['john', 'ran'], [(0, 1, 'PERSON')])
+        cache.put('en', ['mary', 'ran'], [(0, 1, 'PERSON')])
+        assert_equal(cache.get('en', ['john', 'ran']), [(0, 1, 'PERSON')])
+        cache.put('en', ['it', 'ran'], [])
+        # 'mary ran' was the least recently used
+        assert_equal(cache.get('en', ['mary', 'ran']), None)
+        assert_equal(cache.get('en', ['it', 'ran']), [])
+        assert_equal(cache.get('de', ['it', 'ran']), None)
+        assert_equal(len(cache), 2)
+
+    def test_store(self):
+        cache = EntityCache(capacity=1, path=self.path)
+        cache.put('en', ['john', 'ran'], [(0, 1, 'PERSON')])
+        cache.put('en', ['it', 'ran'], [])
+        cache.close()
+
+        cache = EntityCache(capacity=1, path=self.path)
+        assert_equal(cache.get('en', ['john', 'ran']), [(0, 1, 'PERSON')])
+        cache.close()
+
+    def test_overlapping_entities(self):
+        cache = datasets.set_entity_cache()
+        line = ['Bank', 'of', 'New', 'York', 'Mellon', 'sued', 'Smith-Jones']
+        # 'New York' is nested in the first entity, and the last token is
+        # shared by two entities that end and start in its middle
+        cache.put('en', line, [(2, 4, 'GPE'), (0, 5, 'ORG'),
+                               (6, 7, 'PERSON'), (6, 7, 'ORG')])
+        assert_equal(datasets.entity_spans([line]),
+                     [[(0, 5, 'ORG'), (6, 7, 'PERSON')]])
+        assert_equal(datasets.mark_entities([line]),
+                     [['BOE', 'Bank', 'of', 'New', 'York', 'Mellon', 'ORG',
+                       'EOE', 'sued', 'BOE', 'Smith-Jones', 'PERSON',
+                       'EOE']])
+        datasets.set_entity_cache()
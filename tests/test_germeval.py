@@ -1,4 +1,6 @@
 import os
+from unittest import mock
+
 from nose.tools import *
 
 import datasets
@@ -101,3 +103,24 @@ def test_default_sizes():
     assert_equal(validate_len, 2200)
     assert_equal(test_len, 5100)
 
+
+def test_warm_build():
+    ds = Germeval(use_defaults=True)
+    key = ds.build_key()
+    build = ds.find_build(key)
+    assert_is_not_none(build)
+    assert_equal(build['key'], key)
+
+    # Nothing is tokenized or looked up again
+    with mock.patch.object(datasets, 'tokenize_batch',
+                           wraps=datasets.tokenize_batch) as tokenize_batch, \
+            mock.patch.object(datasets, 'new_vocabulary',
+                              wraps=datasets.new_vocabulary) as new_vocabulary, \
+            mock.patch.object(datasets, 'preload_w2v',
+                              wraps=datasets.preload_w2v) as preload_w2v:
+        warm = Germeval(use_defaults=True)
+    assert_false(tokenize_batch.called)
+    assert_false(new_vocabulary.called)
+    assert_false(preload_w2v.called)
+    assert_equal(len(warm.train.data), len(ds.train.data))
+    assert_equal(warm.vocab_paths, ds.vocab_paths)
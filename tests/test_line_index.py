@@ -0,0 +1,39 @@
+import os
+import time
+import shutil
+import tempfile
+from nose.tools import *
+
+from datasets.line_index import open_line_index
+
+
+class TestLineIndex(object):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'train.txt')
+        self.lines = ['first\tline\n', '\n', 'Straße\n', 'last']
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(''.join(self.lines))
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lines(self):
+        line_index = open_line_index(self.path)
+        assert_equal(len(line_index), 4)
+        assert_equal(line_index.line(2), 'Straße\n')
+        assert_equal(line_index.line(-1), 'last')
+        assert_equal(line_index.lines([3, 0, 1]),
+                     [self.lines[3], self.lines[0], self.lines[1]])
+        assert_raises(IndexError, line_index.line, 4)
+        line_index.close()
+
+    def test_refreshed(self):
+        open_line_index(self.path).close()
+        time.sleep(0.01)
+        with open(self.path, 'a') as f:
+            f.write('\nmore\n')
+        line_index = open_line_index(self.path)
+        assert_equal(len(line_index), 5)
+        assert_equal(line_index.line(4), 'more\n')
+        line_index.close()
@@ -0,0 +1,67 @@
+import collections
+from nose.tools import *
+
+from datasets.prefetch import Prefetcher
+
+
+class CountingDataSet(object):
+    """
+    A split of 10 examples, numbered from 0.
+    """
+    def __init__(self):
+        self.Batch = collections.namedtuple('Batch', ['x'])
+        self.position = 0
+        self.epochs_completed = 0
+
+    def next_batch(self, batch_size=64):
+        x = []
+        for _ in range(batch_size):
+            x.append(self.position % 10)
+            self.position += 1
+            self.epochs_completed = self.position // 10
+        return self.Batch(x=x)
+
+    def state_dict(self):
+        return {'position': self.position}
+
+    def load_state_dict(self, state):
+        self.position = state['position']
+        self.epochs_completed = self.position // 10
+
+
+class TestPrefetcher(object):
+    def test_same_batches_and_epochs(self):
+        expected = CountingDataSet()
+        prefetcher = Prefetcher(CountingDataSet(), depth=3, batch_size=4)
+        for _ in range(8):
+            batch = prefetcher.next_batch()
+            assert_equal(batch, expected.next_batch(batch_size=4))
+            assert_equal(prefetcher.epochs_completed,
+                         expected.epochs_completed)
+        prefetcher.close()
+        assert_equal(prefetcher.thread, None)
+
+    def test_arguments_of_first_call(self):
+        prefetcher = Prefetcher(CountingDataSet(), depth=2)
+        assert_equal(prefetcher.next_batch(batch_size=3).x, [0, 1, 2])
+        assert_equal(prefetcher.next_batch(batch_size=3).x, [3, 4, 5])
+        assert_raises(ValueError, prefetcher.next_batch, batch_size=4)
+        prefetcher.close()
+
+    def test_synchronous(self):
+        prefetcher = Prefetcher(CountingDataSet(), depth=0)
+        assert_equal(prefetcher.next_batch(batch_size=12).x[-1], 1)
+        assert_equal(prefetcher.epochs_completed, 1)
+        assert_equal(prefetcher.thread, None)
+
+    def test_state_of_last_batch(self):
+        prefetcher = Prefetcher(CountingDataSet(), depth=3, batch_size=4)
+        prefetcher.next_batch()
+        prefetcher.next_batch()
+        state = prefetcher.state_dict()
+        # The split is ahead, with the batches in the queue
+        assert_equal(state, {'position': 8})
+        prefetcher.load_state_dict(state)
+        assert_equal(prefetcher.next_batch().x, [8, 9, 0, 1])
+        assert_equal(prefetcher.epochs_completed, 1)
+        prefetcher.close()
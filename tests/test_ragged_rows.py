@@ -0,0 +1,80 @@
+import numpy as np
+from nose.tools import *
+
+from datasets.ragged_rows import RaggedRows
+
+
+def split_sequences(lines, tokenizer):
+    return [line.split() for line in lines]
+
+
+class TestRaggedRows(object):
+    def setUp(self):
+        self.w2i = {'PAD': 0, 'SEQ_BEGIN': 1, 'SEQ_END': 2, 'UNK': 3,
+                    'a': 4, 'b': 5, 'c': 6}
+        self.rows = RaggedRows([['a b c', 'x'], ['b', 'y'], ['c a d z', 'x']],
+                               split_sequences)
+
+    def test_sequences(self):
+        assert_equal(self.rows.sequences(0, [2, 0], 'split', self.w2i),
+                     [[6, 4, 3, 3], [4, 5, 6]])
+        padded = self.rows.sequences(0, [1, 2], 'split', self.w2i, pad=2)
+        assert_equal(padded.tolist(), [[5, 0], [6, 4]])
+        assert_equal(self.rows.lengths(0, [1, 2], 'split', self.w2i), [1, 4])
+        assert_equal(self.rows.lengths(0, [1, 2], 'split', self.w2i, pad=2),
+                     [1, 2])
+
+    def test_encoded_once(self):
+        tokens, offsets = self.rows.column(0, 'split', self.w2i)
+        assert_is(self.rows.column(0, 'split', self.w2i)[0], tokens)
+        assert_equal(offsets.tolist(), [0, 3, 4, 8])
+        self.rows.forget(0)
+        assert_is_not(self.rows.column(0, 'split', self.w2i)[0], tokens)
+
+    def test_next_indices(self):
+        indices, position, wrapped = self.rows.next_indices(0, 2)
+        assert_equal((indices.tolist(), position, wrapped), ([0, 1], 2, False))
+        indices, position, wrapped = self.rows.next_indices(position, 2)
+        assert_equal((len(indices), position, wrapped), (2, 1, True))
+        assert_equal(indices[0], 2)
+        assert_equal(sorted(self.rows.order.tolist()), [0, 1, 2])
+
+    def test_state_dict(self):
+        rows = RaggedRows(self.rows.rows, split_sequences, seed=1)
+        position = 0
+        for _ in range(2):
+            _, position, _ = rows.next_indices(position, 2)
+        state = rows.state_dict()
+        expected = [rows.next_indices(position, 2)[0].tolist()
+                    for _ in range(4)]
+
+        resumed = RaggedRows(self.rows.rows, split_sequences)
+        resumed.load_state_dict(state)
+        assert_equal([resumed.next_indices(position, 2)[0].tolist()
+                      for _ in range(4)], expected)
+
+    def test_state_dict_across_shuffles(self):
+        rows = RaggedRows(self.rows.rows, split_sequences)
+        position = 0
+        for _ in range(5):
+            _, position, _ = rows.next_indices(position, 2)
+        state = rows.state_dict()
+        assert_equal(state['shuffles'], 3)
+
+        expected = []
+        resumed_position = position
+        for _ in range(6):
+            indices, position, _ = rows.next_indices(position, 2)
+            expected.append(indices.tolist())
+
+        resumed = RaggedRows(self.rows.rows, split_sequences)
+        resumed.load_state_dict(state)
+        batches = []
+        for _ in range(6):
+            indices, resumed_position, _ = resumed.next_indices(
+                                                    resumed_position, 2)
+            batches.append(indices.tolist())
+        assert_equal(batches, expected)
+        assert_raises(ValueError, RaggedRows(self.rows.rows[:2],
+                                             split_sequences).load_state_dict,
+                      state)
@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from nose.tools import *
+
+from datasets.review_metadata import review_metadata
+
+
+def read_review(json_obj):
+    return {'text': json_obj['text'], 'titles': json_obj['title'],
+            'ratings': int(json_obj['rating'])}
+
+
+class TestReviewMetadata(object):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'train.txt')
+        reviews = [{'text': 'Sehr gut', 'title': 'Straße', 'rating': 5},
+                   {'text': '', 'title': 'empty', 'rating': '2'}]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(reviews[0]) + '\n')
+            f.write('not json\n')
+            f.write(json.dumps(reviews[1]) + '\n')
+            # Escaped differently than json.dumps would
+            f.write('{"text": "1\\/2", "title": "\\u00e4", "rating": 1}\n')
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def metadata(self):
+        return review_metadata(self.path, read_review,
+                               {'ratings': 'uint8'}, ['titles', 'text'])
+
+    def test_columns(self):
+        metadata = self.metadata()
+        assert_equal(len(metadata), 4)
+        assert_equal(metadata.column('ratings').tolist(), [5, 0, 2, 1])
+        assert_equal(metadata.valid_rows().tolist(), [0, 2, 3])
+        assert_equal(metadata.strings('titles', [2, 0]), ['empty', 'Straße'])
+        assert_equal(metadata.strings('text', [2, 3]), ['', '1/2'])
+        assert_equal(metadata.strings('titles', [3]), ['ä'])
+        assert_equal(metadata.reviews([0]),
+                     [{'text': 'Sehr gut', 'titles': 'Straße',
+                       'ratings': 5}])
+        metadata.close()
+
+    def test_text_not_copied(self):
+        metadata = self.metadata()
+        spans = metadata.column('titles_spans')
+        with open(self.path, 'rb') as f:
+            f.seek(int(spans[0][0]))
+            assert_equal(f.read(int(spans[0][1])),
+                         json.dumps('Straße').encode('utf-8'))
+        # Only the line of the text escaped as '\/' has to be decoded again
+        assert_true(metadata.column('text_spans')[3][1] < 0)
+        metadata.close()
+
+    def test_rebuilt(self):
+        self.metadata()
+        time.sleep(0.01)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'text': 'a', 'title': 'b', 'rating': 1}))
+        metadata = self.metadata()
+        assert_equal(metadata.column('ratings').tolist(), [5, 0, 2, 1, 1])
+
+    def test_unexpected_errors_raised(self):
+        def broken_read_review(json_obj):
+            raise TypeError('not a parse error')
+
+        assert_raises(TypeError, review_metadata, self.path,
+                      broken_read_review, {'ratings': 'uint8'},
+                      ['titles', 'text'])
+        # Nothing was kept from the interrupted build
+        assert_equal(len(self.metadata()), 4)
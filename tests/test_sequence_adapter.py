@@ -0,0 +1,43 @@
+import collections
+import numpy as np
+from nose.tools import *
+
+from datasets.keras import SequenceAdapter
+
+
+class FakeSplit(object):
+    Batch = collections.namedtuple('Batch', ['text', 'emotion'])
+
+    def __len__(self):
+        return 10
+
+    def get_many(self, indices, pad=0):
+        return self.Batch(text=[[i] * pad for i in indices],
+                          emotion=list(indices))
+
+
+class TestSequenceAdapter(object):
+    def test_batches(self):
+        sequence = SequenceAdapter(FakeSplit(), 4, 'text', 'emotion',
+                                   seed=1, pad=2)
+        assert_equal(len(sequence), 3)
+        x, y = sequence[2]
+        assert_equal(x.shape, (2, 2))
+        # The same batch every time it is requested
+        assert_equal(sequence[1][1].tolist(), sequence[1][1].tolist())
+        seen = np.concatenate([sequence[i][1] for i in range(3)])
+        assert_equal(sorted(seen.tolist()), list(range(10)))
+        assert_raises(IndexError, sequence.__getitem__, 3)
+
+    def test_reshuffled(self):
+        sequence = SequenceAdapter(FakeSplit(), 10, ['text'], 'emotion',
+                                   seed=1, pad=1)
+        first = sequence[0][1].tolist()
+        sequence.on_epoch_end()
+        assert_not_equal(sequence[0][1].tolist(), first)
+        assert_equal(len(sequence[0][0]), 1)
+
+    def test_not_shuffled(self):
+        sequence = SequenceAdapter(FakeSplit(), 5, 'text', 'emotion',
+                                   shuffle=False)
+        assert_equal(sequence[1][1].tolist(), [5, 6, 7, 8, 9])
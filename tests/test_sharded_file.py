@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+from nose.tools import *
+
+from datasets import shard_list
+from datasets.sharded_file import open_shard
+
+
+class TestShardedFile(object):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'train.txt')
+        self.lines = ['line {}\n'.format(i) for i in range(23)] + ['Straße']
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(''.join(self.lines))
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def read_all(self, datafile):
+        lines = []
+        row = datafile.readline()
+        while row != '':
+            lines.append(row)
+            row = datafile.readline()
+        return lines
+
+    def test_shards_cover_file(self):
+        lines = []
+        for shard_index in range(5):
+            shard = open_shard(self.path, shard_index, 5)
+            shard_lines = self.read_all(shard)
+            assert_true(len(shard_lines) > 0)
+            shard.seek(0)
+            assert_equal(self.read_all(shard), shard_lines)
+            shard.close()
+            lines += shard_lines
+        assert_equal(lines, self.lines)
+
+    def test_tell_and_seek(self):
+        shard = open_shard(self.path, 1, 3)
+        shard.readline()
+        offset = shard.tell()
+        rest = self.read_all(shard)
+        shard.seek(offset)
+        assert_equal(self.read_all(shard), rest)
+        assert_raises(ValueError, shard.seek, -1)
+        shard.close()
+
+    def test_invalid_shards(self):
+        assert_raises(ValueError, open_shard, self.path, 2, 2)
+        assert_raises(ValueError, open_shard, self.path, 0, 0)
+        # Most of the shards would start and end in the middle of a line
+        assert_raises(ValueError, open_shard, self.path, 1, 1000)
+
+    def test_shard_list(self):
+        data = list(range(10))
+        shards = [shard_list(data, i, 3) for i in range(3)]
+        assert_equal(sorted(sum(shards, [])), data)
+        assert_equal(shards[1], [1, 4, 7])
+        assert_true(shard_list(data, 0, 1) is data)
@@ -0,0 +1,35 @@
+from nose.tools import *
+
+import datasets
+
+
+class TestGetSpacy(object):
+    def setUp(self):
+        self.loaded = dict(datasets.spacy_pipelines)
+        datasets.spacy_pipelines.clear()
+
+    def teardown(self):
+        datasets.spacy_pipelines.clear()
+        datasets.spacy_pipelines.update(self.loaded)
+
+    def test_disabled_components_not_loaded(self):
+        for components, disabled in \
+                datasets.spacy_disabled_components.items():
+            # 'tokenizer' and 'vectors' would reuse the pipelines loaded
+            # before
+            datasets.spacy_pipelines.clear()
+            nlp = datasets.get_spacy('en', components)
+            pipe_names = datasets.spacy_pipe_names(nlp)
+            for name in disabled:
+                assert_not_in(name, pipe_names)
+
+    def test_ner_pipeline(self):
+        nlp = datasets.get_spacy('en', 'ner')
+        assert_equal(datasets.spacy_pipe_names(nlp), ['ner'])
+        doc = nlp('Angela Merkel visited Paris.')
+        assert_true(len(doc.ents) > 0)
+
+    def test_same_pipeline_reused(self):
+        nlp = datasets.get_spacy('en', 'ner')
+        assert_is(datasets.get_spacy('en', 'ner'), nlp)
+        assert_raises(ValueError, datasets.get_spacy, 'en', 'tagger')
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from nose.tools import *
+
+from datasets.sts import DataSet
+from datasets.sts_pairs import write_sts_pairs
+
+
+class TestSTSPairs(object):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'train.txt')
+        with open(path, 'w') as f:
+            f.write('how are you\twho are you\t0.5\n')
+            f.write('who are you\thow are you\t0.25\n')
+            f.write('how are you\tyou\t1.0\n')
+        w2i = {'PAD': 0, 'SEQ_BEGIN': 1, 'SEQ_END': 2, 'UNK': 3,
+               'how': 4, 'are': 5, 'you': 6}
+        self.split = DataSet(path, (w2i, {i: w for w, i in w2i.items()}))
+        write_sts_pairs(self.split, self.split.pairs_path)
+        self.pairs = self.split.open_pairs()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sentences_stored_once(self):
+        assert_equal(len(self.pairs), 3)
+        assert_equal(self.pairs.meta['n_sentences'], 3)
+        assert_equal(self.pairs.arrays['s1_idx'].tolist(), [0, 1, 0])
+        assert_equal(self.pairs.arrays['s2_idx'].tolist(), [1, 0, 2])
+
+    def test_next_batch(self):
+        batch = self.pairs.next_batch(batch_size=2, pad=4)
+        assert_equal(batch.s1.tolist(), [[4, 5, 6, 0], [3, 5, 6, 0]])
+        assert_equal(batch.s2.tolist(), [[3, 5, 6, 0], [4, 5, 6, 0]])
+        assert_equal(batch.sim.tolist(), [0.5, 0.25])
+        assert_equal(batch.s1_lengths.tolist(), [3, 3])
+
+        batch = self.pairs.next_batch(batch_size=2, seq_begin=True)
+        assert_equal(batch.s2.tolist(), [[1, 6, 0, 0], [1, 3, 5, 6]])
+        assert_equal(self.pairs.epochs_completed, 1)
+
+    def test_unique_batch(self):
+        batch = self.pairs.next_batch(batch_size=3, pad=3, unique=True)
+        assert_equal(batch.sentences.tolist(),
+                     [[4, 5, 6], [3, 5, 6], [6, 0, 0]])
+        assert_equal(batch.lengths.tolist(), [3, 3, 1])
+        assert_equal(batch.s1_idx.tolist(), [0, 1, 0])
+        assert_equal(batch.s2_idx.tolist(), [1, 0, 2])
+
+    def test_out_of_date(self):
+        with open(self.split.path, 'a') as f:
+            f.write('you\tyou\t1.0\n')
+        assert_raises(ValueError, self.split.open_pairs)
+
+    def test_resume_text_split(self):
+        self.split.open()
+        self.split.next_batch(batch_size=4)
+        state = self.split.state_dict()
+        expected = self.split.next_batch(batch_size=2)
+        self.split.close()
+
+        self.split.load_state_dict(state)
+        self.split.open()
+        assert_equal(self.split.next_batch(batch_size=2), expected)
+        assert_equal(self.split.epochs_completed, 1)
+        self.split.close()
+
+        self.pairs.next_batch(batch_size=2)
+        state = self.pairs.state_dict()
+        pairs = self.split.open_pairs()
+        pairs.load_state_dict(state)
+        assert_equal(pairs.next_batch(batch_size=1).sim.tolist(), [1.0])
@@ -0,0 +1,62 @@
+import collections
+import numpy as np
+import tensorflow as tf
+from nose.tools import *
+from nose.plugins.skip import SkipTest
+
+from datasets.tf_data import batch_arrays, as_tf_dataset, batch_inputs, \
+    has_tf_data
+
+
+class FakeSplit(object):
+    Batch = collections.namedtuple('Batch', ['text', 'sim', 'lengths'])
+
+    def __init__(self):
+        self.n_batches = 0
+
+    def next_batch(self, batch_size=2, pad=0):
+        self.n_batches += 1
+        text = [[1, 2, 3], [4]]
+        if pad > 0:
+            text = [t + [0] * (pad - len(t)) for t in text]
+        return self.Batch(text=text, sim=[0.5, 1.0], lengths=[3, 1])
+
+
+class TestTfData(object):
+    def test_batch_arrays(self):
+        arrays = batch_arrays(FakeSplit().next_batch(pad=3),
+                              ['text', 'sim'])
+        assert_equal(arrays[0].dtype, np.int32)
+        assert_equal(arrays[0].shape, (2, 3))
+        assert_equal(arrays[1].dtype, np.float32)
+
+    def test_ragged_field(self):
+        assert_raises(ValueError, batch_arrays, FakeSplit().next_batch(),
+                      ['text'])
+
+    def test_dataset(self):
+        if not has_tf_data():
+            raise SkipTest('tf.data needs TensorFlow 1.4')
+        split = FakeSplit()
+        dataset = as_tf_dataset(split, fields=['text', 'lengths'], pad=4)
+        assert_equal(split.n_batches, 1)
+        assert_equal(sorted(dataset.output_types), ['lengths', 'text'])
+        assert_equal(dataset.output_shapes['text'].as_list(), [None, None])
+
+    def test_batch_inputs(self):
+        with tf.Graph().as_default():
+            split = FakeSplit()
+            inputs = batch_inputs(split, fields=['text', 'lengths'], pad=4)
+            assert_equal(split.n_batches, 1)
+            assert_equal(sorted(inputs), ['lengths', 'text'])
+            assert_equal(inputs['text'].get_shape().as_list(), [None, None])
+            with tf.Session() as sess:
+                coordinator = tf.train.Coordinator()
+                threads = tf.train.start_queue_runners(sess, coordinator)
+                for _ in range(3):
+                    batch = sess.run(inputs)
+                    assert_equal(batch['text'].tolist(),
+                                 [[1, 2, 3, 0], [4, 0, 0, 0]])
+                    assert_equal(batch['lengths'].tolist(), [3, 1])
+                coordinator.request_stop()
+                coordinator.join(threads)
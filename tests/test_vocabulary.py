@@ -0,0 +1,56 @@
+import os
+import pickle
+import shutil
+import tempfile
+from nose.tools import *
+
+from datasets.vocabulary import open_vocabulary
+
+
+class TestVocabulary(object):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.vocab_path = os.path.join(self.dir, 'vocab.txt')
+        with open(self.vocab_path, 'w') as vf:
+            for term in ['PAD', 'SEQ_BEGIN', 'SEQ_END', 'UNK', 'the', 'dog',
+                         'the', 'Straße']:
+                vf.write('{}\t1\n'.format(term))
+        self.vocab = open_vocabulary(self.vocab_path)
+
+    def teardown(self):
+        self.vocab.close()
+        shutil.rmtree(self.dir)
+
+    def test_views(self):
+        # Repeated terms keep their first ID, like the old dicts
+        assert_equal(len(self.vocab.w2i), 7)
+        assert_equal(len(self.vocab.i2w), 7)
+        assert_equal(self.vocab.w2i['dog'], 5)
+        assert_equal(self.vocab.w2i['Straße'], 6)
+        assert_equal(self.vocab.i2w[6], 'Straße')
+        assert_true('the' in self.vocab.w2i)
+        assert_false('cat' in self.vocab.w2i)
+        assert_true(3 in self.vocab.i2w)
+        assert_false(7 in self.vocab.i2w)
+        assert_equal(list(self.vocab.w2i)[:4],
+                     ['PAD', 'SEQ_BEGIN', 'SEQ_END', 'UNK'])
+
+    def test_encode(self):
+        ids = self.vocab.encode(['the', 'cat', 'dog', 'the'])
+        assert_equal(ids.dtype.name, 'int32')
+        assert_equal(ids.tolist(), [4, 3, 5, 4])
+        assert_raises(KeyError, self.vocab.encode, ['the', 'cat'], -1)
+        assert_equal(self.vocab.encode([]).tolist(), [])
+
+    def test_cached_and_refreshed(self):
+        assert_true(os.path.exists(os.path.join(self.dir, 'vocab.bin')))
+        with open(self.vocab_path, 'a') as vf:
+            vf.write('cat\t1\n')
+        vocab = open_vocabulary(self.vocab_path)
+        assert_equal(vocab.w2i['cat'], 7)
+        vocab.close()
+
+    def test_pickle(self):
+        vocab = pickle.loads(pickle.dumps(self.vocab))
+        assert_equal(vocab.w2i['dog'], 5)
+        vocab.close()
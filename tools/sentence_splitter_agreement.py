@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import datasets
+
+
+# Field holding the text of each review, for each dataset
+text_fields = {'hotel_reviews': 'text', 'amazon_reviews_de': 'review_text'}
+
+
+def main(args):
+    dataset_path = os.path.join(args.path, args.dataset, 'train', 'train.txt')
+    with open(dataset_path, 'r') as f:
+        rows = f.read().splitlines()
+
+    random.seed(args.seed)
+    sample = random.sample(rows, min(args.sample_size, len(rows)))
+    lines = [json.loads(row)[text_fields[args.dataset]] for row in sample]
+
+    report = datasets.sentence_splitter_agreement(lines,
+                                                  args.sentence_splitter)
+    print('Compared the sentences of {} reviews from {}'.format(
+          report['lines'], dataset_path))
+    print('{} found {} sentences, the parser {}'.format(
+          args.sentence_splitter, report['sentences'],
+          report['parser_sentences']))
+    print('Reviews split exactly like the parser: {:.2%}'.format(
+          report['exact']))
+    print('Boundaries:\tPrecision: {:.4f}\tRecall: {:.4f}\tF1: {:.4f}'.format(
+          report['precision'], report['recall'], report['f1']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--dataset',
+                        help='Which dataset to sample reviews from. (Possible values: amazon_reviews_de, hotel_reviews')
+    parser.add_argument('--path', help='Path to the dataset.', default='/scratch/OSA/data/datasets/')
+    parser.add_argument('--sentence-splitter', help='Sentence splitter to compare with the parser.', default='rules')
+    parser.add_argument('--sample-size', type=int, help='Number of reviews to compare.', default=1000)
+    parser.add_argument('--seed', type=int, help='Seed used to sample the reviews.', default=0)
+
+    args = parser.parse_args()
+
+    if args.dataset not in text_fields:
+        raise NotImplementedError('Dataset {} has not been '
+                                  'implemented yet'.format(args.dataset))
+
+    main(args)
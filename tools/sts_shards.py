@@ -0,0 +1,54 @@
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import datasets
+from datasets.sts_shards import write_sts_shards
+from datasets.sts_pairs import write_sts_pairs
+
+
+# Dataset class for each of the datasets that share `datasets/sts.py`
+sts_datasets = {'sts_small': datasets.STS, 'sts_large': datasets.STSLarge,
+                'quora': datasets.Quora, 'ppdb': datasets.PPDB,
+                'mspd': datasets.MSPD, 'sick': datasets.Sick,
+                'semEval': datasets.SemEval,
+                'stack_exchange': datasets.StackExchange}
+
+
+def main(args):
+    dataset = sts_datasets[args.dataset]()
+    for name in args.splits.split(','):
+        split = getattr(dataset, name)
+        if args.pairs:
+            print('Converting {} to {}'.format(split.path, split.pairs_path))
+            write_sts_pairs(split, split.pairs_path, args.keep_entities)
+            pairs = split.open_pairs()
+            print('Wrote {} pairs with {} distinct sentences'.format(
+                  len(pairs), pairs.meta['n_sentences']))
+            continue
+        print('Converting {} to {}'.format(split.path, split.shards_path))
+        write_sts_shards(split, split.shards_path, args.rows_per_shard,
+                         args.keep_entities)
+        shards = split.open_shards()
+        print('Wrote {} pairs in {} shards'.format(
+              len(shards), shards.meta['n_shards']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--dataset', default='sts_small',
+                        help='Which dataset to convert. (Possible values: {})'.format(', '.join(sorted(sts_datasets))))
+    parser.add_argument('--splits', help='Comma-separated splits to convert.', default='train,validation,test')
+    parser.add_argument('--rows-per-shard', type=int, help='Number of sentence pairs in each shard.', default=100000)
+    parser.add_argument('--pairs', action='store_true', help='Store each distinct sentence once and the pairs as indices into them, instead of shards.')
+    parser.add_argument('--keep-entities', action='store_true', help='Keep the entity markers in the sentences.')
+
+    args = parser.parse_args()
+
+    if args.dataset not in sts_datasets:
+        raise NotImplementedError('Dataset {} has not been '
+                                  'implemented yet'.format(args.dataset))
+
+    main(args)